@@ -0,0 +1,81 @@
+# Benchmark command line
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+from benchmarks.events import EventGenerator
+from benchmarks.suite import run_suite
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Measure message ingest and query performance on synthetic data"
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10 ** 5, 10 ** 6, 10 ** 7],
+                        help="Stored row counts to measure at (default: 10^5 10^6 10^7)")
+    parser.add_argument("--ingest-count", type=int, default=10000, help="Events fed through the bot at each size")
+    parser.add_argument("--rate", type=float, default=0, help="Events per second to feed (default: as fast as possible)")
+    parser.add_argument("--workers", type=int, default=4, help="Ingest worker tasks")
+    parser.add_argument("--groups", type=int, default=20, help="Number of groups")
+    parser.add_argument("--senders", type=int, default=5000, help="Number of distinct senders")
+    parser.add_argument("--group-skew", type=float, default=0.8, help="Zipf exponent of group activity (0 is uniform)")
+    parser.add_argument("--sender-skew", type=float, default=1.1, help="Zipf exponent of sender activity (0 is uniform)")
+    parser.add_argument("--media-ratio", type=float, default=0.1, help="Fraction of messages with media")
+    parser.add_argument("--entity-ratio", type=float, default=0.5,
+                        help="Fraction of events carrying chat and sender entities")
+    parser.add_argument("--fetch-delay", type=float, default=0,
+                        help="Simulated seconds per entity fetch on a cache miss")
+    parser.add_argument("--span-hours", type=float, default=24, help="Hours the filled messages are spread over")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs of each timed query")
+    parser.add_argument("--no-fts", action="store_true", help="Benchmark without the full-text search index")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the generated data")
+    parser.add_argument("--workdir", help="Directory for the database (default: a temporary directory, removed afterwards)")
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    # Per-message errors would flood the output; the results count them instead
+    logging.disable(logging.ERROR)
+
+    generator = EventGenerator(
+        groups=args.groups,
+        senders=args.senders,
+        group_skew=args.group_skew,
+        sender_skew=args.sender_skew,
+        media_ratio=args.media_ratio,
+        entity_ratio=args.entity_ratio,
+        fetch_delay=args.fetch_delay,
+        seed=args.seed
+    )
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="telegram-monitor-bench-")
+    try:
+        results = asyncio.run(run_suite(
+            workdir,
+            generator,
+            args.sizes,
+            ingest_count=args.ingest_count,
+            rate=args.rate,
+            workers=args.workers,
+            repeat=args.repeat,
+            span=args.span_hours * 60 * 60,
+            fts=not args.no_fts
+        ))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# Synthetic Telethon events for benchmarks
+import asyncio
+import itertools
+import random
+from datetime import datetime, timezone
+from typing import Dict, Any, Iterator, List, Optional
+
+# Marked peer ids of channels are -(CHANNEL_OFFSET + channel id)
+CHANNEL_OFFSET = 10 ** 12
+
+class FakeChat:
+    """Stand-in for a Telethon channel entity"""
+
+    def __init__(self, chat_id: int, title: str):
+        self.id = chat_id
+        self.title = title
+
+class FakeSender:
+    """Stand-in for a Telethon user entity"""
+
+    def __init__(self, user_id: int, username: Optional[str]):
+        self.id = user_id
+        self.username = username
+        self.first_name = f"User {user_id}"
+
+class FakeMessage:
+    """Stand-in for a Telethon message with the fields the bot reads"""
+
+    def __init__(self, message_id: int, sender_id: int, text: str, date: datetime, media: bool):
+        self.id = message_id
+        self.sender_id = sender_id
+        self.message = text
+        self.date = date
+        self.media = object() if media else None
+
+class FakeEvent:
+    """Stand-in for a ``events.NewMessage.Event``
+
+    ``chat`` and ``sender`` are None when the update carried no entities, in
+    which case the bot falls back to its cache and then to ``get_chat`` /
+    ``get_sender``, which answer after ``fetch_delay`` seconds instead of
+    going to the network.
+    """
+
+    def __init__(
+        self,
+        chat_id: int,
+        message: FakeMessage,
+        chat: FakeChat,
+        sender: FakeSender,
+        with_entities: bool,
+        fetch_delay: float = 0
+    ):
+        self.chat_id = chat_id
+        self.message = message
+        self.chat = chat if with_entities else None
+        self.sender = sender if with_entities else None
+        self._chat = chat
+        self._sender = sender
+        self.fetch_delay = fetch_delay
+        self.created_at = None  # set by the benchmark when the event is handed to the bot
+
+    async def get_chat(self) -> FakeChat:
+        if self.fetch_delay:
+            await asyncio.sleep(self.fetch_delay)
+        return self._chat
+
+    async def get_sender(self) -> FakeSender:
+        if self.fetch_delay:
+            await asyncio.sleep(self.fetch_delay)
+        return self._sender
+
+class EventGenerator:
+    """Reproducible stream of messages across groups and senders
+
+    Groups and senders are drawn from Zipf-like distributions (weight of the
+    k-th most active is 1 / k**skew; a skew of 0 is uniform), so a few
+    groups and senders produce most of the traffic as in real chats. A
+    ``media_ratio`` fraction of messages has media, and ``entity_ratio`` of
+    the events carry their chat and sender entities. Message ids increase
+    per group, so generated messages never collide with each other.
+    """
+
+    def __init__(
+        self,
+        groups: int = 20,
+        senders: int = 5000,
+        group_skew: float = 0.8,
+        sender_skew: float = 1.1,
+        media_ratio: float = 0.1,
+        entity_ratio: float = 0.5,
+        words: int = 12,
+        fetch_delay: float = 0,
+        seed: int = 0
+    ):
+        self.random = random.Random(seed)
+        self.media_ratio = media_ratio
+        self.entity_ratio = entity_ratio
+        self.words = max(1, words)
+        self.fetch_delay = fetch_delay
+
+        self.chats = [FakeChat(1000 + i, f"Benchmark group {i}") for i in range(max(1, groups))]
+        self.senders = [
+            FakeSender(5000000 + i, f"user{i}" if i % 3 else None)
+            for i in range(max(1, senders))
+        ]
+        self._group_weights = _cumulative_weights(len(self.chats), group_skew)
+        self._sender_weights = _cumulative_weights(len(self.senders), sender_skew)
+        self._vocabulary = [
+            "".join(self.random.choices("abcdefghijklmnopqrstuvwxyz", k=self.random.randint(2, 9)))
+            for _ in range(2000)
+        ]
+        self._next_ids = {chat.id: 1 for chat in self.chats}
+
+    def resume(self, last_ids: Dict[int, int]) -> None:
+        """Continue after the highest message ids already stored, per group id"""
+        for chat_id, last_id in last_ids.items():
+            if chat_id in self._next_ids:
+                self._next_ids[chat_id] = max(self._next_ids[chat_id], last_id + 1)
+
+    def _draw(self, count: int) -> Iterator[tuple]:
+        """(chat, sender, message_id, text, has_media) for count messages"""
+        chats = self.random.choices(self.chats, cum_weights=self._group_weights, k=count)
+        senders = self.random.choices(self.senders, cum_weights=self._sender_weights, k=count)
+        for chat, sender in zip(chats, senders):
+            message_id = self._next_ids[chat.id]
+            self._next_ids[chat.id] = message_id + 1
+            text = " ".join(self.random.choices(self._vocabulary, k=self.random.randint(1, 2 * self.words)))
+            yield chat, sender, message_id, text, self.random.random() < self.media_ratio
+
+    def records(self, count: int, start: float, end: float) -> Iterator[Dict[str, Any]]:
+        """store_messages arguments for count messages sent evenly between two epochs"""
+        step = (end - start) / max(1, count)
+        for i, (chat, sender, message_id, text, has_media) in enumerate(self._draw(count)):
+            yield {
+                "group_id": chat.id,
+                "group_name": chat.title,
+                "sender_id": sender.id,
+                "sender_name": sender.username or sender.first_name,
+                "message_id": message_id,
+                "content": text,
+                "timestamp": datetime.fromtimestamp(start + i * step, timezone.utc),
+                "has_media": has_media
+            }
+
+    def events(self, count: int) -> Iterator[FakeEvent]:
+        """count NewMessage events, dated when they are generated"""
+        for chat, sender, message_id, text, has_media in self._draw(count):
+            message = FakeMessage(message_id, sender.id, text, datetime.now(timezone.utc), has_media)
+            yield FakeEvent(
+                -(CHANNEL_OFFSET + chat.id),
+                message,
+                chat,
+                sender,
+                self.random.random() < self.entity_ratio,
+                self.fetch_delay
+            )
+
+def _cumulative_weights(count: int, skew: float) -> List[float]:
+    return list(itertools.accumulate(1 / (k ** skew) for k in range(1, count + 1)))
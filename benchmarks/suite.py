@@ -0,0 +1,195 @@
+# Ingest and query benchmarks against a real SQLite database
+import asyncio
+import os
+import platform
+import sqlite3
+import statistics
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+
+from benchmarks.events import EventGenerator
+from database.storage import Storage, get_storage
+from telegram_bot.bot import TelegramMonitor
+from utils.metrics import metrics
+from utils.summarizer import generate_summary
+
+# Rows handed to store_messages at a time while filling the database
+FILL_CHUNK = 10000
+
+async def run_suite(
+    workdir: str,
+    generator: EventGenerator,
+    sizes: List[int],
+    ingest_count: int = 10000,
+    rate: float = 0,
+    workers: int = 4,
+    repeat: int = 5,
+    span: float = 24 * 60 * 60,
+    fts: bool = True
+) -> Dict[str, Any]:
+    """Grow the database to each size in turn and measure it there
+
+    At every size the database is first filled through ``store_messages``
+    (sent times spread over the last ``span`` seconds), then the last
+    ``ingest_count`` messages go through ``TelegramMonitor._process_message``
+    via the ingest queue, and finally the read paths are timed.
+    """
+    storage = get_storage(db_path=os.path.join(workdir, "benchmark.db"), batch_writes=True, fts=fts)
+    monitor = TelegramMonitor(
+        os.path.join(workdir, "benchmark"),
+        0,
+        "",
+        "",
+        [],
+        storage,
+        persist_entities=False,
+        ingest_workers=workers,
+        backfill_on_start=False
+    )
+    generator.resume(await storage.get_last_message_ids())
+
+    results = []
+    try:
+        for size in sorted(sizes):
+            rows = (await storage.get_stats())["total_messages"]
+            fill = max(0, size - rows - ingest_count)
+            fill_seconds = await _fill(storage, generator, fill, span)
+            ingest = await _measure_ingest(monitor, generator, ingest_count, rate)
+            stats = await storage.get_stats()
+            results.append({
+                "rows": stats["total_messages"],
+                "fill": {
+                    "messages": fill,
+                    "seconds": round(fill_seconds, 3),
+                    "messages_per_second": round(fill / fill_seconds, 1) if fill_seconds else None
+                },
+                "ingest": ingest,
+                "queries": await _measure_queries(storage, generator.chats[0].id, repeat),
+                "database_bytes": _database_bytes(storage.db_path)
+            })
+    finally:
+        await storage.close()
+
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "config": {
+            "groups": len(generator.chats),
+            "senders": len(generator.senders),
+            "media_ratio": generator.media_ratio,
+            "entity_ratio": generator.entity_ratio,
+            "ingest_count": ingest_count,
+            "rate": rate,
+            "workers": workers,
+            "repeat": repeat,
+            "span_seconds": span,
+            "fts": fts
+        },
+        "results": results
+    }
+
+async def _fill(storage: Storage, generator: EventGenerator, count: int, span: float) -> float:
+    """Store count messages in chunks; returns the seconds taken"""
+    now = time.time()
+    records = generator.records(count, now - span, now)
+    started = time.perf_counter()
+    for _ in range(0, count, FILL_CHUNK):
+        chunk = [record for _, record in zip(range(FILL_CHUNK), records)]
+        await storage.store_messages(chunk)
+        # Waiting for each chunk keeps the write queue, and memory, bounded
+        await storage.flush()
+    return time.perf_counter() - started
+
+async def _measure_ingest(monitor: TelegramMonitor, generator: EventGenerator, count: int, rate: float) -> Dict[str, Any]:
+    """Feed count events through the ingest queue, at rate per second if set
+
+    Latency runs from handing an event to the queue until ``_process_message``
+    returns; the total time also covers the final flush to disk.
+    """
+    latencies = []
+    process = monitor._process_message
+
+    async def timed(event):
+        await process(event)
+        latencies.append(time.perf_counter() - event.created_at)
+
+    stages = metrics.snapshot()
+    errors = metrics.errors["process_message"]
+    monitor.ingest.process = timed
+    monitor.ingest.start()
+    started = time.perf_counter()
+    try:
+        for i, event in enumerate(generator.events(count)):
+            if rate:
+                delay = started + i / rate - time.perf_counter()
+                if delay > 0.001:
+                    await asyncio.sleep(delay)
+            event.created_at = time.perf_counter()
+            await monitor.ingest.put(event)
+        await monitor.ingest.stop(timeout=None)
+        await monitor.storage.flush()
+    finally:
+        monitor.ingest.process = process
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "messages": count,
+        "seconds": round(elapsed, 3),
+        "messages_per_second": round(count / elapsed, 1) if elapsed else None,
+        "latency_ms": {
+            "p50": _percentile_ms(latencies, 0.50),
+            "p99": _percentile_ms(latencies, 0.99),
+            "max": _percentile_ms(latencies, 1.0)
+        },
+        "failed": metrics.errors["process_message"] - errors,
+        "stage_mean_ms": _stage_means(stages, metrics.snapshot())
+    }
+
+async def _measure_queries(storage: Storage, busiest: int, repeat: int) -> Dict[str, Dict[str, float]]:
+    """Time the read paths behind /status, the webhook summary and get_messages
+
+    Storage is called directly, so the bot's response caches are not involved.
+    """
+    queries = {
+        "get_stats": storage.get_stats,
+        "generate_summary": lambda: generate_summary(storage),
+        "get_messages": lambda: storage.get_messages(limit=100),
+        "get_messages_group": lambda: storage.get_messages(group_id=busiest, limit=100)
+    }
+
+    timings = {}
+    for name, query in queries.items():
+        samples = []
+        for _ in range(max(1, repeat)):
+            started = time.perf_counter()
+            await query()
+            samples.append(time.perf_counter() - started)
+        timings[name] = {
+            "min_ms": round(min(samples) * 1000, 3),
+            "median_ms": round(statistics.median(samples) * 1000, 3),
+            "max_ms": round(max(samples) * 1000, 3)
+        }
+    return timings
+
+def _stage_means(before: Dict[str, tuple], after: Dict[str, tuple]) -> Dict[str, float]:
+    means = {}
+    for stage, (count, total) in after.items():
+        previous_count, previous_total = before.get(stage, (0, 0.0))
+        if count > previous_count:
+            means[stage] = round((total - previous_total) / (count - previous_count) * 1000, 4)
+    return means
+
+def _percentile_ms(ordered: List[float], fraction: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return round(ordered[int(fraction * (len(ordered) - 1))] * 1000, 3)
+
+def _database_bytes(db_path: str) -> int:
+    return sum(
+        os.path.getsize(path)
+        for path in (db_path, db_path + "-wal")
+        if os.path.exists(path)
+    )
@@ -0,0 +1,47 @@
+# Database maintenance commands
+import argparse
+import asyncio
+
+from database.storage import get_storage
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m database",
+        description="Maintenance commands for the message database"
+    )
+    parser.add_argument("--db", default="telegram_monitor.db", help="Path to the SQLite database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("migrate", help="Upgrade the database to the current schema")
+    commands.add_parser("rebuild-rollups", help="Recompute the rollup tables from the raw messages")
+    commands.add_parser("rebuild-search", help="Create or rebuild the full-text search index")
+    archive = commands.add_parser("archive", help="Move weeks older than the retention window to archive segments")
+    archive.add_argument("--retention-days", type=float, required=True, help="Days of messages to keep live")
+    archive.add_argument("--archive-dir", help="Directory for archive segments (default: <db>.archive)")
+    args = parser.parse_args()
+    
+    asyncio.run(run(args))
+
+async def run(args):
+    storage = get_storage(
+        db_path=args.db,
+        fts=args.command == "rebuild-search",
+        archive_dir=getattr(args, "archive_dir", None)
+    )
+    try:
+        if args.command == "migrate":
+            # Opening the database has already upgraded it
+            print("Database schema is up to date")
+        elif args.command == "rebuild-rollups":
+            await storage.rebuild_rollups()
+            print("Rollup tables rebuilt")
+        elif args.command == "rebuild-search":
+            await storage.rebuild_search_index()
+            print("Search index rebuilt")
+        elif args.command == "archive":
+            segments = await storage.archive_expired(args.retention_days)
+            print(f"Wrote {len(segments)} archive segments")
+    finally:
+        await storage.close()
+
+if __name__ == "__main__":
+    main()
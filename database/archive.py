@@ -0,0 +1,46 @@
+# Compressed archive segments for expired messages
+import gzip
+import json
+import os
+import stat
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Iterable, Iterator, Tuple
+
+WEEK_SECONDS = 7 * 24 * 60 * 60
+
+def week_bounds(epoch: int) -> Tuple[int, int]:
+    """Start and end (exclusive) of the ISO week containing epoch, in UTC epoch seconds"""
+    day = datetime.fromtimestamp(epoch, timezone.utc).date()
+    monday = datetime(day.year, day.month, day.day, tzinfo=timezone.utc) - timedelta(days=day.weekday())
+    start = int(monday.timestamp())
+    return start, start + WEEK_SECONDS
+
+def week_label(epoch: int) -> str:
+    """ISO week label such as 2026-W42"""
+    year, week, _ = datetime.fromtimestamp(epoch, timezone.utc).isocalendar()
+    return f"{year}-W{week:02d}"
+
+def write_segment(path: str, rows: Iterable[Dict[str, Any]]) -> int:
+    """Write rows to a gzip NDJSON segment and make it read-only; returns the row count
+
+    The file is written under a temporary name and renamed once it is fully
+    on disk, so a segment either exists completely or not at all.
+    """
+    tmp_path = path + ".tmp"
+    count = 0
+    with open(tmp_path, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6) as f:
+            for row in rows:
+                f.write((json.dumps(row) + "\n").encode("utf-8"))
+                count += 1
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.chmod(tmp_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+    os.replace(tmp_path, path)
+    return count
+
+def read_segment(path: str) -> Iterator[Dict[str, Any]]:
+    """Stream the rows of a segment"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
@@ -0,0 +1,231 @@
+# Streaming sketches: heavy hitters for top-K queries and HyperLogLog for distinct counts
+import hashlib
+import math
+import threading
+import time
+import zlib
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+class SpaceSaving:
+    """Space-Saving summary of the most frequent keys in a stream
+
+    At most ``capacity`` counters are kept. A reported count overestimates
+    the true count by at most its ``error``, which never exceeds
+    total / capacity, and every key seen more often than that is present.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.total = 0
+        self.counts = {}
+        self.errors = {}
+
+    def add(self, key: int, count: int = 1) -> None:
+        self.total += count
+        if key in self.counts:
+            self.counts[key] += count
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[key] = count
+            self.errors[key] = 0
+            return
+
+        # Replace the smallest counter; the newcomer inherits its count as error
+        victim = min(self.counts, key=self.counts.get)
+        floor = self.counts.pop(victim)
+        del self.errors[victim]
+        self.counts[key] = floor + count
+        self.errors[key] = floor
+
+    def floor(self) -> int:
+        """Upper bound on the count of any key not in the summary"""
+        return min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+
+    def top(self, k: int) -> List[Tuple[int, int, int]]:
+        """The k largest counters as (key, count, error), largest first"""
+        keys = sorted(self.counts, key=self.counts.get, reverse=True)[:k]
+        return [(key, self.counts[key], self.errors[key]) for key in keys]
+
+    @classmethod
+    def merge(cls, sketches: List["SpaceSaving"], capacity: int) -> "SpaceSaving":
+        """Combine summaries of disjoint streams into one with the same error bound
+
+        A key missing from a full summary may still have been seen up to that
+        summary's floor times, so the floor is added to its count and error.
+        """
+        merged = cls(capacity)
+        keys = set()
+        for sketch in sketches:
+            merged.total += sketch.total
+            keys.update(sketch.counts)
+
+        for key in keys:
+            count = 0
+            error = 0
+            for sketch in sketches:
+                if key in sketch.counts:
+                    count += sketch.counts[key]
+                    error += sketch.errors[key]
+                else:
+                    floor = sketch.floor()
+                    count += floor
+                    error += floor
+            merged.counts[key] = count
+            merged.errors[key] = error
+
+        if len(keys) > capacity:
+            kept = sorted(merged.counts, key=merged.counts.get, reverse=True)[:capacity]
+            merged.counts = {key: merged.counts[key] for key in kept}
+            merged.errors = {key: merged.errors[key] for key in kept}
+        return merged
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "total": self.total,
+            "entries": [[key, count, self.errors[key]] for key, count in self.counts.items()]
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], capacity: int) -> "SpaceSaving":
+        sketch = cls(capacity)
+        sketch.total = data["total"]
+        for key, count, error in data["entries"]:
+            sketch.counts[key] = count
+            sketch.errors[key] = error
+        return sketch
+
+class WindowedTopK:
+    """Space-Saving sketches of senders per group and fixed time bucket
+
+    A window query merges the sketches of the buckets it covers, so its cost
+    depends on the window length and sketch capacity, not on message volume.
+    Windows are aligned to bucket boundaries. Buckets older than
+    ``retention`` seconds are dropped.
+    """
+
+    def __init__(self, bucket_seconds: int = 300, capacity: int = 50, retention: int = 24 * 60 * 60):
+        self.bucket_seconds = bucket_seconds
+        self.capacity = capacity
+        self.retention = retention
+        self.buckets = {}  # (group_id, bucket_start) -> SpaceSaving
+        self.groups = set()
+        self.dirty = set()
+        self._lock = threading.Lock()
+
+    def cutoff(self, now: Optional[float] = None) -> int:
+        """Start of the oldest bucket still kept"""
+        oldest = int(now if now is not None else time.time()) - self.retention
+        return oldest - oldest % self.bucket_seconds
+
+    def add_many(self, items: Iterable[Tuple[int, int, int]]) -> None:
+        """Count (group_id, sender_id, sent_at) items; items older than the retention are ignored"""
+        cutoff = self.cutoff()
+        with self._lock:
+            for group_id, sender_id, sent_at in items:
+                bucket_start = sent_at - sent_at % self.bucket_seconds
+                if bucket_start < cutoff:
+                    continue
+                key = (group_id, bucket_start)
+                sketch = self.buckets.get(key)
+                if sketch is None:
+                    sketch = self.buckets[key] = SpaceSaving(self.capacity)
+                    self.groups.add(group_id)
+                sketch.add(sender_id)
+                self.dirty.add(key)
+
+    def load(self, group_id: int, bucket_start: int, data: Dict[str, Any]) -> None:
+        """Restore a checkpointed bucket"""
+        with self._lock:
+            self.buckets[(group_id, bucket_start)] = SpaceSaving.from_dict(data, self.capacity)
+            self.groups.add(group_id)
+
+    def pop_dirty(self) -> List[Tuple[int, int, Dict[str, Any]]]:
+        """Drop expired buckets and return the ones changed since the last call"""
+        cutoff = self.cutoff()
+        with self._lock:
+            for key in [key for key in self.buckets if key[1] < cutoff]:
+                del self.buckets[key]
+            self.groups = {group_id for group_id, _ in self.buckets}
+            changed = [
+                (group_id, bucket_start, self.buckets[(group_id, bucket_start)].to_dict())
+                for group_id, bucket_start in self.dirty
+                if (group_id, bucket_start) in self.buckets
+            ]
+            self.dirty = set()
+        return changed
+
+    def top(
+        self,
+        since: int,
+        until: Optional[int] = None,
+        group_id: Optional[int] = None,
+        k: int = 10
+    ) -> Dict[int, Dict[str, Any]]:
+        """Top k senders per group for buckets starting in [since, until)
+
+        Each group maps to its message total and a list of (sender_id, count,
+        error) tuples, largest first.
+        """
+        start = max(since - since % self.bucket_seconds, self.cutoff())
+        end = until if until is not None else int(time.time()) + 1
+        with self._lock:
+            groups = self.groups if group_id is None else {group_id} & self.groups
+            result = {}
+            for gid in groups:
+                sketches = [
+                    self.buckets[(gid, bucket_start)]
+                    for bucket_start in range(start, end, self.bucket_seconds)
+                    if (gid, bucket_start) in self.buckets
+                ]
+                if sketches:
+                    merged = SpaceSaving.merge(sketches, self.capacity)
+                    result[gid] = {"total": merged.total, "top": merged.top(k)}
+        return result
+
+class HyperLogLog:
+    """HyperLogLog distinct-count sketch over integer ids
+
+    Uses 2**p one-byte registers (relative standard error about
+    1.04 / sqrt(2**p)). Sketches with the same ``p`` merge by taking the
+    register-wise maximum, so counts for a union of buckets, windows or
+    database shards come from merging their sketches.
+    """
+
+    def __init__(self, p: int = 12, registers: Optional[bytearray] = None):
+        self.p = p
+        self.m = 1 << p
+        self.registers = registers if registers is not None else bytearray(self.m)
+
+    def add(self, value: int) -> bool:
+        """Add a value; returns whether any register changed"""
+        digest = hashlib.blake2b(value.to_bytes(8, "little", signed=True), digest_size=8).digest()
+        x = int.from_bytes(digest, "little")
+        index = x & (self.m - 1)
+        rest = x >> self.p
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def merge(self, other: "HyperLogLog") -> None:
+        """Fold another sketch into this one"""
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        """Estimated number of distinct values added"""
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate while many registers are empty
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        return zlib.compress(bytes(self.registers), 1)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, p: int = 12) -> "HyperLogLog":
+        return cls(p, bytearray(zlib.decompress(data)))
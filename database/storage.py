@@ -1,10 +1,25 @@
 import sqlite3
 import asyncio
+import atexit
+import base64
+import contextlib
+import hashlib
+import heapq
 import json
-from datetime import datetime
-from typing import Dict, Any, List, Optional
+import os
+import pathlib
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
 import logging
 
+from database.archive import week_bounds, week_label, write_segment, read_segment
+from database.sketch import HyperLogLog, WindowedTopK
+from utils.metrics import metrics
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -26,54 +41,1001 @@ class Storage:
         """Store a message in the database"""
         raise NotImplementedError
     
+    async def store_messages(self, messages: List[Dict[str, Any]]) -> None:
+        """Store many messages at once; each dict has the store_message arguments"""
+        for message in messages:
+            await self.store_message(**message)
+    
+    async def get_last_message_ids(self) -> Dict[int, int]:
+        """Get the highest stored message_id for every group"""
+        raise NotImplementedError
+    
+    async def existing_message_keys(self, keys: List[Tuple[int, int]]) -> set:
+        """Get the (group_id, message_id) pairs among keys that are already stored"""
+        raise NotImplementedError
+    
+    async def rollup_snapshot(self) -> Dict[str, Any]:
+        """Get the counters behind get_stats, for seeding another tier
+        
+        ``groups`` holds (group_id, name, message_count, media_count),
+        ``senders`` (sender_id, name, message_count) and ``activity``
+        (bucket_start, message_count) for the last 24 hours.
+        """
+        raise NotImplementedError
+    
     async def get_messages(
         self,
         group_id: Optional[int] = None,
         since: Optional[datetime] = None,
-        limit: int = 100
+        limit: int = 100,
+        include_archive: bool = False
     ) -> List[Dict[str, Any]]:
-        """Get messages from the database"""
+        """Get messages from the database, newest first
+        
+        Set ``include_archive`` to also search messages that were moved out of
+        the live store by the retention policy.
+        """
+        raise NotImplementedError
+    
+    def iter_messages(
+        self,
+        group_id: Optional[int] = None,
+        sender_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        after: Optional[Tuple[int, int]] = None,
+        batch_size: int = 1000
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream messages oldest first without loading the whole result
+        
+        Rows come in (sent_at, id) order; pass the last row's ``(sent_at, id)``
+        as ``after`` to resume an interrupted export.
+        """
         raise NotImplementedError
     
     async def get_stats(self) -> Dict[str, Any]:
         """Get statistics about stored messages"""
         raise NotImplementedError
+    
+    async def aggregate_window(
+        self,
+        since: datetime,
+        until: Optional[datetime] = None,
+        group_by: str = "group"
+    ) -> List[Dict[str, Any]]:
+        """Get per-group or per-sender activity counts for a time window
+        
+        With ``group_by="group"`` each entry has ``group_id``, ``group_name``,
+        ``message_count``, ``unique_users`` and ``media_count``;
+        ``unique_users`` may be an estimate for long windows. With
+        ``group_by="sender"`` each entry has ``sender_id``, ``sender_name``,
+        ``message_count``, ``group_count`` and ``media_count``. Entries are
+        sorted by ``message_count``, highest first.
+        """
+        raise NotImplementedError
+    
+    async def unique_senders(
+        self,
+        since: datetime,
+        until: Optional[datetime] = None,
+        group_id: Optional[int] = None,
+        exact: Optional[bool] = None
+    ) -> Dict[int, int]:
+        """Get the number of distinct senders per group for a time window
+        
+        Long windows may be estimated; pass ``exact=True`` to force an exact
+        count or ``exact=False`` to force an estimate.
+        """
+        raise NotImplementedError
+    
+    async def top_senders(
+        self,
+        since: datetime,
+        until: Optional[datetime] = None,
+        group_id: Optional[int] = None,
+        limit: int = 10
+    ) -> Dict[int, List[Dict[str, Any]]]:
+        """Get the approximate most active senders per group for a recent window
+        
+        Each group maps to entries with ``sender_id``, ``sender_name``,
+        ``message_count`` and ``max_error``; a count overestimates the true
+        count by at most ``max_error``.
+        """
+        raise NotImplementedError
+    
+    async def cross_posts(
+        self,
+        since: datetime,
+        until: Optional[datetime] = None,
+        limit: int = 10
+    ) -> List[Dict[str, Any]]:
+        """Get texts posted in the window that appear in more than one group
+        
+        Each entry has the text's ``preview``, the ``group_count`` and
+        ``message_count`` of all its stored copies, ``first_seen`` and
+        ``groups`` (``group_id``, ``group_name``, ``message_count``). Entries
+        are sorted by ``group_count``, highest first.
+        """
+        raise NotImplementedError
+    
+    async def search(
+        self,
+        query: str,
+        group_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Full-text search over message content
+        
+        Returns ``{"results": [...], "next_cursor": ...}``; pass ``next_cursor``
+        back as ``cursor`` to get the next page of ranked hits.
+        """
+        raise NotImplementedError
+    
+    async def save_entities(self, entries: List[Tuple[int, Optional[str], float]]) -> None:
+        """Persist (peer_id, name, refreshed_at) entity cache entries"""
+        pass
+    
+    async def load_entities(self) -> List[Tuple[int, Optional[str], float]]:
+        """Load persisted entity cache entries"""
+        return []
+    
+    def write_generation(self) -> int:
+        """Counter that changes whenever stored data changes, for cache invalidation"""
+        return 0
+    
+    async def flush(self) -> None:
+        """Wait until every accepted message is durably stored"""
+        pass
+    
+    async def close(self) -> None:
+        """Flush pending writes and release resources"""
+        pass
+
+# Sentinel telling the writer thread to drain and exit
+_STOP = object()
+
+# Width of the activity rollup buckets, in seconds
+ROLLUP_BUCKET_SECONDS = 60
+
+# Stored in PRAGMA user_version; bump when the schema changes
+#   0: text timestamps only
+#   1: sent_at/ingested_at UTC epoch columns and time-first indexes
+#   2: unique (group_id, message_id)
+#   3: names in the groups/senders dimension tables, timestamp derived from sent_at
+#   4: HyperLogLog sender sketches per group and hour
+#   5: message text stored once per distinct content, keyed by hash
+#   6: per-group and per-sender totals of archived messages
+SCHEMA_VERSION = 6
+
+# Width of the HyperLogLog sender buckets, and the longest window whose
+# unique-sender count is computed exactly by default
+HLL_BUCKET_SECONDS = 3600
+HLL_EXACT_MAX_SECONDS = 6 * 60 * 60
+
+# Seconds between checkpoints of the top-sender sketches
+SKETCH_CHECKPOINT_INTERVAL = 60
+
+# Names remembered by the writer so unchanged names are not rewritten
+NAME_CACHE_SIZE = 100000
+
+# Shorter texts ("ok", "+1", media without a caption) are not reported as
+# cross-posts, and reported ones are cut to the preview length
+CROSS_POST_MIN_LENGTH = 20
+CROSS_POST_PREVIEW_LENGTH = 280
+
+# Rows copied per statement when a migration rewrites the messages table
+MIGRATION_CHUNK = 10000
+
+# Range of the signed 64-bit content keys
+_KEY_MIN = -(1 << 63)
+_KEY_MAX = (1 << 63) - 1
+
+def _newest_first(row: Dict[str, Any]) -> Tuple[int, int]:
+    """Sort key ordering message rows by send time, then id"""
+    return (row["sent_at"] or 0, row["id"])
+
+def _epoch(value: datetime) -> int:
+    """Convert a datetime to UTC epoch seconds (naive values are taken as local time)"""
+    return int(value.timestamp())
+
+def _content_hash(text: str) -> int:
+    """Preferred contents key of a message text: a signed 64-bit blake2b hash"""
+    digest = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+class _FlushRequest:
+    """Barrier placed on the write queue; resolved once everything before it is committed"""
+    
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.future = loop.create_future() if loop else None
+        self.event = threading.Event()
+    
+    def resolve(self, error: Optional[BaseException] = None) -> None:
+        """Wake up whoever is waiting on this barrier (called from the writer thread)"""
+        self.event.set()
+        if self.future is not None:
+            self.loop.call_soon_threadsafe(self._set_result, error)
+    
+    def _set_result(self, error: Optional[BaseException]) -> None:
+        if self.future.done():
+            return
+        if error is not None:
+            self.future.set_exception(error)
+        else:
+            self.future.set_result(None)
 
 class SQLiteStorage(Storage):
-    """SQLite implementation of the storage interface"""
+    """SQLite implementation of the storage interface
+    
+    With ``batch_writes`` enabled, ``store_message`` only enqueues the row and a
+    single writer thread commits queued rows in one transaction as soon as
+    ``batch_size`` rows are pending or the oldest one has waited
+    ``flush_interval`` seconds. Use ``flush()`` to wait for durability and
+    ``close()`` (also registered with ``atexit``) to drain the queue on shutdown.
+    A batch that fails is retried row by row, so one bad message only loses
+    itself, and the next ``flush()`` raises its error.
+    
+    ``self.conn`` is the only connection that writes. Reads run on a bounded
+    pool of ``read_pool_size`` threads, each holding its own read-only
+    connection, so WAL readers never wait on the writer. A pool size of 0
+    (forced for ``:memory:`` databases) reads through the writer connection.
+    
+    With ``fts`` enabled, an FTS5 index over message content is kept in sync by
+    triggers (so batched inserts are covered) and ``search`` becomes available.
+    
+    With ``retention_days`` set, ``messages`` only holds the current partition:
+    every ``maintenance_interval`` seconds, whole ISO weeks older than the
+    retention window are written to read-only gzip NDJSON segments under
+    ``archive_dir`` and deleted from the table. Rollup counters keep counting
+    archived messages, and ``get_messages(include_archive=True)`` reads the
+    segments back.
+    
+    Distinct senders are also counted in a HyperLogLog sketch per group and
+    hour, written with the rollups. ``unique_senders`` and the window
+    aggregates count exactly for windows up to ``HLL_EXACT_MAX_SECONDS`` and
+    merge the sketches of whole hours beyond that.
     
-    def __init__(self, db_path: str = "telegram_monitor.db"):
+    Message text is stored once per distinct content in ``contents``, keyed
+    by a 64-bit hash that messages reference, so a reposted announcement is
+    written (and indexed for search) once. Reads join the text back in, and
+    ``cross_posts`` reports how many groups each text appeared in.
+    
+    ``top_senders`` is answered from Space-Saving sketches per group and
+    5-minute bucket covering the last 24 hours. They are updated with every
+    committed batch, checkpointed every ``SKETCH_CHECKPOINT_INTERVAL``
+    seconds, and on startup restored and brought up to date from the rows
+    stored after the last checkpoint.
+    """
+    
+    def __init__(
+        self,
+        db_path: str = "telegram_monitor.db",
+        batch_writes: bool = False,
+        batch_size: int = 500,
+        flush_interval: float = 0.05,
+        read_pool_size: Optional[int] = None,
+        fts: bool = False,
+        retention_days: Optional[float] = None,
+        archive_dir: Optional[str] = None,
+        maintenance_interval: float = 3600
+    ):
         self.db_path = db_path
+        self.fts = fts
+        self.retention_days = retention_days
+        self.archive_dir = archive_dir or f"{db_path}.archive"
+        self.maintenance_interval = maintenance_interval
+        self.batch_writes = batch_writes
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.0, flush_interval)
+        if read_pool_size is None:
+            read_pool_size = min(4, os.cpu_count() or 1)
+        if db_path == ":memory:" or db_path.startswith("file::memory:"):
+            read_pool_size = 0
+        self.read_pool_size = max(0, read_pool_size)
         self.conn = None
+        self._lock = threading.Lock()
+        self._write_queue = None
+        self._writer = None
+        self._write_error = None
+        self._write_executor = None
+        self._read_executor = None
+        self._local = threading.local()
+        self._readers = []
+        self._readers_lock = threading.Lock()
+        self._group_names = {}
+        self._sender_names = {}
+        self._generation = 0
+        self.sender_sketches = WindowedTopK()
+        self._sketch_checkpointed_at = time.monotonic()
+        self._maintenance = None
+        self._stop_maintenance = threading.Event()
+        self._closed = False
         self._setup_db()
+        
+        if self.batch_writes:
+            self._start_writer()
+        else:
+            # Unbatched writes still get their own thread so they never queue behind reads
+            self._write_executor = ThreadPoolExecutor(
+                max_workers=1,
+                thread_name_prefix="sqlite-writer"
+            )
+        
+        if self.read_pool_size:
+            self._read_executor = ThreadPoolExecutor(
+                max_workers=self.read_pool_size,
+                thread_name_prefix="sqlite-reader"
+            )
+        
+        if self.retention_days is not None:
+            self._maintenance = threading.Thread(
+                target=self._maintenance_loop,
+                name=f"sqlite-maintenance-{self.db_path}",
+                daemon=True
+            )
+            self._maintenance.start()
     
     def _setup_db(self):
         """Set up the SQLite database"""
-        self.conn = sqlite3.connect(self.db_path)
+        # The writer connection is used from worker threads; access is serialized by self._lock
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
         cursor = self.conn.cursor()
         
-        # Create messages table
+        # WAL lets readers proceed while a batch is being committed
+        cursor.execute("PRAGMA journal_mode=WAL")
+        
+        cursor.execute("PRAGMA user_version")
+        version = cursor.fetchone()[0]
+        
+        # Messages carry only ids; names and text live in the tables below
+        self._create_messages_table(cursor, "messages")
+        
+        # Each distinct text once, however many groups repost it
         cursor.execute('''
-        CREATE TABLE IF NOT EXISTS messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
+        CREATE TABLE IF NOT EXISTS contents (
+            hash INTEGER PRIMARY KEY,
+            content TEXT NOT NULL
+        )
+        ''')
+        
+        # One row per group/sender, rewritten only when the name changes
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS groups (
+            group_id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL
+        )
+        ''')
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS senders (
+            sender_id INTEGER PRIMARY KEY,
+            name TEXT
+        )
+        ''')
+        
+        if version < 1:
+            self._migrate_epoch_columns(cursor)
+        removed_duplicates = self._migrate_dedup(cursor) if version < 2 else 0
+        if version < 3:
+            self._migrate_dimensions(cursor)
+        if version < 5:
+            self._migrate_contents(cursor)
+        
+        # A message is stored once, however often it is delivered or backfilled
+        cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_group_message
+        ON messages (group_id, message_id)
+        ''')
+        
+        # Time-first index covering the columns the window aggregates count over
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_messages_window
+        ON messages (sent_at, group_id, sender_id, has_media)
+        ''')
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_group_sent_at
+        ON messages (group_id, sent_at)
+        ''')
+        
+        # Copies of a text, and the groups they were posted in
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_messages_content
+        ON messages (content_hash, group_id)
+        ''')
+        
+        # Messages in their stored-by-name shape, for readers
+        cursor.execute('''
+        CREATE VIEW IF NOT EXISTS message_rows AS
+        SELECT m.id, m.group_id, g.name AS group_name, m.sender_id, s.name AS sender_name,
+            m.message_id, c.content,
+            strftime('%Y-%m-%dT%H:%M:%S+00:00', m.sent_at, 'unixepoch') AS timestamp,
+            m.has_media, m.sent_at, m.ingested_at
+        FROM messages m
+        LEFT JOIN groups g ON g.group_id = m.group_id
+        LEFT JOIN senders s ON s.sender_id = m.sender_id
+        LEFT JOIN contents c ON c.hash = m.content_hash
+        ''')
+        
+        # Rollup tables, maintained in the same transaction as each insert batch
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS group_rollup (
+            group_id INTEGER PRIMARY KEY,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            media_count INTEGER NOT NULL DEFAULT 0
+        )
+        ''')
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sender_rollup (
+            sender_id INTEGER PRIMARY KEY,
+            message_count INTEGER NOT NULL DEFAULT 0
+        )
+        ''')
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_sender_rollup_count
+        ON sender_rollup (message_count)
+        ''')
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS activity_rollup (
+            bucket_start INTEGER NOT NULL,
             group_id INTEGER NOT NULL,
-            group_name TEXT NOT NULL,
-            sender_id INTEGER,
-            sender_name TEXT,
-            message_id INTEGER NOT NULL,
-            content TEXT,
-            timestamp TEXT NOT NULL,
-            has_media BOOLEAN NOT NULL
+            message_count INTEGER NOT NULL DEFAULT 0,
+            media_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket_start, group_id)
+        ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sender_hll (
+            bucket_start INTEGER NOT NULL,
+            group_id INTEGER NOT NULL,
+            registers BLOB NOT NULL,
+            PRIMARY KEY (bucket_start, group_id)
         )
         ''')
         
-        # Create index for faster queries
+        # Archive segments produced by the retention policy
         cursor.execute('''
-        CREATE INDEX IF NOT EXISTS idx_group_timestamp 
-        ON messages (group_id, timestamp)
+        CREATE TABLE IF NOT EXISTS archive_segments (
+            path TEXT PRIMARY KEY,
+            week TEXT NOT NULL,
+            start_at INTEGER NOT NULL,
+            end_at INTEGER NOT NULL,
+            row_count INTEGER NOT NULL,
+            created_at INTEGER NOT NULL
+        )
+        ''')
+        
+        # What archiving removed from messages, kept so counts and the
+        # backfill's last message ids survive it
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archived_groups (
+            group_id INTEGER PRIMARY KEY,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            media_count INTEGER NOT NULL DEFAULT 0,
+            last_message_id INTEGER NOT NULL DEFAULT 0
+        )
+        ''')
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archived_senders (
+            sender_id INTEGER PRIMARY KEY,
+            message_count INTEGER NOT NULL DEFAULT 0
+        )
+        ''')
+        if version < 6:
+            self._migrate_archived_totals(cursor)
+        
+        # Top-sender sketch checkpoints; last_id is the newest message they include
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sender_sketches (
+            bucket_start INTEGER NOT NULL,
+            group_id INTEGER NOT NULL,
+            sketch TEXT NOT NULL,
+            PRIMARY KEY (bucket_start, group_id)
+        ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sketch_checkpoint (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            last_id INTEGER NOT NULL
+        )
         ''')
         
+        # Names of chats and senders, used to warm the bot's entity cache
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS entities (
+            peer_id INTEGER PRIMARY KEY,
+            name TEXT,
+            refreshed_at REAL NOT NULL
+        )
+        ''')
+        
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
         self.conn.commit()
+        
+        # Databases created before the rollups existed need one full pass
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM group_rollup)")
+        has_rollups = cursor.fetchone()[0]
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM messages)")
+        has_messages = cursor.fetchone()[0]
+        if has_messages and (not has_rollups or removed_duplicates or version < 4):
+            logger.info("Building rollup tables from existing messages")
+            self._rebuild_rollups_sync()
+        
+        self._load_sketches(cursor)
+        
+        # An index created by an earlier run stays in sync (and searchable) either way
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM sqlite_master WHERE name = 'messages_fts')")
+        has_fts = cursor.fetchone()[0]
+        if self.fts and not has_fts:
+            self._setup_fts(cursor, has_messages)
+        self.fts = self.fts or has_fts
+    
+    def _setup_fts(self, cursor: sqlite3.Cursor, has_messages: bool) -> None:
+        """Create the FTS5 index over the distinct message texts and its sync triggers"""
+        try:
+            cursor.execute('''
+            CREATE VIRTUAL TABLE messages_fts USING fts5(
+                content,
+                content='contents',
+                content_rowid='hash',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+            ''')
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Full-text search disabled, FTS5 is not available: {str(e)}")
+            self.fts = False
+            return
+        
+        self._create_fts_triggers(cursor)
+        self.conn.commit()
+        
+        if has_messages:
+            logger.info("Building full-text index from existing messages")
+            self._rebuild_search_index_sync()
+    
+    def _load_sketches(self, cursor: sqlite3.Cursor) -> None:
+        """Restore the sender sketches and fold in messages stored since the checkpoint"""
+        cutoff = self.sender_sketches.cutoff()
+        cursor.execute(
+            "SELECT group_id, bucket_start, sketch FROM sender_sketches WHERE bucket_start >= ?",
+            (cutoff,)
+        )
+        for group_id, bucket_start, sketch in cursor.fetchall():
+            self.sender_sketches.load(group_id, bucket_start, json.loads(sketch))
+        
+        cursor.execute("SELECT last_id FROM sketch_checkpoint")
+        row = cursor.fetchone()
+        cursor.execute(
+            '''
+            SELECT group_id, sender_id, sent_at FROM messages
+            WHERE sent_at >= ? AND id > ? AND sender_id IS NOT NULL
+            ''',
+            (cutoff, row[0] if row else 0)
+        )
+        self.sender_sketches.add_many(cursor)
+        with self._lock:
+            self._checkpoint_sketches()
+    
+    def _checkpoint_sketches(self) -> None:
+        """Write changed sender sketches and the newest message they include
+        
+        The caller holds self._lock, so every committed row is already folded in.
+        """
+        changed = self.sender_sketches.pop_dirty()
+        try:
+            self.conn.executemany(
+                '''
+                INSERT OR REPLACE INTO sender_sketches (bucket_start, group_id, sketch)
+                VALUES (?, ?, ?)
+                ''',
+                [(bucket_start, group_id, json.dumps(sketch)) for group_id, bucket_start, sketch in changed]
+            )
+            self.conn.execute(
+                "DELETE FROM sender_sketches WHERE bucket_start < ?",
+                (self.sender_sketches.cutoff(),)
+            )
+            self.conn.execute(
+                '''
+                INSERT OR REPLACE INTO sketch_checkpoint (id, last_id)
+                SELECT 0, COALESCE(MAX(id), 0) FROM messages
+                '''
+            )
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"Checkpointing sender sketches failed: {str(e)}")
+        self._sketch_checkpointed_at = time.monotonic()
+    
+    @staticmethod
+    def _create_fts_triggers(cursor: sqlite3.Cursor) -> None:
+        """Keep messages_fts in sync with inserts into and deletes from contents"""
+        cursor.execute('''
+        CREATE TRIGGER contents_fts_insert AFTER INSERT ON contents BEGIN
+            INSERT INTO messages_fts (rowid, content) VALUES (new.hash, new.content);
+        END
+        ''')
+        cursor.execute('''
+        CREATE TRIGGER contents_fts_delete AFTER DELETE ON contents BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content)
+            VALUES ('delete', old.hash, old.content);
+        END
+        ''')
+    
+    async def rebuild_search_index(self) -> None:
+        """Rebuild the full-text index from the contents table"""
+        if not self.fts:
+            raise RuntimeError("Full-text search is not enabled")
+        await self.flush()
+        await asyncio.to_thread(self._rebuild_search_index_sync)
+    
+    def _rebuild_search_index_sync(self) -> None:
+        """Synchronous version of rebuild_search_index
+        
+        FTS5's 'rebuild' reads the content table in one pass and writes large
+        segments, which is far faster than re-inserting row by row; 'optimize'
+        then merges them so queries touch a single b-tree.
+        """
+        with self._lock:
+            cursor = self.conn.cursor()
+            cursor.execute("PRAGMA cache_size")
+            cache_size = cursor.fetchone()[0]
+            try:
+                cursor.execute("PRAGMA cache_size = -262144")  # 256 MiB
+                cursor.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+                cursor.execute("INSERT INTO messages_fts (messages_fts) VALUES ('optimize')")
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            finally:
+                cursor.execute(f"PRAGMA cache_size = {cache_size}")
+    
+    @staticmethod
+    def _create_messages_table(cursor: sqlite3.Cursor, name: str) -> None:
+        """Create the messages table under the given name
+        
+        sent_at is the Telegram send time and ingested_at the arrival time,
+        both in UTC epoch seconds. content_hash is the key of the text in
+        contents (NULL for messages without text).
+        """
+        cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            group_id INTEGER NOT NULL,
+            sender_id INTEGER,
+            message_id INTEGER NOT NULL,
+            content_hash INTEGER,
+            has_media BOOLEAN NOT NULL,
+            sent_at INTEGER NOT NULL,
+            ingested_at INTEGER NOT NULL
+        )
+        ''')
+    
+    def _migrate_epoch_columns(self, cursor: sqlite3.Cursor) -> None:
+        """Schema v1: add the epoch columns to a pre-existing messages table
+        
+        Existing rows are converted when the table is rebuilt for schema v3.
+        """
+        cursor.execute("PRAGMA table_info(messages)")
+        columns = {row[1] for row in cursor.fetchall()}
+        if "sent_at" not in columns:
+            logger.info("Migrating messages table to epoch timestamps")
+            cursor.execute("ALTER TABLE messages ADD COLUMN sent_at INTEGER")
+        if "ingested_at" not in columns:
+            cursor.execute("ALTER TABLE messages ADD COLUMN ingested_at INTEGER")
+        
+        # Superseded by the sent_at indexes
+        cursor.execute("DROP INDEX IF EXISTS idx_group_timestamp")
+    
+    def _migrate_dedup(self, cursor: sqlite3.Cursor) -> int:
+        """Schema v2: drop duplicate (group_id, message_id) rows, keeping the first stored"""
+        cursor.execute(
+            '''
+            DELETE FROM messages
+            WHERE id NOT IN (
+                SELECT MIN(id) FROM messages GROUP BY group_id, message_id
+            )
+            '''
+        )
+        if cursor.rowcount > 0:
+            logger.info(f"Removed {cursor.rowcount} duplicate messages")
+        return max(cursor.rowcount, 0)
+    
+    def _migrate_dimensions(self, cursor: sqlite3.Cursor) -> None:
+        """Schema v3: move names into the dimension tables and drop the text columns
+        
+        SQLite cannot drop columns in place on every supported version, so the
+        table is copied into the current layout (ids unchanged) and swapped in.
+        Rows the old epoch backfill never reached are converted on the way. The
+        rollups lose their name columns and are rebuilt afterwards.
+        """
+        cursor.execute("PRAGMA table_info(messages)")
+        columns = {row[1] for row in cursor.fetchall()}
+        if "group_name" not in columns:
+            return
+        
+        logger.info("Moving group and sender names into dimension tables")
+        
+        # MAX(id) makes SQLite take the names from each id's newest row
+        cursor.execute(
+            '''
+            INSERT OR REPLACE INTO groups (group_id, name)
+            SELECT group_id, group_name
+            FROM (
+                SELECT group_id, group_name, MAX(id) FROM messages GROUP BY group_id
+            )
+            '''
+        )
+        cursor.execute(
+            '''
+            INSERT OR REPLACE INTO senders (sender_id, name)
+            SELECT sender_id, sender_name
+            FROM (
+                SELECT sender_id, sender_name, MAX(id) FROM messages
+                WHERE sender_id IS NOT NULL
+                GROUP BY sender_id
+            )
+            '''
+        )
+        
+        # Legacy timestamps are naive local arrival times: both send and ingest time
+        copied = self._rewrite_messages(
+            cursor,
+            '''
+            SELECT id, group_id, sender_id, message_id, content, has_media,
+                COALESCE(sent_at, CAST(strftime('%s', timestamp, 'utc') AS INTEGER)),
+                COALESCE(ingested_at, CAST(strftime('%s', timestamp, 'utc') AS INTEGER))
+            FROM messages
+            '''
+        )
+        logger.info(f"Rewrote {copied} messages without name columns")
+        
+        cursor.execute("DROP TABLE IF EXISTS group_rollup")
+        cursor.execute("DROP TABLE IF EXISTS sender_rollup")
+    
+    def _migrate_contents(self, cursor: sqlite3.Cursor) -> None:
+        """Schema v5: store each distinct message text once in the contents table"""
+        cursor.execute("PRAGMA table_info(messages)")
+        columns = {row[1] for row in cursor.fetchall()}
+        if "content" not in columns:
+            return
+        
+        logger.info("Moving message text into the contents table")
+        copied = self._rewrite_messages(
+            cursor,
+            '''
+            SELECT id, group_id, sender_id, message_id, content, has_media, sent_at, ingested_at
+            FROM messages
+            '''
+        )
+        cursor.execute("SELECT COUNT(*) FROM contents")
+        logger.info(f"Rewrote {copied} messages referencing {cursor.fetchone()[0]} distinct texts")
+    
+    def _migrate_archived_totals(self, cursor: sqlite3.Cursor) -> None:
+        """Schema v6: total the segments archived before the archived_* tables existed"""
+        cursor.execute("SELECT path FROM archive_segments ORDER BY start_at")
+        paths = [row[0] for row in cursor.fetchall()]
+        if not paths:
+            return
+        
+        logger.info(f"Counting archived messages in {len(paths)} segments")
+        groups = {}
+        senders = {}
+        for path in paths:
+            try:
+                for row in read_segment(path):
+                    group = groups.setdefault(row["group_id"], [0, 0, 0])
+                    group[0] += 1
+                    group[1] += 1 if row["has_media"] else 0
+                    group[2] = max(group[2], row["message_id"])
+                    if row["sender_id"] is not None:
+                        senders[row["sender_id"]] = senders.get(row["sender_id"], 0) + 1
+            except OSError as e:
+                logger.error(f"Could not read archive segment {path}: {str(e)}")
+        
+        cursor.executemany(
+            '''
+            INSERT INTO archived_groups (group_id, message_count, media_count, last_message_id)
+            VALUES (?, ?, ?, ?)
+            ''',
+            [(key, *value) for key, value in groups.items()]
+        )
+        cursor.executemany(
+            "INSERT INTO archived_senders (sender_id, message_count) VALUES (?, ?)",
+            senders.items()
+        )
+    
+    def _rewrite_messages(self, cursor: sqlite3.Cursor, select: str) -> int:
+        """Copy the messages table into the current layout and swap the copy in
+        
+        ``select`` reads (id, group_id, sender_id, message_id, content,
+        has_media, sent_at, ingested_at) from the old table. Ids are kept and
+        texts move into contents. A full-text index over the old table is
+        dropped; _setup_db rebuilds it over contents.
+        
+        The copy is one transaction, so a crash leaves the old table intact
+        and other processes opening the database wait instead of copying too.
+        That is the expected downtime for writers: about 30 seconds per
+        million messages on an SSD, rollup rebuild included, and more when
+        the full-text index is rebuilt afterwards. It runs in the
+        constructor: async code opens the storage through ``open_storage``
+        so the event loop is not blocked meanwhile.
+        """
+        self._create_messages_table(cursor, "messages_new")
+        copied = 0
+        last_id = 0
+        while True:
+            cursor.execute(
+                f"SELECT * FROM ({select}) WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, MIGRATION_CHUNK)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            
+            hashes, _ = self._content_hashes(cursor, [row[4] for row in rows if row[4] is not None])
+            cursor.executemany(
+                '''
+                INSERT INTO messages_new (
+                    id, group_id, sender_id, message_id, content_hash, has_media, sent_at, ingested_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''',
+                [(*row[:4], hashes.get(row[4]), *row[5:]) for row in rows]
+            )
+            copied += len(rows)
+            last_id = rows[-1][0]
+        
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM sqlite_master WHERE name = 'messages_fts')")
+        if cursor.fetchone()[0]:
+            cursor.execute("DROP TABLE messages_fts")
+            self.fts = True
+        
+        # Dropping the table also drops its indexes and triggers; they are recreated by _setup_db
+        cursor.execute("DROP VIEW IF EXISTS message_rows")
+        cursor.execute("DROP TABLE messages")
+        cursor.execute("ALTER TABLE messages_new RENAME TO messages")
+        return copied
+    
+    def _maintenance_loop(self) -> None:
+        """Apply the retention policy periodically until the storage is closed"""
+        while not self._stop_maintenance.is_set():
+            try:
+                self._archive_expired_sync()
+            except Exception as e:
+                logger.error(f"Archiving expired messages failed: {str(e)}")
+            self._stop_maintenance.wait(self.maintenance_interval)
+    
+    async def archive_expired(self, retention_days: Optional[float] = None) -> List[str]:
+        """Move whole weeks older than the retention window into archive segments"""
+        await self.flush()
+        return await asyncio.to_thread(self._archive_expired_sync, retention_days)
+    
+    def _archive_expired_sync(self, retention_days: Optional[float] = None) -> List[str]:
+        """Synchronous version of archive_expired; returns the new segment paths
+        
+        Each week is exported from a read connection, so ingest is not blocked
+        while the segment is compressed. Only rows that were exported (ids up to
+        the highest one written) are deleted afterwards, so a late row landing in
+        the same week stays in the table until the next run. Texts no live
+        message refers to any more are deleted with them.
+        """
+        retention_days = retention_days if retention_days is not None else self.retention_days
+        if retention_days is None:
+            return []
+        
+        cutoff = int(time.time() - retention_days * 24 * 60 * 60)
+        os.makedirs(self.archive_dir, exist_ok=True)
+        reader = self.conn if not self.read_pool_size else self._reader_conn()
+        reader_lock = self._lock if reader is self.conn else contextlib.nullcontext()
+        segments = []
+        
+        while not self._closed:
+            with reader_lock:
+                oldest = reader.execute(
+                    "SELECT MIN(sent_at) FROM messages WHERE sent_at IS NOT NULL"
+                ).fetchone()[0]
+            if oldest is None:
+                break
+            
+            start_at, end_at = week_bounds(oldest)
+            if end_at > cutoff:
+                break
+            
+            week = week_label(start_at)
+            with self._lock:
+                part = self.conn.execute(
+                    "SELECT COUNT(*) FROM archive_segments WHERE week = ?", (week,)
+                ).fetchone()[0]
+            path = os.path.join(self.archive_dir, f"messages-{week}-{part}.ndjson.gz")
+            
+            exported = {"max_id": 0}
+            def rows():
+                with reader_lock:
+                    cursor = reader.execute(
+                        "SELECT * FROM message_rows WHERE sent_at >= ? AND sent_at < ? ORDER BY sent_at, id",
+                        (start_at, end_at)
+                    )
+                    columns = [col[0] for col in cursor.description]
+                    for row in cursor:
+                        record = dict(zip(columns, row))
+                        exported["max_id"] = max(exported["max_id"], record["id"])
+                        yield record
+            
+            row_count = write_segment(path, rows())
+            
+            with self._lock:
+                try:
+                    self.conn.execute(
+                        '''
+                        INSERT INTO archived_groups (group_id, message_count, media_count, last_message_id)
+                        SELECT group_id, COUNT(*), SUM(has_media != 0), MAX(message_id)
+                        FROM messages
+                        WHERE sent_at >= ? AND sent_at < ? AND id <= ?
+                        GROUP BY group_id
+                        ON CONFLICT (group_id) DO UPDATE SET
+                            message_count = message_count + excluded.message_count,
+                            media_count = media_count + excluded.media_count,
+                            last_message_id = MAX(last_message_id, excluded.last_message_id)
+                        ''',
+                        (start_at, end_at, exported["max_id"])
+                    )
+                    self.conn.execute(
+                        '''
+                        INSERT INTO archived_senders (sender_id, message_count)
+                        SELECT sender_id, COUNT(*)
+                        FROM messages
+                        WHERE sent_at >= ? AND sent_at < ? AND id <= ? AND sender_id IS NOT NULL
+                        GROUP BY sender_id
+                        ON CONFLICT (sender_id) DO UPDATE SET
+                            message_count = message_count + excluded.message_count
+                        ''',
+                        (start_at, end_at, exported["max_id"])
+                    )
+                    archived_hashes = self.conn.execute(
+                        '''
+                        SELECT DISTINCT content_hash FROM messages
+                        WHERE sent_at >= ? AND sent_at < ? AND id <= ? AND content_hash IS NOT NULL
+                        ''',
+                        (start_at, end_at, exported["max_id"])
+                    ).fetchall()
+                    self.conn.execute(
+                        "DELETE FROM messages WHERE sent_at >= ? AND sent_at < ? AND id <= ?",
+                        (start_at, end_at, exported["max_id"])
+                    )
+                    # Texts still posted in live messages stay
+                    self.conn.executemany(
+                        '''
+                        DELETE FROM contents WHERE hash = ?1
+                        AND NOT EXISTS (SELECT 1 FROM messages WHERE content_hash = ?1)
+                        ''',
+                        archived_hashes
+                    )
+                    self.conn.execute(
+                        "DELETE FROM activity_rollup WHERE bucket_start < ?",
+                        (end_at,)
+                    )
+                    self.conn.execute(
+                        "DELETE FROM sender_hll WHERE bucket_start < ?",
+                        (end_at,)
+                    )
+                    self.conn.execute(
+                        '''
+                        INSERT INTO archive_segments (path, week, start_at, end_at, row_count, created_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        ''',
+                        (path, week, start_at, end_at, row_count, int(time.time()))
+                    )
+                    self.conn.commit()
+                    self._generation += 1
+                except Exception:
+                    self.conn.rollback()
+                    raise
+            
+            logger.info(f"Archived {row_count} messages from {week} to {path}")
+            segments.append(path)
+        
+        return segments
     
     async def store_message(
         self,
@@ -86,9 +1048,23 @@ class SQLiteStorage(Storage):
         timestamp: datetime,
         has_media: bool
     ) -> None:
-        """Store a message in the SQLite database"""
-        # Run in a thread pool to avoid blocking
-        await asyncio.to_thread(
+        """Store a message in the SQLite database
+        
+        ``timestamp`` is the time the message was sent; the ingest time is
+        recorded by the storage layer.
+        """
+        if self.batch_writes:
+            if self._closed:
+                raise RuntimeError("Storage is closed")
+            self._write_queue.put_nowait(self._message_row(
+                group_id, group_name, sender_id, sender_name,
+                message_id, content, timestamp, has_media
+            ))
+            return
+        
+        # Run on the writer thread to avoid blocking
+        await asyncio.get_running_loop().run_in_executor(
+            self._write_executor,
             self._store_message_sync,
             group_id,
             group_name,
@@ -112,31 +1088,628 @@ class SQLiteStorage(Storage):
         has_media: bool
     ) -> None:
         """Synchronous version of store_message"""
-        cursor = self.conn.cursor()
-        cursor.execute(
+        self._write_batch([self._message_row(
+            group_id, group_name, sender_id, sender_name,
+            message_id, content, timestamp, has_media
+        )])
+    
+    async def store_messages(self, messages: List[Dict[str, Any]]) -> None:
+        """Store many messages in one transaction (or enqueue them in batched mode)"""
+        rows = [self._message_row(**message) for message in messages]
+        if self.batch_writes:
+            if self._closed:
+                raise RuntimeError("Storage is closed")
+            for row in rows:
+                self._write_queue.put_nowait(row)
+            return
+        
+        await asyncio.get_running_loop().run_in_executor(
+            self._write_executor,
+            self._write_batch,
+            rows
+        )
+    
+    async def get_last_message_ids(self) -> Dict[int, int]:
+        """Get the highest stored message_id for every group"""
+        return await self._run_read(self._query_last_message_ids)
+    
+    def _query_last_message_ids(self, conn: sqlite3.Connection) -> Dict[int, int]:
+        """Run the get_last_message_ids query on the given connection"""
+        # One index seek per known group instead of a scan of the whole index;
+        # groups whose messages were all archived still have their last id
+        cursor = conn.execute(
             '''
-            INSERT INTO messages (
-                group_id, group_name, sender_id, sender_name,
-                message_id, content, timestamp, has_media
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            SELECT g.group_id, MAX(
+                COALESCE((SELECT MAX(message_id) FROM messages m WHERE m.group_id = g.group_id), 0),
+                COALESCE(a.last_message_id, 0)
+            )
+            FROM group_rollup g
+            LEFT JOIN archived_groups a ON a.group_id = g.group_id
+            '''
+        )
+        return dict(cursor.fetchall())
+    
+    async def existing_message_keys(self, keys: List[Tuple[int, int]]) -> set:
+        """Get the (group_id, message_id) pairs among keys that are already stored"""
+        if not keys:
+            return set()
+        return await self._run_read(self._query_existing_keys, keys)
+    
+    def _query_existing_keys(self, conn: sqlite3.Connection, keys: List[Tuple[int, int]]) -> set:
+        """Look the keys up in the unique (group_id, message_id) index"""
+        cursor = conn.execute(
+            '''
+            SELECT group_id, message_id FROM messages
+            WHERE (group_id, message_id) IN (
+                SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]') FROM json_each(?)
+            )
             ''',
-            (
-                group_id, group_name, sender_id, sender_name,
-                message_id, content, timestamp.isoformat(), has_media
+            (json.dumps(keys),)
+        )
+        return set(cursor.fetchall())
+    
+    async def rollup_snapshot(self) -> Dict[str, Any]:
+        """Read the rollup tables with names"""
+        return await self._run_read(self._query_rollup_snapshot)
+    
+    def _query_rollup_snapshot(self, conn: sqlite3.Connection) -> Dict[str, Any]:
+        """Run the rollup_snapshot queries on the given connection"""
+        since = int(time.time()) - 24 * 60 * 60
+        return {
+            "groups": conn.execute(
+                '''
+                SELECT r.group_id, g.name, r.message_count, r.media_count
+                FROM group_rollup r
+                LEFT JOIN groups g ON g.group_id = r.group_id
+                '''
+            ).fetchall(),
+            "senders": conn.execute(
+                '''
+                SELECT r.sender_id, s.name, r.message_count
+                FROM sender_rollup r
+                LEFT JOIN senders s ON s.sender_id = r.sender_id
+                '''
+            ).fetchall(),
+            "activity": conn.execute(
+                '''
+                SELECT bucket_start, SUM(message_count) FROM activity_rollup
+                WHERE bucket_start >= ?
+                GROUP BY bucket_start
+                ''',
+                (since - since % ROLLUP_BUCKET_SECONDS,)
+            ).fetchall()
+        }
+    
+    @staticmethod
+    def _message_row(
+        group_id: int,
+        group_name: str,
+        sender_id: Optional[int],
+        sender_name: Optional[str],
+        message_id: int,
+        content: str,
+        timestamp: datetime,
+        has_media: bool
+    ) -> tuple:
+        """Build the tuple the writer stores a message from"""
+        return (
+            group_id, group_name, sender_id, sender_name,
+            message_id, content, has_media, _epoch(timestamp), int(time.time())
+        )
+    
+    def _write_batch(self, rows: List[tuple]) -> None:
+        """Insert rows in a single transaction (one commit for the whole batch)
+        
+        Rows whose (group_id, message_id) is already stored are skipped, and
+        only rows that were actually inserted are counted in the rollups.
+        Texts already in contents are referenced rather than written again.
+        """
+        with self._lock, metrics.timer("commit"):
+            cursor = self.conn.cursor()
+            try:
+                names = self._write_names(cursor, rows)
+                hashes, added = self._content_hashes(
+                    cursor, [row[5] for row in rows if row[5] is not None]
+                )
+                cursor.execute("SELECT COALESCE(MAX(id), 0) FROM messages")
+                last_id = cursor.fetchone()[0]
+                cursor.executemany(
+                    '''
+                    INSERT OR IGNORE INTO messages (
+                        group_id, sender_id, message_id, content_hash,
+                        has_media, sent_at, ingested_at
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''',
+                    [(row[0], row[2], row[4], hashes.get(row[5]), *row[6:]) for row in rows]
+                )
+                if cursor.rowcount != len(rows):
+                    rows = self._inserted_rows(cursor, rows, last_id)
+                    # A text added only for skipped rows would be referenced by nothing
+                    kept = {hashes[row[5]] for row in rows if row[5] is not None}
+                    cursor.executemany(
+                        "DELETE FROM contents WHERE hash = ?",
+                        [(key,) for key in added if key not in kept]
+                    )
+                self._update_rollups(cursor, rows)
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            self._remember_names(*names)
+            metrics.inc("messages_stored", len(rows))
+            if rows:
+                self._generation += 1
+            
+            self.sender_sketches.add_many(
+                (row[0], row[2], row[7]) for row in rows if row[2] is not None
             )
+            if time.monotonic() - self._sketch_checkpointed_at >= SKETCH_CHECKPOINT_INTERVAL:
+                self._checkpoint_sketches()
+    
+    def _write_names(self, cursor: sqlite3.Cursor, rows: List[tuple]) -> Tuple[Dict[int, str], Dict[int, str]]:
+        """Upsert group and sender names that differ from the last ones written
+        
+        Returns the names written, to be remembered once the batch commits.
+        """
+        groups = {}
+        senders = {}
+        for row in rows:
+            # Later rows win, so the dimension tables track the most recent name
+            if self._group_names.get(row[0]) != row[1]:
+                groups[row[0]] = row[1]
+            if row[2] is not None and self._sender_names.get(row[2], "") != row[3]:
+                senders[row[2]] = row[3]
+        
+        # Names not cached yet are compared in SQL, so an unchanged row is not rewritten
+        cursor.executemany(
+            '''
+            INSERT INTO groups (group_id, name) VALUES (?, ?)
+            ON CONFLICT (group_id) DO UPDATE SET name = excluded.name
+            WHERE name IS NOT excluded.name
+            ''',
+            groups.items()
+        )
+        cursor.executemany(
+            '''
+            INSERT INTO senders (sender_id, name) VALUES (?, ?)
+            ON CONFLICT (sender_id) DO UPDATE SET name = excluded.name
+            WHERE name IS NOT excluded.name
+            ''',
+            senders.items()
+        )
+        return groups, senders
+    
+    def _remember_names(self, groups: Dict[int, str], senders: Dict[int, str]) -> None:
+        """Cache names known to be stored"""
+        for cache, names in ((self._group_names, groups), (self._sender_names, senders)):
+            if len(cache) + len(names) > NAME_CACHE_SIZE:
+                cache.clear()
+            cache.update(names)
+    
+    @staticmethod
+    def _content_hashes(cursor: sqlite3.Cursor, texts: List[str]) -> Tuple[Dict[str, int], List[int]]:
+        """Find or add the contents row of every distinct text
+        
+        Returns the key of each text and the keys added. A text's key is its
+        hash unless another text already holds that key, in which case the
+        following keys are probed until a free one or the text itself is found.
+        """
+        pending = {text: _content_hash(text) for text in set(texts)}
+        keys = {}
+        added = []
+        while pending:
+            cursor.execute(
+                "SELECT hash, content FROM contents WHERE hash IN (SELECT value FROM json_each(?))",
+                (json.dumps(list(set(pending.values()))),)
+            )
+            stored = dict(cursor.fetchall())
+            
+            claimed = {}
+            collided = {}
+            for text, key in pending.items():
+                existing = stored.get(key, claimed.get(key))
+                if existing is None:
+                    claimed[key] = text
+                    keys[text] = key
+                elif existing == text:
+                    keys[text] = key
+                else:
+                    collided[text] = key + 1 if key < _KEY_MAX else _KEY_MIN
+            
+            cursor.executemany("INSERT INTO contents (hash, content) VALUES (?, ?)", claimed.items())
+            added.extend(claimed)
+            pending = collided
+        return keys, added
+    
+    @staticmethod
+    def _inserted_rows(cursor: sqlite3.Cursor, rows: List[tuple], last_id: int) -> List[tuple]:
+        """Narrow a batch down to the rows the last INSERT OR IGNORE actually added
+        
+        Writes are serialized, so everything above ``last_id`` came from this batch.
+        """
+        cursor.execute("SELECT group_id, message_id FROM messages WHERE id > ?", (last_id,))
+        inserted = set(cursor.fetchall())
+        kept = []
+        for row in rows:
+            key = (row[0], row[4])
+            if key in inserted:
+                inserted.discard(key)
+                kept.append(row)
+        return kept
+    
+    def _update_rollups(self, cursor: sqlite3.Cursor, rows: List[tuple]) -> None:
+        """Fold a batch of message rows into the rollup counters"""
+        groups = {}
+        senders = {}
+        buckets = {}
+        hll_senders = {}
+        for row in rows:
+            group_id, _, sender_id, _, _, _, has_media, sent_at, _ = row
+            media = 1 if has_media else 0
+            
+            group = groups.setdefault(group_id, [0, 0])
+            group[0] += 1
+            group[1] += media
+            
+            if sender_id is not None:
+                senders[sender_id] = senders.get(sender_id, 0) + 1
+            
+            bucket_start = sent_at - sent_at % ROLLUP_BUCKET_SECONDS
+            bucket = buckets.setdefault((bucket_start, group_id), [0, 0])
+            bucket[0] += 1
+            bucket[1] += media
+            
+            if sender_id is not None:
+                hll_key = (sent_at - sent_at % HLL_BUCKET_SECONDS, group_id)
+                hll_senders.setdefault(hll_key, set()).add(sender_id)
+        
+        # Once a sketch has seen a bucket's regular senders most adds change
+        # no register, and then the sketch is not rewritten
+        for (bucket_start, group_id), sender_ids in hll_senders.items():
+            cursor.execute(
+                "SELECT registers FROM sender_hll WHERE bucket_start = ? AND group_id = ?",
+                (bucket_start, group_id)
+            )
+            row = cursor.fetchone()
+            hll = HyperLogLog.from_bytes(row[0]) if row else HyperLogLog()
+            changed = False
+            for sender_id in sender_ids:
+                changed = hll.add(sender_id) or changed
+            if changed:
+                cursor.execute(
+                    "INSERT OR REPLACE INTO sender_hll (bucket_start, group_id, registers) VALUES (?, ?, ?)",
+                    (bucket_start, group_id, hll.to_bytes())
+                )
+        
+        cursor.executemany(
+            '''
+            INSERT INTO group_rollup (group_id, message_count, media_count)
+            VALUES (?, ?, ?)
+            ON CONFLICT (group_id) DO UPDATE SET
+                message_count = message_count + excluded.message_count,
+                media_count = media_count + excluded.media_count
+            ''',
+            [(key, *value) for key, value in groups.items()]
+        )
+        cursor.executemany(
+            '''
+            INSERT INTO sender_rollup (sender_id, message_count)
+            VALUES (?, ?)
+            ON CONFLICT (sender_id) DO UPDATE SET
+                message_count = message_count + excluded.message_count
+            ''',
+            senders.items()
+        )
+        cursor.executemany(
+            '''
+            INSERT INTO activity_rollup (bucket_start, group_id, message_count, media_count)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (bucket_start, group_id) DO UPDATE SET
+                message_count = message_count + excluded.message_count,
+                media_count = media_count + excluded.media_count
+            ''',
+            [(*key, *value) for key, value in buckets.items()]
+        )
+    
+    async def rebuild_rollups(self) -> None:
+        """Recompute all rollup tables from the raw messages
+        
+        Group and sender totals also count archived messages. Activity
+        buckets and sender sketches only cover live messages, as they do
+        after archiving.
+        """
+        await self.flush()
+        await asyncio.to_thread(self._rebuild_rollups_sync)
+    
+    def _rebuild_rollups_sync(self) -> None:
+        """Synchronous version of rebuild_rollups"""
+        with self._lock:
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute("DELETE FROM group_rollup")
+                cursor.execute("DELETE FROM sender_rollup")
+                cursor.execute("DELETE FROM activity_rollup")
+                cursor.execute("DELETE FROM sender_hll")
+                
+                cursor.execute(
+                    '''
+                    INSERT INTO group_rollup (group_id, message_count, media_count)
+                    SELECT group_id, SUM(message_count), SUM(media_count)
+                    FROM (
+                        SELECT group_id, COUNT(*) AS message_count, SUM(has_media != 0) AS media_count
+                        FROM messages
+                        GROUP BY group_id
+                        UNION ALL
+                        SELECT group_id, message_count, media_count FROM archived_groups
+                    )
+                    GROUP BY group_id
+                    '''
+                )
+                cursor.execute(
+                    '''
+                    INSERT INTO sender_rollup (sender_id, message_count)
+                    SELECT sender_id, SUM(message_count)
+                    FROM (
+                        SELECT sender_id, COUNT(*) AS message_count
+                        FROM messages
+                        WHERE sender_id IS NOT NULL
+                        GROUP BY sender_id
+                        UNION ALL
+                        SELECT sender_id, message_count FROM archived_senders
+                    )
+                    GROUP BY sender_id
+                    '''
+                )
+                cursor.execute(
+                    '''
+                    INSERT INTO activity_rollup (bucket_start, group_id, message_count, media_count)
+                    SELECT sent_at / ? * ? AS bucket_start, group_id, COUNT(*), SUM(has_media != 0)
+                    FROM messages
+                    GROUP BY bucket_start, group_id
+                    ''',
+                    (ROLLUP_BUCKET_SECONDS, ROLLUP_BUCKET_SECONDS)
+                )
+                self._rebuild_sender_hll(cursor)
+                self.conn.commit()
+                self._generation += 1
+            except Exception:
+                self.conn.rollback()
+                raise
+    
+    def _rebuild_sender_hll(self, cursor: sqlite3.Cursor) -> None:
+        """Rebuild the sender sketches in one pass over the time-ordered index
+        
+        Rows arrive in send-time order, so only the current bucket's sketches
+        are held in memory.
+        """
+        def write(sketches, bucket_start):
+            cursor.executemany(
+                "INSERT INTO sender_hll (bucket_start, group_id, registers) VALUES (?, ?, ?)",
+                [(bucket_start, group_id, hll.to_bytes()) for group_id, hll in sketches.items()]
+            )
+        
+        rows = self.conn.execute(
+            '''
+            SELECT sent_at, group_id, sender_id
+            FROM messages INDEXED BY idx_messages_window
+            WHERE sender_id IS NOT NULL
+            ORDER BY sent_at
+            '''
+        )
+        current = None
+        sketches = {}
+        for sent_at, group_id, sender_id in rows:
+            bucket_start = sent_at - sent_at % HLL_BUCKET_SECONDS
+            if bucket_start != current:
+                write(sketches, current)
+                current = bucket_start
+                sketches = {}
+            hll = sketches.get(group_id)
+            if hll is None:
+                hll = sketches[group_id] = HyperLogLog()
+            hll.add(sender_id)
+        write(sketches, current)
+    
+    async def save_entities(self, entries: List[Tuple[int, Optional[str], float]]) -> None:
+        """Persist entity cache entries"""
+        if entries:
+            await asyncio.to_thread(self._save_entities_sync, entries)
+    
+    def _save_entities_sync(self, entries: List[Tuple[int, Optional[str], float]]) -> None:
+        """Synchronous version of save_entities"""
+        with self._lock:
+            try:
+                self.conn.executemany(
+                    '''
+                    INSERT OR REPLACE INTO entities (peer_id, name, refreshed_at)
+                    VALUES (?, ?, ?)
+                    ''',
+                    entries
+                )
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+    
+    async def load_entities(self) -> List[Tuple[int, Optional[str], float]]:
+        """Load persisted entity cache entries, most recently refreshed last"""
+        return await self._run_read(self._query_entities)
+    
+    def _query_entities(self, conn: sqlite3.Connection) -> List[Tuple[int, Optional[str], float]]:
+        """Run the load_entities query on the given connection"""
+        cursor = conn.cursor()
+        cursor.execute("SELECT peer_id, name, refreshed_at FROM entities ORDER BY refreshed_at")
+        return cursor.fetchall()
+    
+    def _start_writer(self):
+        """Start the background thread that drains the write queue"""
+        self._write_queue = queue.Queue()
+        self._writer = threading.Thread(
+            target=self._writer_loop,
+            name=f"sqlite-writer-{self.db_path}",
+            daemon=True
+        )
+        self._writer.start()
+        
+        # Flush whatever is still queued if the process exits without close()
+        atexit.register(self._close_sync)
+    
+    def _writer_loop(self):
+        """Collect queued rows into batches and commit them"""
+        stopping = False
+        while not stopping:
+            item = self._write_queue.get()
+            rows = []
+            waiters = []
+            deadline = time.monotonic() + self.flush_interval
+            
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                if isinstance(item, _FlushRequest):
+                    waiters.append(item)
+                    break
+                
+                rows.append(item)
+                if len(rows) >= self.batch_size:
+                    break
+                
+                try:
+                    item = self._write_queue.get(
+                        timeout=max(0.0, deadline - time.monotonic())
+                    )
+                except queue.Empty:
+                    break
+            
+            if rows:
+                self._write_rows(rows)
+            
+            # A failure is reported to the first flush after it, however late
+            if waiters:
+                error, self._write_error = self._write_error, None
+                for waiter in waiters:
+                    waiter.resolve(error)
+    
+    def _write_rows(self, rows: List[tuple]) -> None:
+        """Commit a batch; if it fails, commit its rows one by one
+        
+        Only the rows that fail on their own are lost. The first such error
+        is kept in ``_write_error`` until a flush reports it.
+        """
+        try:
+            self._write_batch(rows)
+            return
+        except Exception as e:
+            if len(rows) == 1:
+                self._reject_row(e)
+                return
+            logger.error(f"Failed to write batch of {len(rows)} messages, retrying them one by one: {str(e)}")
+        
+        for row in rows:
+            try:
+                self._write_batch([row])
+            except Exception as e:
+                self._reject_row(e)
+    
+    def _reject_row(self, error: Exception) -> None:
+        """Record a message that could not be stored"""
+        logger.error(f"Failed to store message: {str(error)}")
+        metrics.error("commit")
+        if self._write_error is None:
+            self._write_error = error
+    
+    async def flush(self) -> None:
+        """Wait until all queued messages have been committed
+        
+        Raises the first error that kept a queued message from being stored
+        since the previous flush.
+        """
+        if not self.batch_writes or self._writer is None or not self._writer.is_alive():
+            return
+        
+        with metrics.timer("flush"):
+            request = _FlushRequest(asyncio.get_running_loop())
+            self._write_queue.put_nowait(request)
+            await request.future
+    
+    async def close(self) -> None:
+        """Flush pending writes and close the database"""
+        await asyncio.to_thread(self._close_sync)
+    
+    def _close_sync(self) -> None:
+        """Synchronous version of close; safe to call more than once"""
+        if self._closed:
+            return
+        self._closed = True
+        
+        if self._writer is not None:
+            # Everything queued before the sentinel is still written
+            self._write_queue.put(_STOP)
+            self._writer.join()
+            atexit.unregister(self._close_sync)
+        
+        if self._maintenance is not None:
+            self._stop_maintenance.set()
+            self._maintenance.join()
+        
+        if self._write_executor is not None:
+            self._write_executor.shutdown(wait=True)
+        if self._read_executor is not None:
+            self._read_executor.shutdown(wait=True)
+        
+        with self._readers_lock:
+            for reader in self._readers:
+                reader.close()
+            self._readers = []
+        
+        with self._lock:
+            self._checkpoint_sketches()
+            self.conn.close()
+    
+    def write_generation(self) -> int:
+        """Number of committed changes to the stored messages and rollups"""
+        return self._generation
+    
+    def _reader_conn(self) -> sqlite3.Connection:
+        """Return the read-only connection bound to the calling thread"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            uri = pathlib.Path(self.db_path).absolute().as_uri() + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            conn.execute("PRAGMA query_only=ON")
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+    
+    def _read(self, query, *args):
+        """Run a query function with a read connection for the calling thread"""
+        if not self.read_pool_size:
+            with self._lock:
+                return query(self.conn, *args)
+        return query(self._reader_conn(), *args)
+    
+    async def _run_read(self, query, *args):
+        """Run a query function on the read pool"""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._read_executor,
+            self._read,
+            query,
+            *args
         )
-        self.conn.commit()
     
     async def get_messages(
         self,
         group_id: Optional[int] = None,
         since: Optional[datetime] = None,
-        limit: int = 100
+        limit: int = 100,
+        include_archive: bool = False
     ) -> List[Dict[str, Any]]:
         """Get messages from the SQLite database"""
-        # Run in a thread pool to avoid blocking
-        return await asyncio.to_thread(
-            self._get_messages_sync,
+        # Run on the read pool to avoid blocking
+        return await self._run_read(
+            self._query_messages_with_archive if include_archive else self._query_messages,
             group_id,
             since,
             limit
@@ -146,12 +1719,68 @@ class SQLiteStorage(Storage):
         self,
         group_id: Optional[int] = None,
         since: Optional[datetime] = None,
-        limit: int = 100
+        limit: int = 100,
+        include_archive: bool = False
     ) -> List[Dict[str, Any]]:
         """Synchronous version of get_messages"""
-        cursor = self.conn.cursor()
+        return self._read(
+            self._query_messages_with_archive if include_archive else self._query_messages,
+            group_id,
+            since,
+            limit
+        )
+    
+    def _query_messages_with_archive(
+        self,
+        conn: sqlite3.Connection,
+        group_id: Optional[int],
+        since: Optional[datetime],
+        limit: int
+    ) -> List[Dict[str, Any]]:
+        """Merge live rows with rows from the archive segments covering the window"""
+        rows = self._query_messages(conn, group_id, since, limit)
+        
+        conditions = []
+        params = []
+        if since is not None:
+            conditions.append("end_at > ?")
+            params.append(_epoch(since))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        segments = conn.execute(
+            f"SELECT path, end_at FROM archive_segments {where} ORDER BY start_at DESC",
+            params
+        ).fetchall()
+        
+        since_epoch = _epoch(since) if since is not None else None
+        for path, end_at in segments:
+            # Segments are newest-first; once older ones cannot make the cut, stop
+            if len(rows) >= limit and end_at <= (rows[-1]["sent_at"] or 0):
+                break
+            
+            archived = (
+                row for row in read_segment(path)
+                if (group_id is None or row["group_id"] == group_id)
+                and (since_epoch is None or row["sent_at"] >= since_epoch)
+            )
+            rows = heapq.nlargest(
+                limit,
+                list(rows) + heapq.nlargest(limit, archived, key=_newest_first),
+                key=_newest_first
+            )
         
-        query = "SELECT * FROM messages"
+        return rows
+    
+    def _query_messages(
+        self,
+        conn: sqlite3.Connection,
+        group_id: Optional[int],
+        since: Optional[datetime],
+        limit: int
+    ) -> List[Dict[str, Any]]:
+        """Run the get_messages query on the given connection"""
+        cursor = conn.cursor()
+        
+        query = "SELECT * FROM message_rows"
         params = []
         
         # Add filters
@@ -161,14 +1790,14 @@ class SQLiteStorage(Storage):
             params.append(group_id)
         
         if since is not None:
-            conditions.append("timestamp >= ?")
-            params.append(since.isoformat())
+            conditions.append("sent_at >= ?")
+            params.append(_epoch(since))
         
         if conditions:
             query += " WHERE " + " AND ".join(conditions)
         
         # Add order and limit
-        query += " ORDER BY timestamp DESC LIMIT ?"
+        query += " ORDER BY sent_at DESC, id DESC LIMIT ?"
         params.append(limit)
         
         cursor.execute(query, params)
@@ -177,26 +1806,513 @@ class SQLiteStorage(Storage):
         columns = [col[0] for col in cursor.description]
         return [dict(zip(columns, row)) for row in cursor.fetchall()]
     
+    async def iter_messages(
+        self,
+        group_id: Optional[int] = None,
+        sender_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        after: Optional[Tuple[int, int]] = None,
+        batch_size: int = 1000
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream messages page by page using keyset pagination on (sent_at, id)
+        
+        Each page is a separate short read, so a long export neither holds
+        more than one page in memory nor pins a read transaction open.
+        """
+        while True:
+            page = await self._run_read(
+                self._query_page,
+                group_id,
+                sender_id,
+                since,
+                until,
+                after,
+                batch_size
+            )
+            for row in page:
+                yield row
+            if len(page) < batch_size:
+                break
+            after = (page[-1]["sent_at"], page[-1]["id"])
+    
+    def _query_page(
+        self,
+        conn: sqlite3.Connection,
+        group_id: Optional[int],
+        sender_id: Optional[int],
+        since: Optional[datetime],
+        until: Optional[datetime],
+        after: Optional[Tuple[int, int]],
+        limit: int
+    ) -> List[Dict[str, Any]]:
+        """Fetch one iter_messages page on the given connection"""
+        conditions = ["sent_at IS NOT NULL"]
+        params = []
+        if group_id is not None:
+            conditions.append("group_id = ?")
+            params.append(group_id)
+        if sender_id is not None:
+            conditions.append("sender_id = ?")
+            params.append(sender_id)
+        if since is not None:
+            conditions.append("sent_at >= ?")
+            params.append(_epoch(since))
+        if until is not None:
+            conditions.append("sent_at < ?")
+            params.append(_epoch(until))
+        if after is not None:
+            conditions.append("(sent_at, id) > (?, ?)")
+            params.extend(after)
+        params.append(limit)
+        
+        cursor = conn.execute(
+            f"""
+            SELECT * FROM message_rows
+            WHERE {" AND ".join(conditions)}
+            ORDER BY sent_at, id
+            LIMIT ?
+            """,
+            params
+        )
+        columns = [col[0] for col in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    
+    async def aggregate_window(
+        self,
+        since: datetime,
+        until: Optional[datetime] = None,
+        group_by: str = "group"
+    ) -> List[Dict[str, Any]]:
+        """Aggregate a time window inside the database"""
+        if group_by not in ("group", "sender"):
+            raise ValueError(f"Unsupported group_by: {group_by}")
+        
+        # Run on the read pool to avoid blocking
+        return await self._run_read(
+            self._query_aggregate,
+            since,
+            until,
+            group_by
+        )
+    
+    def _query_aggregate(
+        self,
+        conn: sqlite3.Connection,
+        since: datetime,
+        until: Optional[datetime],
+        group_by: str
+    ) -> List[Dict[str, Any]]:
+        """Run the aggregate_window query on the given connection"""
+        cursor = conn.cursor()
+        
+        conditions = ["sent_at >= ?"]
+        params = [_epoch(since)]
+        if until is not None:
+            conditions.append("sent_at < ?")
+            params.append(_epoch(until))
+        where = " AND ".join(conditions)
+        
+        # The window is a range scan on the covering index; without statistics
+        # the planner would rather walk (group_id, sent_at) to skip the sort.
+        # Names are joined in after aggregation, once per result row.
+        if group_by == "group":
+            # Distinct senders of long windows come from the HyperLogLog sketches
+            end = _epoch(until) if until is not None else int(time.time()) + 1
+            exact = end - params[0] <= HLL_EXACT_MAX_SECONDS
+            cursor.execute(
+                f"""
+                SELECT w.group_id, g.name, w.message_count, w.unique_users, w.media_count
+                FROM (
+                    SELECT group_id, COUNT(*) AS message_count,
+                        {"COUNT(DISTINCT sender_id)" if exact else "NULL"} AS unique_users,
+                        SUM(has_media != 0) AS media_count
+                    FROM messages INDEXED BY idx_messages_window
+                    WHERE {where}
+                    GROUP BY group_id
+                ) w
+                LEFT JOIN groups g ON g.group_id = w.group_id
+                ORDER BY w.message_count DESC
+                """,
+                params
+            )
+            rows = cursor.fetchall()
+            if not exact:
+                unique = self._query_unique_senders(conn, params[0], end, None, False)
+                rows = [(*row[:3], unique.get(row[0], 0), row[4]) for row in rows]
+            return [
+                {
+                    "group_id": row[0],
+                    "group_name": row[1],
+                    "message_count": row[2],
+                    "unique_users": row[3],
+                    "media_count": row[4]
+                }
+                for row in rows
+            ]
+        
+        cursor.execute(
+            f"""
+            SELECT w.sender_id, s.name, w.message_count, w.group_count, w.media_count
+            FROM (
+                SELECT sender_id, COUNT(*) AS message_count,
+                    COUNT(DISTINCT group_id) AS group_count,
+                    SUM(has_media != 0) AS media_count
+                FROM messages INDEXED BY idx_messages_window
+                WHERE {where} AND sender_id IS NOT NULL
+                GROUP BY sender_id
+            ) w
+            LEFT JOIN senders s ON s.sender_id = w.sender_id
+            ORDER BY w.message_count DESC
+            """,
+            params
+        )
+        return [
+            {
+                "sender_id": row[0],
+                "sender_name": row[1],
+                "message_count": row[2],
+                "group_count": row[3],
+                "media_count": row[4]
+            }
+            for row in cursor.fetchall()
+        ]
+    
+    async def unique_senders(
+        self,
+        since: datetime,
+        until: Optional[datetime] = None,
+        group_id: Optional[int] = None,
+        exact: Optional[bool] = None
+    ) -> Dict[int, int]:
+        """Get the number of distinct senders per group for a time window"""
+        return await self._run_read(
+            self._query_unique_senders,
+            _epoch(since),
+            _epoch(until) if until is not None else int(time.time()) + 1,
+            group_id,
+            exact
+        )
+    
+    def _query_unique_senders(
+        self,
+        conn: sqlite3.Connection,
+        start: int,
+        end: int,
+        group_id: Optional[int],
+        exact: Optional[bool]
+    ) -> Dict[int, int]:
+        """Count distinct senders per group for [start, end) in epoch seconds
+        
+        An estimate merges the sketches of the whole hours inside the window
+        and adds the senders of the partial hours at either end one by one, so
+        it covers exactly the window.
+        """
+        first_full = -(-start // HLL_BUCKET_SECONDS) * HLL_BUCKET_SECONDS
+        last_full = end - end % HLL_BUCKET_SECONDS
+        if exact is None:
+            exact = end - start <= HLL_EXACT_MAX_SECONDS
+        
+        group_filter = " AND group_id = ?" if group_id is not None else ""
+        group_params = [group_id] if group_id is not None else []
+        
+        if exact or first_full >= last_full:
+            cursor = conn.execute(
+                f"""
+                SELECT group_id, COUNT(DISTINCT sender_id)
+                FROM messages INDEXED BY idx_messages_window
+                WHERE sent_at >= ? AND sent_at < ? AND sender_id IS NOT NULL{group_filter}
+                GROUP BY group_id
+                """,
+                [start, end, *group_params]
+            )
+            return dict(cursor.fetchall())
+        
+        sketches = {}
+        cursor = conn.execute(
+            f"""
+            SELECT group_id, registers FROM sender_hll
+            WHERE bucket_start >= ? AND bucket_start < ?{group_filter}
+            """,
+            [first_full, last_full, *group_params]
+        )
+        for gid, registers in cursor:
+            hll = HyperLogLog.from_bytes(registers)
+            if gid in sketches:
+                sketches[gid].merge(hll)
+            else:
+                sketches[gid] = hll
+        
+        for edge_start, edge_end in ((start, first_full), (last_full, end)):
+            cursor = conn.execute(
+                f"""
+                SELECT group_id, sender_id
+                FROM messages INDEXED BY idx_messages_window
+                WHERE sent_at >= ? AND sent_at < ? AND sender_id IS NOT NULL{group_filter}
+                """,
+                [edge_start, edge_end, *group_params]
+            )
+            for gid, sender_id in cursor:
+                hll = sketches.get(gid)
+                if hll is None:
+                    hll = sketches[gid] = HyperLogLog()
+                hll.add(sender_id)
+        
+        return {gid: hll.count() for gid, hll in sketches.items()}
+    
+    async def top_senders(
+        self,
+        since: datetime,
+        until: Optional[datetime] = None,
+        group_id: Optional[int] = None,
+        limit: int = 10
+    ) -> Dict[int, List[Dict[str, Any]]]:
+        """Get the most active senders per group from the sketches
+        
+        The window is widened to 5-minute bucket boundaries and cannot reach
+        back more than 24 hours.
+        """
+        return await self._run_read(
+            self._query_top_senders,
+            since,
+            until,
+            group_id,
+            limit
+        )
+    
+    def _query_top_senders(
+        self,
+        conn: sqlite3.Connection,
+        since: datetime,
+        until: Optional[datetime],
+        group_id: Optional[int],
+        limit: int
+    ) -> Dict[int, List[Dict[str, Any]]]:
+        """Merge the sketches for the window and look up the senders' names"""
+        top = self.sender_sketches.top(
+            _epoch(since),
+            _epoch(until) if until is not None else None,
+            group_id,
+            limit
+        )
+        sender_ids = [sender_id for entry in top.values() for sender_id, _, _ in entry["top"]]
+        names = dict(conn.execute(
+            "SELECT sender_id, name FROM senders WHERE sender_id IN (SELECT value FROM json_each(?))",
+            (json.dumps(sender_ids),)
+        ).fetchall())
+        
+        return {
+            gid: [
+                {
+                    "sender_id": sender_id,
+                    "sender_name": names.get(sender_id),
+                    "message_count": count,
+                    "max_error": error
+                }
+                for sender_id, count, error in entry["top"]
+            ]
+            for gid, entry in top.items()
+        }
+    
+    async def cross_posts(
+        self,
+        since: datetime,
+        until: Optional[datetime] = None,
+        limit: int = 10
+    ) -> List[Dict[str, Any]]:
+        """Get reposted texts from the contents table
+        
+        Texts shorter than ``CROSS_POST_MIN_LENGTH`` are ignored and previews
+        are cut to ``CROSS_POST_PREVIEW_LENGTH`` characters. Counts cover the
+        live table, not archived messages.
+        """
+        # Run on the read pool to avoid blocking
+        return await self._run_read(
+            self._query_cross_posts,
+            since,
+            until,
+            limit
+        )
+    
+    def _query_cross_posts(
+        self,
+        conn: sqlite3.Connection,
+        since: datetime,
+        until: Optional[datetime],
+        limit: int
+    ) -> List[Dict[str, Any]]:
+        """Count the copies of every text posted in the window, through idx_messages_content"""
+        rows = conn.execute(
+            '''
+            WITH posted AS (
+                SELECT DISTINCT content_hash AS hash FROM messages
+                WHERE sent_at >= ? AND sent_at < ? AND content_hash IS NOT NULL
+            )
+            SELECT c.hash, substr(c.content, 1, ?), COUNT(DISTINCT m.group_id) AS group_count,
+                COUNT(*) AS message_count,
+                strftime('%Y-%m-%dT%H:%M:%S+00:00', MIN(m.sent_at), 'unixepoch')
+            FROM posted p
+            JOIN contents c ON c.hash = p.hash
+            JOIN messages m ON m.content_hash = p.hash
+            WHERE length(c.content) >= ?
+            GROUP BY c.hash
+            HAVING group_count > 1
+            ORDER BY group_count DESC, message_count DESC
+            LIMIT ?
+            ''',
+            (
+                _epoch(since),
+                _epoch(until) if until is not None else int(time.time()) + 1,
+                CROSS_POST_PREVIEW_LENGTH,
+                CROSS_POST_MIN_LENGTH,
+                limit
+            )
+        ).fetchall()
+        
+        results = []
+        for key, preview, group_count, message_count, first_seen in rows:
+            groups = conn.execute(
+                '''
+                SELECT m.group_id, g.name, COUNT(*) AS message_count
+                FROM messages m
+                LEFT JOIN groups g ON g.group_id = m.group_id
+                WHERE m.content_hash = ?
+                GROUP BY m.group_id
+                ORDER BY message_count DESC
+                ''',
+                (key,)
+            ).fetchall()
+            results.append({
+                "preview": preview,
+                "group_count": group_count,
+                "message_count": message_count,
+                "first_seen": first_seen,
+                "groups": [
+                    {"group_id": row[0], "group_name": row[1], "message_count": row[2]}
+                    for row in groups
+                ]
+            })
+        return results
+    
+    async def search(
+        self,
+        query: str,
+        group_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Search message content with FTS5, best matches first"""
+        if not self.fts:
+            raise RuntimeError("Full-text search is not enabled")
+        
+        after = None
+        if cursor:
+            try:
+                after = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            except Exception:
+                raise ValueError("Invalid cursor")
+        
+        # Run on the read pool to avoid blocking
+        return await self._run_read(
+            self._query_search,
+            query,
+            group_id,
+            since,
+            limit,
+            after
+        )
+    
+    def _query_search(
+        self,
+        conn: sqlite3.Connection,
+        query: str,
+        group_id: Optional[int],
+        since: Optional[datetime],
+        limit: int,
+        after: Optional[List[float]]
+    ) -> Dict[str, Any]:
+        """Run the search query on the given connection
+        
+        Pages are keyset-paginated on (rank, id), so the cursor is the last
+        hit's rank and id rather than an offset. The index holds each distinct
+        text once; every message posting a matching text is a hit.
+        """
+        conditions = ["messages_fts MATCH ?"]
+        params = [query]
+        if group_id is not None:
+            conditions.append("m.group_id = ?")
+            params.append(group_id)
+        if since is not None:
+            conditions.append("m.sent_at >= ?")
+            params.append(_epoch(since))
+        if after is not None:
+            conditions.append("(messages_fts.rank > ? OR (messages_fts.rank = ? AND m.id > ?))")
+            params.extend([after[0], after[0], after[1]])
+        params.append(limit)
+        
+        try:
+            rows = conn.execute(
+                f"""
+                SELECT m.id, m.group_id, g.name, m.sender_id, s.name, m.message_id,
+                    strftime('%Y-%m-%dT%H:%M:%S+00:00', m.sent_at, 'unixepoch'),
+                    messages_fts.rank,
+                    snippet(messages_fts, 0, '<b>', '</b>', '…', 16)
+                FROM messages_fts
+                JOIN messages m ON m.content_hash = messages_fts.rowid
+                LEFT JOIN groups g ON g.group_id = m.group_id
+                LEFT JOIN senders s ON s.sender_id = m.sender_id
+                WHERE {" AND ".join(conditions)}
+                ORDER BY messages_fts.rank, m.id
+                LIMIT ?
+                """,
+                params
+            ).fetchall()
+        except sqlite3.OperationalError as e:
+            raise ValueError(f"Invalid search query: {str(e)}")
+        
+        results = [
+            {
+                "id": row[0],
+                "group_id": row[1],
+                "group_name": row[2],
+                "sender_id": row[3],
+                "sender_name": row[4],
+                "message_id": row[5],
+                "timestamp": row[6],
+                "score": -row[7],
+                "snippet": row[8]
+            }
+            for row in rows
+        ]
+        
+        next_cursor = None
+        if len(rows) == limit:
+            last = rows[-1]
+            next_cursor = base64.urlsafe_b64encode(json.dumps([last[7], last[0]]).encode()).decode()
+        
+        return {"results": results, "next_cursor": next_cursor}
+    
     async def get_stats(self) -> Dict[str, Any]:
         """Get statistics about stored messages"""
-        # Run in a thread pool to avoid blocking
-        return await asyncio.to_thread(self._get_stats_sync)
+        # Run on the read pool to avoid blocking
+        return await self._run_read(self._query_stats)
     
     def _get_stats_sync(self) -> Dict[str, Any]:
         """Synchronous version of get_stats"""
-        cursor = self.conn.cursor()
-        
-        # Get total message count
-        cursor.execute("SELECT COUNT(*) FROM messages")
-        total_messages = cursor.fetchone()[0]
+        return self._read(self._query_stats)
+    
+    def _query_stats(self, conn: sqlite3.Connection) -> Dict[str, Any]:
+        """Answer get_stats from the rollup tables"""
+        cursor = conn.cursor()
         
         # Get message count per group
         cursor.execute(
             """
-            SELECT group_id, group_name, COUNT(*) as count
-            FROM messages
-            GROUP BY group_id
-            ORDER BY count DESC
+            SELECT r.group_id, g.name, r.message_count
+            FROM group_rollup r
+            LEFT JOIN groups g ON g.group_id = r.group_id
+            ORDER BY r.message_count DESC
             """
         )
         groups = [
@@ -204,14 +2320,16 @@ class SQLiteStorage(Storage):
             for row in cursor.fetchall()
         ]
         
+        # Total message count is the sum over groups
+        total_messages = sum(group["message_count"] for group in groups)
+        
         # Get most active users
         cursor.execute(
             """
-            SELECT sender_id, sender_name, COUNT(*) as count
-            FROM messages
-            WHERE sender_id IS NOT NULL
-            GROUP BY sender_id
-            ORDER BY count DESC
+            SELECT r.sender_id, s.name, r.message_count
+            FROM sender_rollup r
+            LEFT JOIN senders s ON s.sender_id = r.sender_id
+            ORDER BY r.message_count DESC
             LIMIT 10
             """
         )
@@ -220,26 +2338,69 @@ class SQLiteStorage(Storage):
             for row in cursor.fetchall()
         ]
         
-        # Get recent activity (last 24 hours)
+        # Get recent activity (last 24 hours, at bucket granularity)
+        since = int(time.time()) - 24 * 60 * 60
         cursor.execute(
             """
-            SELECT COUNT(*) FROM messages
-            WHERE timestamp >= datetime('now', '-1 day')
-            """
+            SELECT COALESCE(SUM(message_count), 0) FROM activity_rollup
+            WHERE bucket_start >= ?
+            """,
+            (since - since % ROLLUP_BUCKET_SECONDS,)
         )
         recent_activity = cursor.fetchone()[0]
         
+        # Most active users per group over the last hour, from the sketches
+        recent_top_users = self._query_top_senders(
+            conn, datetime.now(timezone.utc) - timedelta(hours=1), None, None, 5
+        )
+        
         return {
             "total_messages": total_messages,
             "groups": groups,
             "top_users": users,
-            "recent_activity": recent_activity
+            "recent_activity": recent_activity,
+            "top_users_last_hour": recent_top_users
         }
 
 def get_storage(storage_type: str = "sqlite", **kwargs) -> Storage:
-    """Factory function to get a storage instance"""
-    if storage_type.lower() == "sqlite":
-        db_path = kwargs.get("db_path", "telegram_monitor.db")
-        return SQLiteStorage(db_path)
-    else:
+    """Factory function to get a storage instance
+    
+    Opening a database written by an older version upgrades its schema
+    first, which may copy the whole messages table; see ``open_storage``.
+    """
+    storage_type = storage_type.lower()
+    if storage_type == "tiered":
+        # Imported here because the tiered storage builds on this module
+        from database.tiered import MemoryHotTier, RedisHotTier, TieredStorage
+        redis_url = kwargs.get("redis_url")
+        hot = RedisHotTier.from_url(redis_url) if redis_url else MemoryHotTier()
+        return TieredStorage(
+            get_storage("sqlite", **kwargs),
+            hot,
+            hot_hours=kwargs.get("hot_hours", 6),
+            drain_interval=kwargs.get("drain_interval", 1.0),
+            drain_batch=kwargs.get("drain_batch", 1000)
+        )
+    if storage_type != "sqlite":
         raise ValueError(f"Unsupported storage type: {storage_type}")
+    
+    db_path = kwargs.get("db_path", "telegram_monitor.db")
+    return SQLiteStorage(
+        db_path,
+        batch_writes=kwargs.get("batch_writes", False),
+        batch_size=kwargs.get("batch_size", 500),
+        flush_interval=kwargs.get("flush_interval", 0.05),
+        read_pool_size=kwargs.get("read_pool_size"),
+        fts=kwargs.get("fts", False),
+        retention_days=kwargs.get("retention_days"),
+        archive_dir=kwargs.get("archive_dir"),
+        maintenance_interval=kwargs.get("maintenance_interval", 3600)
+    )
+
+async def open_storage(storage_type: str = "sqlite", **kwargs) -> Storage:
+    """get_storage for async code: the storage is built on a worker thread
+    
+    A schema upgrade can take minutes on a large database, and the event
+    loop keeps running meanwhile.
+    """
+    return await asyncio.to_thread(get_storage, storage_type, **kwargs)
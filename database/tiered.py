@@ -0,0 +1,814 @@
+# Tiered storage: recent messages and counters in a hot tier in front of SQLite
+import asyncio
+import bisect
+import heapq
+import itertools
+import json
+import logging
+import sqlite3
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+
+from database.storage import ROLLUP_BUCKET_SECONDS, Storage, _epoch
+
+logger = logging.getLogger(__name__)
+
+# Activity buckets older than this are dropped; get_stats only sums the last day
+ACTIVITY_SECONDS = 24 * 60 * 60
+
+# Entries per command when a snapshot is written to Redis
+REDIS_CHUNK = 10000
+
+def _key(row: Dict[str, Any]) -> Tuple[int, int]:
+    """(group_id, message_id) of a message row, the key duplicates are detected by"""
+    return (row["group_id"], row["message_id"])
+
+def _hot_row(
+    group_id: int,
+    group_name: str,
+    sender_id: Optional[int],
+    sender_name: Optional[str],
+    message_id: int,
+    content: str,
+    timestamp: datetime,
+    has_media: bool
+) -> Dict[str, Any]:
+    """Build a message row shaped like SQLiteStorage's, without an id yet"""
+    sent_at = _epoch(timestamp)
+    return {
+        "id": None,
+        "group_id": group_id,
+        "group_name": group_name,
+        "sender_id": sender_id,
+        "sender_name": sender_name,
+        "message_id": message_id,
+        "content": content,
+        "timestamp": datetime.fromtimestamp(sent_at, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S+00:00"),
+        "has_media": int(bool(has_media)),
+        "sent_at": sent_at,
+        "ingested_at": int(time.time())
+    }
+
+def _store_args(row: Dict[str, Any]) -> Dict[str, Any]:
+    """store_message arguments for a message row"""
+    return {
+        "group_id": row["group_id"],
+        "group_name": row["group_name"],
+        "sender_id": row["sender_id"],
+        "sender_name": row["sender_name"],
+        "message_id": row["message_id"],
+        "content": row["content"],
+        "timestamp": datetime.fromtimestamp(row["sent_at"], timezone.utc),
+        "has_media": bool(row["has_media"])
+    }
+
+def _is_transient(error: Exception) -> bool:
+    """Whether a cold-store failure may go away on retry (locked or full database, I/O errors)"""
+    return isinstance(error, (sqlite3.OperationalError, OSError, asyncio.TimeoutError))
+
+def _bucket(sent_at: int) -> int:
+    return sent_at - sent_at % ROLLUP_BUCKET_SECONDS
+
+def _tally(rows: List[Dict[str, Any]]) -> Tuple[Dict[int, list], Dict[int, list], Counter]:
+    """Group [name, count, media], sender [name, count] and activity counts of rows"""
+    groups = {}
+    senders = {}
+    activity = Counter()
+    for row in rows:
+        group = groups.setdefault(row["group_id"], [None, 0, 0])
+        group[0] = row["group_name"]
+        group[1] += 1
+        group[2] += row["has_media"]
+        if row["sender_id"] is not None:
+            sender = senders.setdefault(row["sender_id"], [None, 0])
+            sender[0] = row["sender_name"]
+            sender[1] += 1
+        activity[_bucket(row["sent_at"])] += 1
+    return groups, senders, activity
+
+def _top_senders(rows: List[Dict[str, Any]], limit: int) -> Dict[int, List[Dict[str, Any]]]:
+    """Exact top senders per group of rows given newest first"""
+    counts = {}
+    names = {}
+    for row in rows:
+        if row["sender_id"] is None:
+            continue
+        counts.setdefault(row["group_id"], Counter())[row["sender_id"]] += 1
+        names.setdefault(row["sender_id"], row["sender_name"])
+    return {
+        group_id: [
+            {"sender_id": sender_id, "sender_name": names[sender_id], "message_count": count, "max_error": 0}
+            for sender_id, count in counter.most_common(limit)
+        ]
+        for group_id, counter in counts.items()
+    }
+
+class HotTier:
+    """Interface of the fast store in front of SQLite
+
+    A hot tier holds three things: recent message rows, keyed by
+    (group_id, message_id) and ordered by ``sent_at``; the drain queue of rows
+    not yet written to SQLite; and counters mirroring SQLite's rollups.
+    """
+
+    async def queue(self, rows: List[Dict[str, Any]]) -> None:
+        """Append rows to the drain queue"""
+        raise NotImplementedError
+
+    async def pending(self, limit: int) -> List[Dict[str, Any]]:
+        """Get the oldest queued rows, leaving them queued"""
+        raise NotImplementedError
+
+    async def ack(self, count: int) -> None:
+        """Remove the oldest count rows from the drain queue"""
+        raise NotImplementedError
+
+    async def dead_letter(self, rows: List[Dict[str, Any]]) -> None:
+        """Keep rows the cold store rejected, for inspection"""
+        raise NotImplementedError
+
+    async def dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Get the oldest rows the cold store rejected"""
+        raise NotImplementedError
+
+    async def insert(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Store the rows whose key is not stored yet; returns those rows"""
+        raise NotImplementedError
+
+    async def count(self, rows: List[Dict[str, Any]]) -> None:
+        """Add rows to the group, sender and activity counters"""
+        raise NotImplementedError
+
+    async def messages(
+        self,
+        group_id: Optional[int] = None,
+        since: Optional[int] = None,
+        limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Get stored rows sent at or after the epoch since, newest first"""
+        raise NotImplementedError
+
+    async def expire(self, before: int) -> None:
+        """Drop rows sent before an epoch, and activity counts older than a day"""
+        raise NotImplementedError
+
+    async def counters(self, activity_since: int) -> Dict[str, Any]:
+        """Get the counters
+
+        ``groups`` holds (group_id, name, message_count, media_count),
+        ``top_senders`` the ten (sender_id, name, message_count) with the
+        highest count and ``recent_activity`` the number of messages in
+        activity buckets starting at or after ``activity_since``.
+        """
+        raise NotImplementedError
+
+    async def load(self, snapshot: Dict[str, Any]) -> None:
+        """Replace the counters with a ``Storage.rollup_snapshot``"""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        """Release resources"""
+        pass
+
+class MemoryHotTier(HotTier):
+    """Hot tier in process memory
+
+    Rows live in lists sorted by ``(sent_at, sequence)``, one over all groups
+    and one per group, so a recent window is a bisect and a slice. Nothing
+    survives a restart: the queue is lost with the process, so this tier
+    suits a single bot process and tests.
+    """
+
+    def __init__(self):
+        self._queue = deque()
+        self._dead = []
+        self._timeline = []  # (sent_at, sequence, row), oldest first
+        self._group_timelines = {}  # group_id -> timeline of that group
+        self._keys = set()
+        self._sequence = itertools.count()
+        self.groups = {}  # group_id -> [name, message_count, media_count]
+        self.senders = {}  # sender_id -> [name, message_count]
+        self.activity = Counter()  # bucket_start -> message_count
+
+    async def queue(self, rows: List[Dict[str, Any]]) -> None:
+        self._queue.extend(rows)
+
+    async def pending(self, limit: int) -> List[Dict[str, Any]]:
+        return list(itertools.islice(self._queue, limit))
+
+    async def ack(self, count: int) -> None:
+        for _ in range(min(count, len(self._queue))):
+            self._queue.popleft()
+
+    async def dead_letter(self, rows: List[Dict[str, Any]]) -> None:
+        self._dead.extend(rows)
+
+    async def dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        return self._dead[:limit]
+
+    async def insert(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        new = []
+        for row in rows:
+            key = _key(row)
+            if key in self._keys:
+                continue
+            self._keys.add(key)
+            # Rows mostly arrive in send order, so insort appends at the end
+            entry = (row["sent_at"], next(self._sequence), row)
+            bisect.insort(self._timeline, entry)
+            bisect.insort(self._group_timelines.setdefault(row["group_id"], []), entry)
+            new.append(row)
+        return new
+
+    async def count(self, rows: List[Dict[str, Any]]) -> None:
+        groups, senders, activity = _tally(rows)
+        for group_id, (name, count, media) in groups.items():
+            group = self.groups.setdefault(group_id, [name, 0, 0])
+            group[0] = name
+            group[1] += count
+            group[2] += media
+        for sender_id, (name, count) in senders.items():
+            sender = self.senders.setdefault(sender_id, [name, 0])
+            sender[0] = name
+            sender[1] += count
+        self.activity.update(activity)
+
+    async def messages(
+        self,
+        group_id: Optional[int] = None,
+        since: Optional[int] = None,
+        limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        timeline = self._timeline if group_id is None else self._group_timelines.get(group_id, [])
+        start = 0 if since is None else bisect.bisect_left(timeline, (since,))
+        if limit is not None:
+            start = max(start, len(timeline) - limit)
+        return [dict(entry[2]) for entry in reversed(timeline[start:])]
+
+    async def expire(self, before: int) -> None:
+        cut = bisect.bisect_left(self._timeline, (before,))
+        for _, _, row in self._timeline[:cut]:
+            self._keys.discard(_key(row))
+        del self._timeline[:cut]
+        for group_id, timeline in list(self._group_timelines.items()):
+            del timeline[:bisect.bisect_left(timeline, (before,))]
+            if not timeline:
+                del self._group_timelines[group_id]
+
+        oldest = _bucket(int(time.time()) - ACTIVITY_SECONDS)
+        for bucket_start in [b for b in self.activity if b < oldest]:
+            del self.activity[bucket_start]
+
+    async def counters(self, activity_since: int) -> Dict[str, Any]:
+        top = heapq.nlargest(10, self.senders.items(), key=lambda item: item[1][1])
+        return {
+            "groups": [(group_id, name, count, media) for group_id, (name, count, media) in self.groups.items()],
+            "top_senders": [(sender_id, name, count) for sender_id, (name, count) in top],
+            "recent_activity": sum(
+                count for bucket_start, count in self.activity.items() if bucket_start >= activity_since
+            )
+        }
+
+    async def load(self, snapshot: Dict[str, Any]) -> None:
+        self.groups = {group_id: [name, count, media] for group_id, name, count, media in snapshot["groups"]}
+        self.senders = {sender_id: [name, count] for sender_id, name, count in snapshot["senders"]}
+        self.activity = Counter(dict(snapshot["activity"]))
+
+class RedisHotTier(HotTier):
+    """Hot tier in a Redis-protocol server (Redis, Valkey, KeyDB, ...)
+
+    ``client`` is a ``redis.asyncio`` client created with
+    ``decode_responses=True``, or anything with the same interface. Every
+    row is a JSON string key, listed in sorted sets by send time (one over
+    all groups, one per group); the drain queue is a list and the counters
+    are hashes plus a sorted set of sender counts. All keys start with
+    ``prefix``. Since the queue lives in the server, rows accepted before a
+    crash of the bot are drained when it starts again.
+    """
+
+    def __init__(self, client, prefix: str = "telegram_monitor:"):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, prefix: str = "telegram_monitor:") -> "RedisHotTier":
+        """Connect to a server, e.g. ``redis://localhost:6379/0``"""
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("The Redis hot tier needs the redis package: pip install redis")
+        return cls(redis.Redis.from_url(url, decode_responses=True), prefix)
+
+    def _name(self, *parts) -> str:
+        return self.prefix + ":".join(str(part) for part in parts)
+
+    async def queue(self, rows: List[Dict[str, Any]]) -> None:
+        if rows:
+            await self.client.rpush(self._name("pending"), *[json.dumps(row) for row in rows])
+
+    async def pending(self, limit: int) -> List[Dict[str, Any]]:
+        values = await self.client.lrange(self._name("pending"), 0, limit - 1)
+        return [json.loads(value) for value in values]
+
+    async def ack(self, count: int) -> None:
+        await self.client.ltrim(self._name("pending"), count, -1)
+
+    async def dead_letter(self, rows: List[Dict[str, Any]]) -> None:
+        if rows:
+            await self.client.rpush(self._name("dead"), *[json.dumps(row) for row in rows])
+
+    async def dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        values = await self.client.lrange(self._name("dead"), 0, limit - 1)
+        return [json.loads(value) for value in values]
+
+    async def insert(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not rows:
+            return []
+
+        # SET NX decides which rows are new, atomically across bot processes
+        pipe = self.client.pipeline(transaction=False)
+        for row in rows:
+            pipe.set(self._name("message", row["group_id"], row["message_id"]), json.dumps(row), nx=True)
+        created = await pipe.execute()
+        new = [row for row, ok in zip(rows, created) if ok]
+
+        pipe = self.client.pipeline(transaction=False)
+        for row in new:
+            member = f"{row['group_id']}:{row['message_id']}"
+            pipe.zadd(self._name("timeline"), {member: row["sent_at"]})
+            pipe.zadd(self._name("timeline", row["group_id"]), {member: row["sent_at"]})
+        await pipe.execute()
+        return new
+
+    async def count(self, rows: List[Dict[str, Any]]) -> None:
+        if not rows:
+            return
+        groups, senders, activity = _tally(rows)
+        pipe = self.client.pipeline(transaction=False)
+        for group_id, (name, count, media) in groups.items():
+            pipe.hset(self._name("group_names"), group_id, json.dumps(name))
+            pipe.hincrby(self._name("group_counts"), group_id, count)
+            pipe.hincrby(self._name("group_media"), group_id, media)
+        for sender_id, (name, count) in senders.items():
+            pipe.hset(self._name("sender_names"), sender_id, json.dumps(name))
+            pipe.zincrby(self._name("sender_counts"), count, sender_id)
+        for bucket_start, count in activity.items():
+            pipe.hincrby(self._name("activity"), bucket_start, count)
+        await pipe.execute()
+
+    async def messages(
+        self,
+        group_id: Optional[int] = None,
+        since: Optional[int] = None,
+        limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        timeline = self._name("timeline") if group_id is None else self._name("timeline", group_id)
+        page = {} if limit is None else {"start": 0, "num": limit}
+        members = await self.client.zrevrangebyscore(
+            timeline, "+inf", "-inf" if since is None else since, **page
+        )
+        if not members:
+            return []
+        values = await self.client.mget([self._name("message", member) for member in members])
+        # A row expired between the two commands is simply left out
+        return [json.loads(value) for value in values if value is not None]
+
+    async def expire(self, before: int) -> None:
+        members = await self.client.zrangebyscore(self._name("timeline"), "-inf", f"({before}")
+        pipe = self.client.pipeline(transaction=False)
+        for member in members:
+            group_id = member.split(":", 1)[0]
+            pipe.zrem(self._name("timeline", group_id), member)
+            pipe.delete(self._name("message", member))
+        pipe.zremrangebyscore(self._name("timeline"), "-inf", f"({before}")
+        await pipe.execute()
+
+        oldest = _bucket(int(time.time()) - ACTIVITY_SECONDS)
+        expired = [b for b in await self.client.hkeys(self._name("activity")) if int(b) < oldest]
+        if expired:
+            await self.client.hdel(self._name("activity"), *expired)
+
+    async def counters(self, activity_since: int) -> Dict[str, Any]:
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hgetall(self._name("group_names"))
+        pipe.hgetall(self._name("group_counts"))
+        pipe.hgetall(self._name("group_media"))
+        pipe.zrevrange(self._name("sender_counts"), 0, 9, withscores=True)
+        pipe.hgetall(self._name("activity"))
+        names, counts, media, top, activity = await pipe.execute()
+        sender_names = await self.client.hmget(self._name("sender_names"), [member for member, _ in top]) if top else []
+
+        return {
+            "groups": [
+                (int(group_id), json.loads(names.get(group_id, "null")), int(count), int(media.get(group_id, 0)))
+                for group_id, count in counts.items()
+            ],
+            "top_senders": [
+                (int(member), json.loads(name) if name is not None else None, int(score))
+                for (member, score), name in zip(top, sender_names)
+            ],
+            "recent_activity": sum(
+                int(count) for bucket_start, count in activity.items() if int(bucket_start) >= activity_since
+            )
+        }
+
+    async def load(self, snapshot: Dict[str, Any]) -> None:
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(*[
+            self._name(name)
+            for name in ("group_names", "group_counts", "group_media", "sender_names", "sender_counts", "activity")
+        ])
+        groups = snapshot["groups"]
+        senders = snapshot["senders"]
+        for start in range(0, len(groups), REDIS_CHUNK):
+            chunk = groups[start:start + REDIS_CHUNK]
+            pipe.hset(self._name("group_names"), mapping={g: json.dumps(name) for g, name, _, _ in chunk})
+            pipe.hset(self._name("group_counts"), mapping={g: count for g, _, count, _ in chunk})
+            pipe.hset(self._name("group_media"), mapping={g: media for g, _, _, media in chunk})
+        for start in range(0, len(senders), REDIS_CHUNK):
+            chunk = senders[start:start + REDIS_CHUNK]
+            pipe.hset(self._name("sender_names"), mapping={s: json.dumps(name) for s, name, _ in chunk})
+            pipe.zadd(self._name("sender_counts"), {s: count for s, _, count in chunk})
+        if snapshot["activity"]:
+            pipe.hset(self._name("activity"), mapping=dict(snapshot["activity"]))
+        await pipe.execute()
+
+    async def close(self) -> None:
+        close = getattr(self.client, "aclose", None) or self.client.close
+        await close()
+
+class TieredStorage(Storage):
+    """Storage answering recent reads from a hot tier and keeping everything in SQLite
+
+    Every accepted message goes to the hot tier's drain queue and, when it
+    was sent within the last ``hot_hours``, into the hot tier itself. A
+    background task writes queued rows to ``cold`` every ``drain_interval``
+    seconds, ``drain_batch`` at a time. The hot tier's counters are seeded
+    from the cold store's rollups on first use and then counted along with
+    every new message, so ``get_stats`` and ``get_messages`` for a recent
+    window never touch the disk. Every other read first drains the queue and
+    is then answered by the cold store; when draining fails, the error is
+    logged and the read is answered without the rows still queued.
+
+    Rows the cold store rejects outright, e.g. text SQLite cannot encode, are
+    moved to the hot tier's ``dead_letters`` and counted in ``rejected``.
+    They stay in the hot tier's counters until the next start reseeds them.
+
+    Duplicates are recognised by (group_id, message_id) as in SQLite: in the
+    hot tier for recent messages, and in the queue and the cold store's
+    index for older ones, e.g. from a backfill. Rows served from the hot
+    tier have an ``id`` of None when they were stored by this process.
+    """
+
+    def __init__(
+        self,
+        cold: Storage,
+        hot: HotTier,
+        hot_hours: float = 6,
+        drain_interval: float = 1.0,
+        drain_batch: int = 1000
+    ):
+        # get_stats reads the last hour's messages from the hot tier
+        if hot_hours < 1:
+            raise ValueError("hot_hours must be at least 1")
+        self.cold = cold
+        self.hot = hot
+        self.hot_seconds = int(hot_hours * 60 * 60)
+        self.drain_interval = drain_interval
+        self.drain_batch = max(1, drain_batch)
+
+        self._pending_keys = set()  # keys queued but not yet drained
+        self.rejected = 0  # rows moved to the dead letters by this process
+        self.last_drain_error = None
+        self._generation = 0
+        self._started = False
+        self._closed = False
+        self._start_lock = asyncio.Lock()
+        self._drain_lock = asyncio.Lock()
+        self._drain_task = None
+
+    async def _start(self) -> None:
+        """Seed the hot tier and start draining, once"""
+        if self._started:
+            return
+        async with self._start_lock:
+            if self._started:
+                return
+            if self._closed:
+                raise RuntimeError("Storage is closed")
+
+            # Rows a previous run queued but never drained go first
+            try:
+                await self._drain_all()
+            except Exception as e:
+                logger.error(f"Error draining the hot tier: {str(e)}")
+            await self.hot.load(await self.cold.rollup_snapshot())
+
+            since = int(time.time()) - self.hot_seconds
+            await self.hot.expire(since)
+            rows = []
+            async for row in self.cold.iter_messages(since=datetime.fromtimestamp(since, timezone.utc)):
+                rows.append(row)
+                if len(rows) >= self.drain_batch:
+                    await self.hot.insert(rows)
+                    rows = []
+            await self.hot.insert(rows)
+
+            self._drain_task = asyncio.create_task(self._drain_loop())
+            self._started = True
+
+    async def store_message(
+        self,
+        group_id: int,
+        group_name: str,
+        sender_id: Optional[int],
+        sender_name: Optional[str],
+        message_id: int,
+        content: str,
+        timestamp: datetime,
+        has_media: bool
+    ) -> None:
+        """Store a message in the hot tier and queue it for SQLite"""
+        await self.store_messages([{
+            "group_id": group_id,
+            "group_name": group_name,
+            "sender_id": sender_id,
+            "sender_name": sender_name,
+            "message_id": message_id,
+            "content": content,
+            "timestamp": timestamp,
+            "has_media": has_media
+        }])
+
+    async def store_messages(self, messages: List[Dict[str, Any]]) -> None:
+        """Store messages in the hot tier and queue them for SQLite"""
+        await self._start()
+        if self._closed:
+            raise RuntimeError("Storage is closed")
+
+        # Keys are checked and claimed before the first await, so two
+        # concurrent calls never both count the same message
+        cutoff = int(time.time()) - self.hot_seconds
+        rows = []
+        recent = []
+        older = {}
+        for message in messages:
+            row = _hot_row(**message)
+            key = _key(row)
+            if key in self._pending_keys:
+                continue
+            self._pending_keys.add(key)
+            rows.append(row)
+            if row["sent_at"] >= cutoff:
+                recent.append(row)
+            else:
+                older[key] = row
+        if not rows:
+            return
+
+        # Queued first, so a row is never counted without reaching SQLite
+        await self.hot.queue(rows)
+        new = await self.hot.insert(recent)
+        if older:
+            stored = await self.cold.existing_message_keys(list(older))
+            new.extend(row for key, row in older.items() if key not in stored)
+        await self.hot.count(new)
+        self._generation += 1
+
+    async def _store_cold(self, rows: List[Dict[str, Any]]) -> None:
+        await self.cold.store_messages([_store_args(row) for row in rows])
+        await self.cold.flush()
+
+    async def _drain_once(self) -> int:
+        """Write one batch of queued rows to the cold store; returns its size
+
+        When the batch fails with a permanent error, its rows are retried one
+        by one and those the cold store rejects go to the hot tier's dead
+        letters. Rows up to the first transient failure are acked and that
+        failure is raised, so the rest stay queued for the next drain.
+        """
+        async with self._drain_lock:
+            rows = await self.hot.pending(self.drain_batch)
+            if not rows:
+                return 0
+            done = 0
+            failure = None
+            try:
+                await self._store_cold(rows)
+                done = len(rows)
+            except Exception as e:
+                if _is_transient(e):
+                    failure = e
+                else:
+                    logger.warning(f"Retrying a drained batch row by row: {str(e)}")
+            if not done and failure is None:
+                for row in rows:
+                    try:
+                        await self._store_cold([row])
+                    except Exception as e:
+                        if _is_transient(e):
+                            failure = e
+                            break
+                        await self._reject(row, e)
+                    done += 1
+            if done:
+                await self.hot.ack(done)
+                self._pending_keys.difference_update(_key(row) for row in rows[:done])
+            if failure is not None:
+                self.last_drain_error = str(failure)
+                raise failure
+            self.last_drain_error = None
+            return len(rows)
+
+    async def _reject(self, row: Dict[str, Any], error: Exception) -> None:
+        """Move a row the cold store will never accept to the dead letters"""
+        logger.error(
+            f"Cold store rejected message {row['message_id']} of group {row['group_id']}: {str(error)}"
+        )
+        await self.hot.dead_letter([row])
+        self.rejected += 1
+
+    async def _drain_all(self) -> None:
+        """Write every queued row to the cold store"""
+        while await self._drain_once():
+            pass
+
+    async def _drain_loop(self) -> None:
+        """Background task draining the queue and expiring old hot rows"""
+        while True:
+            try:
+                await asyncio.sleep(self.drain_interval)
+                while await self._drain_once() == self.drain_batch:
+                    pass
+                await self.hot.expire(int(time.time()) - self.hot_seconds)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error draining the hot tier: {str(e)}")
+
+    async def _synced_cold(self) -> Storage:
+        """The cold store, once everything accepted so far has reached it"""
+        await self._start()
+        try:
+            await self._drain_all()
+        except Exception as e:
+            # Rows still queued are missing from the answer until a drain succeeds
+            logger.error(f"Error draining the hot tier, reading from SQLite anyway: {str(e)}")
+        return self.cold
+
+    async def get_last_message_ids(self) -> Dict[int, int]:
+        """Get the highest stored message_id for every group"""
+        return await (await self._synced_cold()).get_last_message_ids()
+
+    async def existing_message_keys(self, keys: List[Tuple[int, int]]) -> set:
+        """Get the (group_id, message_id) pairs among keys that are already stored"""
+        return await (await self._synced_cold()).existing_message_keys(keys)
+
+    async def rollup_snapshot(self) -> Dict[str, Any]:
+        """Get the cold store's rollups, including every queued message"""
+        return await (await self._synced_cold()).rollup_snapshot()
+
+    async def get_messages(
+        self,
+        group_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        limit: int = 100,
+        include_archive: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Get messages newest first, from the hot tier when it covers the request"""
+        await self._start()
+        if not include_archive:
+            covered_from = int(time.time()) - self.hot_seconds
+            since_epoch = None if since is None else _epoch(since)
+            rows = await self.hot.messages(group_id, since_epoch, limit)
+            # Complete if the window is covered, or if a full page fits in it
+            if since_epoch is not None and since_epoch >= covered_from:
+                return rows
+            if len(rows) == limit and rows[-1]["sent_at"] >= covered_from:
+                return rows
+
+        cold = await self._synced_cold()
+        return await cold.get_messages(group_id, since, limit, include_archive)
+
+    async def iter_messages(
+        self,
+        group_id: Optional[int] = None,
+        sender_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        after: Optional[Tuple[int, int]] = None,
+        batch_size: int = 1000
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream messages oldest first from the cold store"""
+        cold = await self._synced_cold()
+        async for row in cold.iter_messages(group_id, sender_id, since, until, after, batch_size):
+            yield row
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """Get statistics about stored messages from the hot tier's counters"""
+        await self._start()
+        now = int(time.time())
+        counters = await self.hot.counters(_bucket(now - 24 * 60 * 60))
+
+        groups = [
+            {"group_id": group_id, "group_name": name, "message_count": count}
+            for group_id, name, count, _ in counters["groups"]
+        ]
+        groups.sort(key=lambda group: group["message_count"], reverse=True)
+        users = [
+            {"sender_id": sender_id, "sender_name": name, "message_count": count}
+            for sender_id, name, count in counters["top_senders"]
+        ]
+
+        # Last hour's senders are counted exactly from the hot rows
+        last_hour = await self.hot.messages(None, now - 60 * 60, None)
+
+        return {
+            "total_messages": sum(group["message_count"] for group in groups),
+            "groups": groups,
+            "top_users": users,
+            "recent_activity": counters["recent_activity"],
+            "top_users_last_hour": _top_senders(last_hour, 5)
+        }
+
+    async def aggregate_window(
+        self,
+        since: datetime,
+        until: Optional[datetime] = None,
+        group_by: str = "group"
+    ) -> List[Dict[str, Any]]:
+        """Get per-group or per-sender activity counts from the cold store"""
+        return await (await self._synced_cold()).aggregate_window(since, until, group_by)
+
+    async def unique_senders(
+        self,
+        since: datetime,
+        until: Optional[datetime] = None,
+        group_id: Optional[int] = None,
+        exact: Optional[bool] = None
+    ) -> Dict[int, int]:
+        """Get distinct senders per group from the cold store"""
+        return await (await self._synced_cold()).unique_senders(since, until, group_id, exact)
+
+    async def top_senders(
+        self,
+        since: datetime,
+        until: Optional[datetime] = None,
+        group_id: Optional[int] = None,
+        limit: int = 10
+    ) -> Dict[int, List[Dict[str, Any]]]:
+        """Get the most active senders per group from the cold store"""
+        return await (await self._synced_cold()).top_senders(since, until, group_id, limit)
+
+    async def cross_posts(
+        self,
+        since: datetime,
+        until: Optional[datetime] = None,
+        limit: int = 10
+    ) -> List[Dict[str, Any]]:
+        """Get texts posted in more than one group from the cold store"""
+        return await (await self._synced_cold()).cross_posts(since, until, limit)
+
+    async def search(
+        self,
+        query: str,
+        group_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Full-text search in the cold store"""
+        return await (await self._synced_cold()).search(query, group_id, since, limit, cursor)
+
+    async def save_entities(self, entries: List[Tuple[int, Optional[str], float]]) -> None:
+        """Persist entity cache entries in the cold store"""
+        await self.cold.save_entities(entries)
+
+    async def load_entities(self) -> List[Tuple[int, Optional[str], float]]:
+        """Load entity cache entries from the cold store"""
+        return await self.cold.load_entities()
+
+    def write_generation(self) -> int:
+        """Counter that changes whenever stored data changes, for cache invalidation"""
+        return self._generation + self.cold.write_generation()
+
+    async def flush(self) -> None:
+        """Wait until every accepted message is in the cold store"""
+        if self._started:
+            await self._drain_all()
+        await self.cold.flush()
+
+    async def close(self) -> None:
+        """Drain the queue, then close both tiers"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._drain_task is not None:
+            self._drain_task.cancel()
+            await asyncio.gather(self._drain_task, return_exceptions=True)
+        if self._started:
+            await self._drain_all()
+        await self.hot.close()
+        await self.cold.close()
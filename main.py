@@ -1,11 +1,17 @@
 import asyncio
+import hashlib
+import json
 import uvicorn
-from fastapi import FastAPI, BackgroundTasks, HTTPException
+from fastapi import FastAPI, BackgroundTasks, HTTPException, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+from datetime import datetime
 from typing import Dict, Any, Optional, List
 
 from telegram_bot.bot import TelegramMonitor
-from database.storage import get_storage
+from telegram_bot.supervisor import Supervisor
+from database.storage import open_storage
+from utils.metrics import metrics, profiler
 from utils.summarizer import generate_summary
 
 app = FastAPI(title="Telegram Group Monitor")
@@ -13,10 +19,21 @@ app = FastAPI(title="Telegram Group Monitor")
 # Global bot instance
 bot_instance = None
 
+# Supervisor running one worker process per configured bot
+supervisor = Supervisor()
+launch_all_on_startup = False
+
 class WebhookData(BaseModel):
     url: str
     interval_minutes: int = 60
 
+class GroupData(BaseModel):
+    group: str
+
+class ProfilerData(BaseModel):
+    enabled: bool
+    interval_ms: float = 5
+
 class BotConfig(BaseModel):
     name: str
     api_id: int
@@ -25,24 +42,163 @@ class BotConfig(BaseModel):
     groups: List[str]
     webhook: Optional[WebhookData] = None
 
+@app.on_event("startup")
+async def startup():
+    """Start watching worker processes (and launch them all if requested)"""
+    supervisor.start_monitor()
+    if launch_all_on_startup:
+        supervisor.launch_all()
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Flush pending writes before the process exits"""
+    await supervisor.shutdown()
+    if bot_instance:
+        # Drains the ingest queue, stops the webhook, saves the entity cache and flushes storage
+        await bot_instance.stop()
+    if bot_instance and bot_instance.storage:
+        await bot_instance.storage.close()
+
 @app.get("/ping")
 async def ping():
     """Health check endpoint"""
     return {"status": "ok", "service": "telegram-monitor"}
 
 @app.get("/status")
-async def status():
-    """Get current monitoring status"""
+async def status(request: Request):
+    """Get current monitoring status
+    
+    The response carries an ETag; pollers that send it back in
+    If-None-Match get an empty 304 while no message was stored and the
+    monitored groups are unchanged. The runtime counters in the body are
+    left out of the ETag, so they are only refreshed along with the stats.
+    """
     if not bot_instance:
         raise HTTPException(status_code=404, detail="Bot not running")
     
-    stats = await bot_instance.get_stats()
-    return {
-        "status": "running",
-        "bot_name": bot_instance.name,
-        "groups_monitored": len(bot_instance.groups),
-        "stats": stats
+    current = await bot_instance.get_status()
+    etag = _status_etag(current)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    body = json.dumps(current, sort_keys=True, default=str)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def _status_etag(current: Dict[str, Any]) -> str:
+    """ETag of a /status response from its cached stats and the storage write generation"""
+    storage = bot_instance.storage
+    versioned = {
+        "generation": storage.write_generation() if storage else None,
+        "status": current["status"],
+        "bot_name": current["bot_name"],
+        "groups_monitored": current["groups_monitored"],
+        "stats": current["stats"]
     }
+    body = json.dumps(versioned, sort_keys=True, default=str)
+    return '"' + hashlib.sha1(body.encode("utf-8")).hexdigest() + '"'
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header value covers the given ETag"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Stage latency histograms and counters in the Prometheus text format"""
+    gauges = {}
+    if bot_instance:
+        ingest = bot_instance.ingest.stats()
+        gauges["ingest_queue_depth"] = ingest["depth"]
+        gauges["ingest_lag_seconds"] = ingest["lag_seconds"]
+        gauges["entity_cache_size"] = bot_instance.entity_cache.stats()["size"]
+        gauges["webhook_outbox_pending"] = bot_instance.webhook.stats()["pending"]
+    return PlainTextResponse(metrics.render(gauges), media_type="text/plain; version=0.0.4")
+
+@app.get("/profiler")
+async def get_profiler():
+    """Slowest message handlers recorded by the sampling profiler"""
+    return profiler.traces()
+
+@app.post("/profiler")
+async def set_profiler(profiler_data: ProfilerData):
+    """Turn the sampling profiler on or off"""
+    if profiler_data.enabled:
+        profiler.start(profiler_data.interval_ms / 1000)
+    else:
+        profiler.stop()
+    return profiler.traces()
+
+@app.get("/search")
+async def search(
+    q: str,
+    group_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    limit: int = 20,
+    cursor: Optional[str] = None
+):
+    """Full-text search over stored messages, best matches first"""
+    if not bot_instance:
+        raise HTTPException(status_code=404, detail="Bot not running")
+    
+    try:
+        return await bot_instance.storage.search(
+            q,
+            group_id=group_id,
+            since=since,
+            limit=min(max(limit, 1), 100),
+            cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
+@app.get("/activity")
+async def activity(window: int = 900, group_id: Optional[int] = None):
+    """Recent per-group activity from the in-memory counters (window in seconds)"""
+    if not bot_instance:
+        raise HTTPException(status_code=404, detail="Bot not running")
+    
+    return bot_instance.activity.window(window, group_id=group_id)
+
+@app.get("/messages")
+async def export_messages(
+    group_id: Optional[int] = None,
+    sender_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    after: Optional[str] = None
+):
+    """Stream stored messages as NDJSON, oldest first
+    
+    To resume an interrupted export, pass ``after=<sent_at>:<id>`` taken
+    from the last row received.
+    """
+    if not bot_instance:
+        raise HTTPException(status_code=404, detail="Bot not running")
+    
+    resume_from = None
+    if after:
+        try:
+            sent_at, row_id = after.split(":")
+            resume_from = (int(sent_at), int(row_id))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="after must be <sent_at>:<id>")
+    
+    async def rows():
+        async for row in bot_instance.storage.iter_messages(
+            group_id=group_id,
+            sender_id=sender_id,
+            since=since,
+            until=until,
+            after=resume_from
+        ):
+            yield json.dumps(row) + "\n"
+    
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
 
 @app.post("/webhook")
 async def set_webhook(webhook_data: WebhookData):
@@ -53,6 +209,30 @@ async def set_webhook(webhook_data: WebhookData):
     await bot_instance.set_webhook(webhook_data.url, webhook_data.interval_minutes)
     return {"status": "webhook updated"}
 
+@app.post("/groups")
+async def add_group(group_data: GroupData):
+    """Start monitoring a group without restarting the bot"""
+    if not bot_instance or not bot_instance.running:
+        raise HTTPException(status_code=404, detail="Bot not running")
+    
+    try:
+        peer_id = await bot_instance.add_group(group_data.group)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Cannot monitor {group_data.group}: {str(e)}")
+    
+    return {"status": "group added", "group": group_data.group, "peer_id": peer_id}
+
+@app.delete("/groups/{group}")
+async def remove_group(group: str):
+    """Stop monitoring a group without restarting the bot"""
+    if not bot_instance:
+        raise HTTPException(status_code=404, detail="Bot not running")
+    
+    if not bot_instance.remove_group(group):
+        raise HTTPException(status_code=404, detail=f"Group {group} is not monitored")
+    
+    return {"status": "group removed", "group": group}
+
 @app.post("/launch")
 async def launch_bot(config: BotConfig, background_tasks: BackgroundTasks):
     """Launch the Telegram monitoring bot"""
@@ -61,8 +241,8 @@ async def launch_bot(config: BotConfig, background_tasks: BackgroundTasks):
     if bot_instance:
         return {"status": "already_running", "name": bot_instance.name}
     
-    # Initialize storage
-    storage = get_storage()
+    # Initialize storage (batched writes: one commit per batch instead of per message)
+    storage = await open_storage(batch_writes=True, fts=True)
     
     # Initialize and start the bot
     bot_instance = TelegramMonitor(
@@ -90,6 +270,58 @@ async def launch_bot(config: BotConfig, background_tasks: BackgroundTasks):
         "groups": len(config.groups)
     }
 
+@app.get("/bots")
+async def list_bots():
+    """List configured bots and their worker processes"""
+    return {"bots": supervisor.list()}
+
+@app.get("/bots/{name}/metrics", response_class=PlainTextResponse)
+async def bot_metrics(name: str):
+    """Get the Prometheus metrics of one bot worker"""
+    try:
+        return PlainTextResponse(
+            await supervisor.metrics(name),
+            media_type="text/plain; version=0.0.4"
+        )
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown bot {name}")
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@app.get("/bots/{name}/status")
+async def bot_status(name: str):
+    """Get the status of one bot worker"""
+    try:
+        return await supervisor.status(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown bot {name}")
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@app.post("/bots/{name}/launch")
+async def launch_worker(name: str):
+    """Launch a configured bot in its own worker process"""
+    try:
+        return supervisor.launch(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown bot {name}")
+
+@app.post("/bots/{name}/stop")
+async def stop_worker(name: str):
+    """Stop a bot worker process"""
+    try:
+        return await supervisor.stop(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown bot {name}")
+
+def launch_all():
+    """Start the API server and a worker process for every bot in config.json"""
+    global launch_all_on_startup
+    launch_all_on_startup = True
+    
+    settings = supervisor.config.get_api_settings()
+    uvicorn.run(app, host=settings["host"], port=settings["port"])
+
 def launch_bot(name: str):
     """Function to launch the bot programmatically"""
     import json
@@ -111,7 +343,10 @@ def launch_bot(name: str):
 if __name__ == "__main__":
     import sys
     
-    if len(sys.argv) > 1:
+    if len(sys.argv) > 1 and sys.argv[1] == "--all":
+        # Run every configured bot in its own process
+        launch_all()
+    elif len(sys.argv) > 1:
         # Launch with name from command line
         launch_bot(sys.argv[1])
     else:
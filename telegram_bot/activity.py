@@ -0,0 +1,123 @@
+# Sliding-window activity counters
+import math
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Tuple
+
+# (bucket width, bucket count) per resolution, finest first: 15 minutes of
+# 10-second buckets, an hour of minutes and a day of hours
+RESOLUTIONS = ((10, 90), (60, 60), (3600, 24))
+
+class _Ring:
+    """Ring buffer of time buckets for one group at one resolution"""
+
+    def __init__(self, width: int, size: int):
+        self.width = width
+        self.size = size
+        self.buckets = [-1] * size  # bucket number each slot currently holds
+        self.messages = [0] * size
+        self.media = [0] * size
+        self.senders = [set() for _ in range(size)]
+
+    def add(self, sent_at: float, sender_id: Optional[int], has_media: bool) -> None:
+        bucket = int(sent_at) // self.width
+        slot = bucket % self.size
+        if self.buckets[slot] != bucket:
+            if self.buckets[slot] > bucket:
+                return  # Older than anything the ring still covers
+            self.buckets[slot] = bucket
+            self.messages[slot] = 0
+            self.media[slot] = 0
+            self.senders[slot] = set()
+
+        self.messages[slot] += 1
+        if has_media:
+            self.media[slot] += 1
+        if sender_id is not None:
+            self.senders[slot].add(sender_id)
+
+    def window(self, now: float, count: int) -> Tuple[List[int], int, set]:
+        """Per-bucket message counts (oldest first), media total and senders of the last count buckets"""
+        current = int(now) // self.width
+        series = []
+        media = 0
+        senders = set()
+        for bucket in range(current - count + 1, current + 1):
+            slot = bucket % self.size
+            if self.buckets[slot] == bucket:
+                series.append(self.messages[slot])
+                media += self.media[slot]
+                senders |= self.senders[slot]
+            else:
+                series.append(0)
+        return series, media, senders
+
+class ActivityCounters:
+    """Per-group message, media and distinct-sender counts over recent windows
+
+    Every processed message updates one bucket per resolution, and a window
+    query reads at most a resolution's worth of buckets, so neither touches
+    the database. Counts only cover what this process has seen, which is
+    why they are rebuilt from storage on startup.
+    """
+
+    def __init__(self, resolutions: Tuple[Tuple[int, int], ...] = RESOLUTIONS):
+        self.resolutions = resolutions
+        self.span = max(width * size for width, size in resolutions)  # longest window, in seconds
+        self.groups = {}  # group_id -> one ring per resolution
+
+    def add(self, group_id: int, sender_id: Optional[int], has_media: bool, sent_at: float) -> None:
+        """Count one message"""
+        rings = self.groups.get(group_id)
+        if rings is None:
+            rings = self.groups[group_id] = [_Ring(width, size) for width, size in self.resolutions]
+        for ring in rings:
+            ring.add(sent_at, sender_id, has_media)
+
+    async def rebuild(self, storage) -> int:
+        """Recount the covered span from stored messages; returns the number counted"""
+        since = datetime.fromtimestamp(time.time() - self.span, timezone.utc)
+        self.groups = {}
+        count = 0
+        async for row in storage.iter_messages(since=since):
+            self.add(row["group_id"], row["sender_id"], row["has_media"], row["sent_at"])
+            count += 1
+        return count
+
+    def window(self, seconds: int, group_id: Optional[int] = None, now: Optional[float] = None) -> Dict[str, Any]:
+        """Activity over the last ``seconds``, per group
+
+        The finest resolution covering the window is used; windows longer than
+        the span are cut to it. ``series`` has the message count of every
+        bucket in the window, oldest first.
+        """
+        now = time.time() if now is None else now
+        seconds = min(max(1, int(seconds)), self.span)
+        index, (width, size) = next(
+            (i, resolution) for i, resolution in enumerate(self.resolutions)
+            if resolution[0] * resolution[1] >= seconds
+        )
+        count = math.ceil(seconds / width)
+
+        if group_id is None:
+            groups = self.groups.items()
+        else:
+            groups = [(group_id, self.groups[group_id])] if group_id in self.groups else []
+
+        result = {}
+        for gid, rings in groups:
+            series, media, senders = rings[index].window(now, count)
+            messages = sum(series)
+            result[gid] = {
+                "messages": messages,
+                "media": media,
+                "unique_senders": len(senders),
+                "messages_per_minute": round(messages * 60 / (count * width), 2),
+                "series": series
+            }
+
+        return {
+            "window_seconds": count * width,
+            "resolution_seconds": width,
+            "groups": result
+        }
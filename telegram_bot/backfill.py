@@ -0,0 +1,161 @@
+# History backfill for messages missed while the bot was down
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, Any, Callable
+
+from telethon.errors import FloodWaitError
+
+from telegram_bot.joiner import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+class HistoryBackfill:
+    """Fetches the gap between the last stored message and the present
+
+    For each group the gap is fixed when the run starts: from the highest
+    stored ``message_id`` up to the newest message on Telegram. Messages
+    are fetched oldest first in pages, stored with ``store_messages`` (the
+    unique (group_id, message_id) index drops anything already captured
+    live), and the position is saved to ``state_path`` after every page so
+    an interrupted run resumes where it stopped. Groups run concurrently;
+    every page request takes a token from a shared bucket.
+    """
+
+    def __init__(
+        self,
+        client,
+        storage,
+        state_path: str,
+        to_record: Callable[[Any, str], Dict[str, Any]],
+        concurrency: int = 3,
+        rate: float = 1.0,
+        page_size: int = 100,
+        max_history: int = 10000
+    ):
+        self.client = client
+        self.storage = storage
+        self.state_path = state_path
+        self.to_record = to_record
+        self.concurrency = max(1, concurrency)
+        self.bucket = TokenBucket(rate, concurrency)
+        self.page_size = page_size
+        self.max_history = max_history
+        self.state = self._load_state()
+        self.progress = {}
+
+    def _load_state(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.state_path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_state(self) -> None:
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    async def run(self, groups: Dict[str, int]) -> Dict[str, Any]:
+        """Backfill every group; ``groups`` maps configured name to marked peer id"""
+        last_ids = await self.storage.get_last_message_ids()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def backfill(group: str, peer_id: int):
+            async with semaphore:
+                await self._backfill_group(group, peer_id, last_ids)
+
+        await asyncio.gather(*[
+            backfill(group, peer_id) for group, peer_id in groups.items()
+        ])
+        return self.progress
+
+    async def _plan(self, peer_id: int, chat_id: int, last_ids: Dict[int, int]) -> Dict[str, Any]:
+        """Fix the gap to fetch for a group, unless an unfinished run left one"""
+        state = self.state.get(str(peer_id))
+        if state and not state["done"]:
+            return state
+
+        latest = await self.client.get_messages(peer_id, limit=1)
+        newest_id = latest[0].id if latest else 0
+        last_id = last_ids.get(chat_id) or 0
+        if not last_id:
+            # Never seen this group: only take the recent part of its history
+            last_id = max(0, newest_id - self.max_history)
+
+        state = {
+            "resume_after": last_id,
+            "until_id": newest_id + 1,
+            "done": newest_id <= last_id,
+            "updated_at": time.time()
+        }
+        self.state[str(peer_id)] = state
+        self._save_state()
+        return state
+
+    async def _backfill_group(self, group: str, peer_id: int, last_ids: Dict[int, int]) -> None:
+        progress = self.progress[group] = {"fetched": 0, "done": False, "error": None}
+        try:
+            entity = await self.client.get_entity(peer_id)
+            chat_name = getattr(entity, 'title', None) or str(entity.id)
+            state = await self._plan(peer_id, entity.id, last_ids)
+
+            while not state["done"]:
+                try:
+                    await self._fetch(peer_id, chat_name, state, progress)
+                except FloodWaitError as e:
+                    logger.warning(f"FloodWait of {e.seconds}s while backfilling {group}")
+                    self.bucket.pause(e.seconds)
+
+            progress["done"] = True
+            logger.info(f"Backfill of {group} finished: {progress['fetched']} messages")
+        except Exception as e:
+            progress["error"] = str(e)
+            logger.error(f"Backfill of {group} failed: {str(e)}")
+
+    async def _fetch(self, peer_id: int, chat_name: str, state: Dict[str, Any], progress: Dict[str, Any]) -> None:
+        """Fetch from the saved position to the end of the gap, saving after each page"""
+        page = []
+        consumed = 0
+        last_id = state["resume_after"]
+
+        async def save_page():
+            await self.storage.store_messages(page)
+            # The saved position must never run ahead of what is durably stored
+            await self.storage.flush()
+            state["resume_after"] = last_id
+            state["updated_at"] = time.time()
+            self._save_state()
+            progress["fetched"] += len(page)
+            page.clear()
+
+        await self.bucket.acquire()
+        async for message in self.client.iter_messages(
+            peer_id,
+            min_id=state["resume_after"],
+            max_id=state["until_id"],
+            reverse=True,
+            wait_time=0
+        ):
+            last_id = message.id
+            consumed += 1
+            # Service messages (joins, pins, ...) never reach the live handler either
+            if getattr(message, 'action', None) is None:
+                page.append(self.to_record(message, chat_name))
+
+            if consumed >= self.page_size:
+                consumed = 0
+                await save_page()
+                # The iterator requests the next page once this one is consumed
+                await self.bucket.acquire()
+
+        await save_page()
+        state["done"] = True
+        self._save_state()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get per-group backfill progress"""
+        return self.progress
@@ -1,15 +1,21 @@
 import asyncio
 import logging
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import List, Dict, Any, Optional
-import aiohttp
 
-from telethon import TelegramClient, events
-from telethon.tl.functions.messages import GetDialogsRequest
+from telethon import TelegramClient, events, utils
 from telethon.tl.functions.channels import JoinChannelRequest
-from telethon.tl.types import InputPeerEmpty, Channel
 
 from database.storage import Storage
+from telegram_bot.activity import ActivityCounters
+from telegram_bot.backfill import HistoryBackfill
+from telegram_bot.entity_cache import EntityCache
+from telegram_bot.ingest import IngestQueue
+from telegram_bot.joiner import JoinScheduler
+from telegram_bot.trends import TrendingTerms
+from telegram_bot.webhook import WebhookDelivery
+from utils.cache import TTLCache
+from utils.metrics import metrics, profiler
 from utils.summarizer import generate_summary
 
 # Configure logging
@@ -27,19 +33,56 @@ class TelegramMonitor:
         api_hash: str,
         phone: str,
         groups: List[str],
-        storage: Storage
+        storage: Storage,
+        entity_cache_size: int = 10000,
+        entity_cache_ttl: float = 3600,
+        persist_entities: bool = True,
+        ingest_queue_size: int = 10000,
+        ingest_workers: int = 4,
+        overflow_policy: str = "block",
+        spill_path: Optional[str] = None,
+        backfill_on_start: bool = True,
+        stats_ttl: float = 5,
+        summary_ttl: float = 30,
+        interactive_login: bool = True,
+        outbox_dir: Optional[str] = None
     ):
         self.name = name
         self.api_id = api_id
         self.api_hash = api_hash
         self.phone = phone
         self.groups = groups
+        self.group_peers = {}  # configured group -> marked peer id
+        self.group_ids = frozenset()  # marked peer ids accepted by the handler
         self.storage = storage
         self.client = None
+        self.interactive_login = interactive_login
+        self.authorized = False
         self.webhook_url = None
         self.webhook_interval = 60  # Default: 60 minutes
         self.running = False
         self.summary_task = None
+        self.webhook = WebhookDelivery(outbox_dir or f"{name}.outbox")
+        self.entity_cache = EntityCache(entity_cache_size, entity_cache_ttl)
+        self.persist_entities = persist_entities
+        self.entity_task = None
+        self.activity = ActivityCounters()
+        self.trends = TrendingTerms()
+        self.stats_cache = TTLCache(stats_ttl, storage.write_generation)
+        self.summary_cache = TTLCache(summary_ttl, storage.write_generation)
+        self.joiner = None
+        self.backfill_on_start = backfill_on_start
+        self.history = None
+        self.backfill_task = None
+        self.ingest = IngestQueue(
+            self._process_message,
+            maxsize=ingest_queue_size,
+            workers=ingest_workers,
+            overflow=overflow_policy,
+            journal_path=spill_path or f"{name}.ingest.journal",
+            serialize=self._serialize_message,
+            restore=self._restore_message
+        )
         
     async def start(self):
         """Start the Telegram monitoring bot"""
@@ -57,24 +100,56 @@ class TelegramMonitor:
         )
         
         # Connect and authenticate
-        await self.client.start(phone=self.phone)
+        if self.interactive_login:
+            await self.client.start(phone=self.phone)
+        else:
+            # Only a saved session will do: a login prompt needs a terminal,
+            # and every attempt would request another login code
+            await self.client.connect()
         
         if not await self.client.is_user_authorized():
             logger.error("Authentication failed")
+            await self.client.disconnect()
             return
         
+        self.authorized = True
         logger.info("Successfully authenticated")
         
+        # Warm the entity cache from the previous run
+        if self.persist_entities:
+            self.entity_cache.load(await self.storage.load_entities())
+            self.entity_task = asyncio.create_task(self._persist_entities())
+        
+        # Recount recent activity before live messages start adding to it
+        try:
+            counted = await self.activity.rebuild(self.storage)
+            logger.info(f"Activity counters rebuilt from {counted} stored messages")
+        except Exception as e:
+            logger.error(f"Failed to rebuild activity counters: {str(e)}")
+        try:
+            counted = await self.trends.rebuild(self.storage)
+            logger.info(f"Trending terms rebuilt from {counted} stored messages")
+        except Exception as e:
+            logger.error(f"Failed to rebuild trending terms: {str(e)}")
+        
         # Join groups
         await self._join_groups()
+        await self._resolve_groups()
+        
+        # Register message handler; processing happens on the ingest workers.
+        # Events from unmonitored chats are filtered out before the handler runs.
+        self.ingest.start()
         
-        # Register message handler
-        @self.client.on(events.NewMessage)
+        @self.client.on(events.NewMessage(func=self._is_monitored))
         async def handler(event):
-            await self._process_message(event)
+            await self.ingest.put(event)
         
         self.running = True
         
+        # Fetch what was missed while offline; live events are already being captured
+        if self.backfill_on_start:
+            self.backfill_task = asyncio.create_task(self.backfill())
+        
         # Start summary task if webhook is set
         if self.webhook_url:
             self._start_summary_task()
@@ -82,84 +157,243 @@ class TelegramMonitor:
         # Keep the client running
         await self.client.run_until_disconnected()
     
+    async def stop(self):
+        """Stop processing, flush pending work and disconnect"""
+        if not self.client:
+            return
+        
+        logger.info(f"Stopping bot {self.name}")
+        self.running = False
+        
+        for task in (self.summary_task, self.entity_task, self.backfill_task):
+            if task:
+                task.cancel()
+        self.summary_task = None
+        self.entity_task = None
+        self.backfill_task = None
+        
+        await self.ingest.stop()
+        await self.webhook.stop()
+        if self.persist_entities:
+            await self.storage.save_entities(self.entity_cache.pop_dirty())
+        await self.storage.flush()
+        
+        # Makes run_until_disconnected() in start() return
+        await self.client.disconnect()
+    
     async def _join_groups(self):
         """Join the specified Telegram groups"""
-        logger.info(f"Joining {len(self.groups)} groups")
-        
-        # Get dialogs to find groups
-        dialogs = await self.client(GetDialogsRequest(
-            offset_date=None,
-            offset_id=0,
-            offset_peer=InputPeerEmpty(),
-            limit=100,
-            hash=0
-        ))
-        
-        # Find existing groups
-        existing_groups = {}
-        for dialog in dialogs.dialogs:
-            if dialog.peer and isinstance(dialog.peer.channel_id, int):
-                entity = await self.client.get_entity(dialog.peer)
-                if isinstance(entity, Channel):
-                    existing_groups[entity.username.lower() if entity.username else ''] = entity
-        
-        # Join new groups
+        self.joiner = JoinScheduler(self.client, f"{self.name}.joins.json")
+        await self.joiner.run(self.groups)
+    
+    async def backfill(self) -> Dict[str, Any]:
+        """Fetch messages missed while the bot was down for every monitored group"""
+        self.history = HistoryBackfill(
+            self.client,
+            self.storage,
+            f"{self.name}.backfill.json",
+            self._message_record
+        )
+        return await self.history.run(dict(self.group_peers))
+    
+    def _message_record(self, message, chat_title: str) -> Dict[str, Any]:
+        """store_message arguments for a message fetched from history"""
+        sender_id = None
+        sender_name = None
+        if message.sender_id:
+            sender_id = utils.resolve_id(message.sender_id)[0]
+            if message.sender:
+                sender_name = _sender_name(message.sender)
+                self.entity_cache.put(message.sender_id, sender_name)
+            else:
+                sender_name = self.entity_cache.get(message.sender_id) or str(sender_id)
+        
+        return {
+            "group_id": utils.resolve_id(message.chat_id)[0],
+            "group_name": chat_title,
+            "sender_id": sender_id,
+            "sender_name": sender_name,
+            "message_id": message.id,
+            "content": message.message,
+            "timestamp": message.date,
+            "has_media": bool(message.media)
+        }
+    
+    async def _resolve_groups(self):
+        """Resolve the configured groups to the set of peer ids to monitor"""
+        group_peers = {}
         for group in self.groups:
-            group_username = group.replace('@', '').lower()
-            
-            if group_username in existing_groups:
-                logger.info(f"Already a member of {group}")
-                continue
-            
             try:
-                # Try to join the group
-                await self.client(JoinChannelRequest(group))
-                logger.info(f"Successfully joined {group}")
-                
-                # Wait a bit to avoid rate limiting
-                await asyncio.sleep(2)
+                group_peers[group] = await self.client.get_peer_id(group)
             except Exception as e:
-                logger.error(f"Failed to join {group}: {str(e)}")
+                logger.error(f"Failed to resolve {group}: {str(e)}")
+        
+        self.group_peers = group_peers
+        self.group_ids = frozenset(group_peers.values())
+        logger.info(f"Monitoring {len(self.group_ids)} of {len(self.groups)} groups")
+    
+    def _is_monitored(self, event) -> bool:
+        """Event filter: only chats in the monitored set are processed"""
+        return event.chat_id in self.group_ids
+    
+    async def add_group(self, group: str) -> int:
+        """Join a group and start monitoring it without a restart"""
+        if group in self.group_peers:
+            return self.group_peers[group]
+        
+        try:
+            await self.client(JoinChannelRequest(group))
+        except Exception as e:
+            logger.error(f"Failed to join {group}: {str(e)}")
+        peer_id = await self.client.get_peer_id(group)
+        
+        # Swap in new containers so the event filter never sees a partial update
+        self.group_peers = {**self.group_peers, group: peer_id}
+        self.group_ids = self.group_ids | {peer_id}
+        if group not in self.groups:
+            self.groups = self.groups + [group]
+        
+        logger.info(f"Now monitoring {group}")
+        return peer_id
+    
+    def remove_group(self, group: str) -> bool:
+        """Stop monitoring a group without a restart"""
+        if group not in self.group_peers and group not in self.groups:
+            return False
+        
+        group_peers = dict(self.group_peers)
+        peer_id = group_peers.pop(group, None)
+        self.group_peers = group_peers
+        if peer_id is not None and peer_id not in group_peers.values():
+            self.group_ids = self.group_ids - {peer_id}
+        self.groups = [g for g in self.groups if g != group]
+        
+        logger.info(f"Stopped monitoring {group}")
+        return True
     
     async def _process_message(self, event):
         """Process and store a new message"""
+        with metrics.timer("process_message"), profiler.track("process_message"):
+            try:
+                # Get message data
+                message = event.message
+                
+                # Get chat information (ids come from the update itself; names from
+                # the event's entities or the cache before falling back to an RPC)
+                chat_id = utils.resolve_id(event.chat_id)[0]
+                with metrics.timer("entity_resolution"):
+                    chat_title = await self._resolve_name(
+                        event.chat_id, event.chat, event.get_chat, _chat_name
+                    )
+                
+                # Get sender information
+                if message.sender_id:
+                    sender_id = utils.resolve_id(message.sender_id)[0]
+                    with metrics.timer("entity_resolution"):
+                        sender_name = await self._resolve_name(
+                            message.sender_id, event.sender, event.get_sender, _sender_name
+                        )
+                else:
+                    sender_id = None
+                    sender_name = None
+                
+                # Extract message content
+                content = message.message
+                
+                # Store in database
+                with metrics.timer("store_message"):
+                    await self.storage.store_message(
+                        group_id=chat_id,
+                        group_name=chat_title,
+                        sender_id=sender_id,
+                        sender_name=sender_name,
+                        message_id=message.id,
+                        content=content,
+                        timestamp=message.date,
+                        has_media=bool(message.media)
+                    )
+                self.activity.add(chat_id, sender_id, bool(message.media), message.date.timestamp())
+                self.trends.add(chat_id, content, message.date.timestamp())
+                
+                logger.debug(f"Stored message from {chat_title}: {content[:50]}...")
+                
+            except Exception as e:
+                metrics.error("process_message")
+                logger.error(f"Error processing message: {str(e)}")
+    
+    def _serialize_message(self, event) -> Dict[str, Any]:
+        """Turn an event into a journal record without any network calls"""
+        message = event.message
+        return {
+            "chat_peer": event.chat_id,
+            "chat_name": _chat_name(event.chat) if event.chat else None,
+            "sender_peer": message.sender_id,
+            "sender_name": _sender_name(event.sender) if event.sender else None,
+            "message_id": message.id,
+            "content": message.message,
+            "date": message.date.timestamp(),
+            "has_media": bool(message.media)
+        }
+    
+    async def _restore_message(self, record: Dict[str, Any]):
+        """Store a message replayed from the ingest journal"""
+        chat_title = record["chat_name"] or await self._lookup_name(record["chat_peer"], _chat_name)
+        
+        sender_id = None
+        sender_name = None
+        if record["sender_peer"]:
+            sender_id = utils.resolve_id(record["sender_peer"])[0]
+            sender_name = record["sender_name"] or await self._lookup_name(record["sender_peer"], _sender_name)
+        
+        group_id = utils.resolve_id(record["chat_peer"])[0]
+        await self.storage.store_message(
+            group_id=group_id,
+            group_name=chat_title,
+            sender_id=sender_id,
+            sender_name=sender_name,
+            message_id=record["message_id"],
+            content=record["content"],
+            timestamp=datetime.fromtimestamp(record["date"], timezone.utc),
+            has_media=record["has_media"]
+        )
+        self.activity.add(group_id, sender_id, record["has_media"], record["date"])
+        self.trends.add(group_id, record["content"], record["date"])
+    
+    async def _lookup_name(self, peer_id: int, describe) -> str:
+        """Resolve a name by peer id alone, falling back to the id itself"""
         try:
-            # Get message data
-            message = event.message
-            
-            # Get chat information
-            chat = await event.get_chat()
-            chat_id = chat.id
-            chat_title = getattr(chat, 'title', str(chat_id))
-            
-            # Get sender information
-            if message.sender_id:
-                sender = await event.get_sender()
-                sender_id = sender.id
-                sender_name = getattr(sender, 'username', None) or getattr(sender, 'first_name', str(sender_id))
-            else:
-                sender_id = None
-                sender_name = None
-            
-            # Extract message content
-            content = message.message
-            
-            # Store in database
-            await self.storage.store_message(
-                group_id=chat_id,
-                group_name=chat_title,
-                sender_id=sender_id,
-                sender_name=sender_name,
-                message_id=message.id,
-                content=content,
-                timestamp=datetime.now(),
-                has_media=bool(message.media)
+            return await self._resolve_name(
+                peer_id, None, lambda: self.client.get_entity(peer_id), describe
             )
-            
-            logger.debug(f"Stored message from {chat_title}: {content[:50]}...")
-            
-        except Exception as e:
-            logger.error(f"Error processing message: {str(e)}")
+        except Exception:
+            return str(utils.resolve_id(peer_id)[0])
+    
+    async def _resolve_name(self, peer_id: int, entity, fetch, describe) -> str:
+        """Resolve a display name from the event entity, the cache, or the network"""
+        if entity is not None:
+            name = describe(entity)
+            self.entity_cache.put(peer_id, name)
+            return name
+        
+        name = self.entity_cache.get(peer_id)
+        if name is not None:
+            return name
+        
+        metrics.inc("entity_fetches")
+        name = describe(await fetch())
+        self.entity_cache.put(peer_id, name)
+        return name
+    
+    async def _persist_entities(self, interval: float = 60):
+        """Periodically write changed entity names to storage"""
+        while True:
+            try:
+                await asyncio.sleep(interval)
+                await self.storage.save_entities(self.entity_cache.pop_dirty())
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error persisting entity cache: {str(e)}")
     
     async def set_webhook(self, url: str, interval_minutes: int):
         """Set or update the webhook configuration"""
@@ -180,36 +414,78 @@ class TelegramMonitor:
         self.summary_task = asyncio.create_task(self._periodic_summary())
     
     async def _periodic_summary(self):
-        """Periodically generate and send summaries to the webhook"""
+        """Periodically generate and send summaries to the webhook
+        
+        The first summary goes out immediately. Later runs are scheduled on a
+        fixed grid from that start, so slow runs do not make the schedule
+        drift, and slots missed entirely are skipped rather than bunched up.
+        """
+        await self.webhook.start()
+        
+        loop = asyncio.get_running_loop()
+        next_run = loop.time()
         while self.running and self.webhook_url:
             try:
-                # Wait for the specified interval
-                await asyncio.sleep(self.webhook_interval * 60)
+                # Wait for the next slot
+                delay = next_run - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
                 
                 # Generate summary
-                summary = await generate_summary(self.storage)
+                summary = await self.get_summary()
                 
-                # Send to webhook
-                async with aiohttp.ClientSession() as session:
-                    async with session.post(
-                        self.webhook_url,
-                        json=summary
-                    ) as response:
-                        if response.status != 200:
-                            logger.error(f"Webhook error: {response.status}")
-                        else:
-                            logger.info("Summary sent to webhook successfully")
+                # Send to webhook; failures stay in the outbox and are retried
+                await self.webhook.send(self.webhook_url, summary)
             
             except asyncio.CancelledError:
                 break
             except Exception as e:
                 logger.error(f"Error in periodic summary: {str(e)}")
-                await asyncio.sleep(60)  # Wait a bit before retrying
+            
+            interval = self.webhook_interval * 60
+            next_run += interval
+            now = loop.time()
+            if next_run < now:
+                next_run += ((now - next_run) // interval + 1) * interval
     
     async def get_stats(self) -> Dict[str, Any]:
-        """Get current monitoring statistics"""
+        """Get current monitoring statistics (cached; do not modify the result)"""
         if not self.storage:
             return {}
         
-        stats = await self.storage.get_stats()
-        return stats
+        async def compute():
+            with metrics.timer("get_stats"):
+                return await self.storage.get_stats()
+        
+        return await self.stats_cache.get("stats", compute)
+    
+    async def get_summary(self) -> Dict[str, Any]:
+        """Get the activity summary sent to the webhook (cached; do not modify the result)"""
+        async def compute():
+            with metrics.timer("generate_summary"):
+                return await generate_summary(self.storage, self.trends)
+        
+        return await self.summary_cache.get("summary", compute)
+    
+    async def get_status(self) -> Dict[str, Any]:
+        """Get monitoring statistics together with the bot's runtime counters"""
+        stats = await self.get_stats()
+        return {
+            "status": "running" if self.running else "starting",
+            "bot_name": self.name,
+            "groups_monitored": len(self.groups),
+            "stats": stats,
+            "entity_cache": self.entity_cache.stats(),
+            "ingest": self.ingest.stats(),
+            "joins": self.joiner.stats() if self.joiner else None,
+            "backfill": self.history.stats() if self.history else None,
+            "webhook": self.webhook.stats()
+        }
+
+def _chat_name(chat) -> str:
+    """Display name for a chat entity"""
+    return getattr(chat, 'title', None) or str(chat.id)
+
+def _sender_name(sender) -> str:
+    """Display name for a sender entity"""
+    return getattr(sender, 'username', None) or getattr(sender, 'first_name', None) or str(sender.id)
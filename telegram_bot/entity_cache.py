@@ -0,0 +1,90 @@
+# Entity name cache
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+# Fraction of the ttl after which a refresh is written back even if the name is unchanged
+PERSIST_AFTER = 0.5
+
+class EntityCache:
+    """Bounded LRU cache of display names keyed by marked peer id
+
+    Entries expire ``ttl`` seconds after they were last refreshed. Names that
+    changed since the last ``pop_dirty()`` are tracked so they can be written
+    back to storage and loaded again after a restart, as are unchanged names
+    whose written refresh time is more than ``PERSIST_AFTER * ttl`` behind,
+    so a reloaded entry never expires much earlier than it would have.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 3600):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # peer_id -> (name, refreshed_at)
+        self._dirty = set()
+        self._persisted_at = {}  # peer_id -> refreshed_at as last written or loaded
+
+    def get(self, peer_id: int) -> Optional[str]:
+        """Return the cached name, or None if it is missing or expired"""
+        entry = self._entries.get(peer_id)
+        if entry is None or time.time() - entry[1] > self.ttl:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(peer_id)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, peer_id: int, name: Optional[str], refreshed_at: Optional[float] = None) -> None:
+        """Insert or refresh a name, evicting the least recently used entry if full"""
+        refreshed_at = refreshed_at if refreshed_at is not None else time.time()
+        previous = self._entries.get(peer_id)
+        persisted_at = self._persisted_at.get(peer_id)
+        if (
+            previous is None
+            or previous[0] != name
+            or persisted_at is None
+            or refreshed_at - persisted_at > self.ttl * PERSIST_AFTER
+        ):
+            self._dirty.add(peer_id)
+
+        self._entries[peer_id] = (name, refreshed_at)
+        self._entries.move_to_end(peer_id)
+
+        while len(self._entries) > self.max_size:
+            evicted, _ = self._entries.popitem(last=False)
+            self._dirty.discard(evicted)
+            self._persisted_at.pop(evicted, None)
+
+    def load(self, entries: List[Tuple[int, Optional[str], float]]) -> None:
+        """Warm the cache from persisted (peer_id, name, refreshed_at) entries"""
+        now = time.time()
+        for peer_id, name, refreshed_at in entries:
+            if now - refreshed_at <= self.ttl:
+                self.put(peer_id, name, refreshed_at)
+                self._persisted_at[peer_id] = refreshed_at
+        self._dirty.clear()
+
+    def pop_dirty(self) -> List[Tuple[int, Optional[str], float]]:
+        """Return the entries to write back since the last call, and count them as written"""
+        dirty = [
+            (peer_id, *self._entries[peer_id])
+            for peer_id in self._dirty
+            if peer_id in self._entries
+        ]
+        for peer_id, _, refreshed_at in dirty:
+            self._persisted_at[peer_id] = refreshed_at
+        self._dirty.clear()
+        return dirty
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cache size and hit/miss counters"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,205 @@
+# Ingest queue between the Telethon update handler and message processing
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, Any, Callable, Awaitable, Optional
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "spill")
+
+# Queue item kinds
+_LIVE = 0
+_REPLAY = 1
+
+class IngestQueue:
+    """Bounded queue drained by a pool of worker tasks
+
+    When the queue is full, ``overflow`` decides what happens to a new item:
+
+    - ``block``: ``put`` waits for room (backpressure on the update loop)
+    - ``drop_oldest``: the oldest queued item is discarded
+    - ``spill``: the item is serialized with ``serialize`` and appended to an
+      on-disk journal; the journal is replayed through ``restore`` once the
+      queue has drained below half full, and again on the next start
+    """
+
+    def __init__(
+        self,
+        process: Callable[[Any], Awaitable[None]],
+        maxsize: int = 10000,
+        workers: int = 4,
+        overflow: str = "block",
+        journal_path: Optional[str] = None,
+        serialize: Optional[Callable[[Any], Dict[str, Any]]] = None,
+        restore: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unsupported overflow policy: {overflow}")
+        if overflow == "spill" and not (journal_path and serialize and restore):
+            raise ValueError("Spill policy needs journal_path, serialize and restore")
+
+        self.process = process
+        self.maxsize = max(1, maxsize)
+        self.workers = max(1, workers)
+        self.overflow = overflow
+        self.journal_path = journal_path
+        self.serialize = serialize
+        self.restore = restore
+
+        self._queue = None
+        self._tasks = []
+        self._replay_task = None
+        self._journal = None
+
+        # Counters reported through stats()
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def start(self) -> None:
+        """Start the worker tasks (and replay a journal left by a previous run)"""
+        if self._tasks:
+            return
+
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [
+            asyncio.create_task(self._worker())
+            for _ in range(self.workers)
+        ]
+
+        if self.overflow == "spill" and self._journal_pending():
+            self._start_replay()
+
+    async def stop(self, timeout: float = 30) -> None:
+        """Let the workers drain the queue, then cancel them"""
+        if not self._tasks:
+            return
+
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Ingest queue stopped with {self._queue.qsize()} items pending")
+
+        for task in self._tasks + [self._replay_task]:
+            if task:
+                task.cancel()
+        self._tasks = []
+        self._replay_task = None
+        self._close_journal()
+
+    async def put(self, item: Any) -> None:
+        """Enqueue a live item, applying the overflow policy if the queue is full"""
+        entry = (_LIVE, item, time.monotonic())
+
+        if self.overflow == "block" or not self._queue.full():
+            await self._queue.put(entry)
+            return
+
+        if self.overflow == "drop_oldest":
+            self._queue.get_nowait()
+            self._queue.task_done()
+            self._queue.put_nowait(entry)
+            self.dropped += 1
+            return
+
+        self._spill(item)
+
+    def _spill(self, item: Any) -> None:
+        """Append an item to the on-disk journal"""
+        try:
+            if self._journal is None:
+                self._journal = open(self.journal_path, "a", encoding="utf-8")
+            self._journal.write(json.dumps(self.serialize(item)) + "\n")
+            self._journal.flush()
+            self.spilled += 1
+        except Exception as e:
+            logger.error(f"Failed to spill to {self.journal_path}: {str(e)}")
+            self.dropped += 1
+            return
+
+        if self._replay_task is None or self._replay_task.done():
+            self._start_replay()
+
+    def _close_journal(self) -> None:
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def _journal_pending(self) -> bool:
+        return any(
+            os.path.exists(path)
+            for path in (self.journal_path, self.journal_path + ".replay")
+        )
+
+    def _start_replay(self) -> None:
+        self._replay_task = asyncio.create_task(self._replay())
+
+    async def _replay(self) -> None:
+        """Feed journaled items back through the queue once there is room"""
+        replay_path = self.journal_path + ".replay"
+        try:
+            while self._journal_pending():
+                if self._queue.qsize() > self.maxsize // 2:
+                    await asyncio.sleep(1)
+                    continue
+
+                # A replay file left by an interrupted run is finished first;
+                # otherwise rotate the live journal so new spills start a fresh file
+                if not os.path.exists(replay_path):
+                    self._close_journal()
+                    os.replace(self.journal_path, replay_path)
+
+                with open(replay_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            await self._queue.put((_REPLAY, json.loads(line), time.monotonic()))
+                            self.replayed += 1
+                os.remove(replay_path)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error replaying ingest journal: {str(e)}")
+
+    async def _worker(self) -> None:
+        """Process items until cancelled"""
+        while True:
+            kind, item, enqueued_at = await self._queue.get()
+            try:
+                self.last_lag = time.monotonic() - enqueued_at
+                self.max_lag = max(self.max_lag, self.last_lag)
+
+                if kind == _LIVE:
+                    await self.process(item)
+                else:
+                    await self.restore(item)
+                self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Error in ingest worker: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get queue depth, lag and drop counters"""
+        return {
+            "depth": self._queue.qsize() if self._queue else 0,
+            "max_size": self.maxsize,
+            "workers": self.workers,
+            "overflow_policy": self.overflow,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "lag_seconds": round(self.last_lag, 3),
+            "max_lag_seconds": round(self.max_lag, 3)
+        }
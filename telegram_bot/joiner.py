@@ -0,0 +1,181 @@
+# Group join scheduler
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, Any, List, Optional
+
+from telethon.errors import FloodWaitError
+from telethon.tl.functions.channels import JoinChannelRequest
+from telethon.tl.types import Channel
+
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Async token bucket; a FloodWait pauses every caller until it expires"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Stop handing out tokens for the given number of seconds"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+class JoinScheduler:
+    """Joins configured groups concurrently within Telegram's rate limits
+
+    Current memberships are read from the dialog list (paginated, with the
+    chats that come back in each page, so no per-dialog lookups). Joins go
+    through a token bucket that honors FloodWait, and the outcome per group
+    is saved to ``state_path`` so a restart skips groups already joined.
+    """
+
+    def __init__(
+        self,
+        client,
+        state_path: str,
+        rate: float = 0.5,
+        burst: int = 3,
+        concurrency: int = 3,
+        max_attempts: int = 5
+    ):
+        self.client = client
+        self.state_path = state_path
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max_attempts
+        self.state = self._load_state()
+        self.progress = {
+            "total": 0,
+            "joined": 0,
+            "already_member": 0,
+            "failed": 0,
+            "pending": 0,
+            "flood_waits": 0
+        }
+
+    def _load_state(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.state_path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_state(self) -> None:
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def _record(self, group: str, status: str, error: Optional[str] = None) -> None:
+        self.state[group] = {"status": status, "error": error, "updated_at": time.time()}
+        self._save_state()
+
+    async def _memberships(self) -> set:
+        """Usernames of every channel/megagroup the account is already in"""
+        usernames = set()
+        async for dialog in self.client.iter_dialogs():
+            entity = dialog.entity
+            if isinstance(entity, Channel) and entity.username:
+                usernames.add(entity.username.lower())
+        return usernames
+
+    async def run(self, groups: List[str]) -> Dict[str, Any]:
+        """Join every group that is not already joined; returns the progress counters"""
+        self.progress["total"] = len(groups)
+        todo = []
+        for group in groups:
+            if self.state.get(group, {}).get("status") in ("joined", "already_member"):
+                self.progress["already_member"] += 1
+            else:
+                todo.append(group)
+
+        if todo:
+            members = await self._memberships()
+            remaining = []
+            for group in todo:
+                if group.replace('@', '').lower() in members:
+                    logger.info(f"Already a member of {group}")
+                    self._record(group, "already_member")
+                    self.progress["already_member"] += 1
+                else:
+                    remaining.append(group)
+            todo = remaining
+
+        self.progress["pending"] = len(todo)
+        logger.info(f"Joining {len(todo)} of {len(groups)} groups")
+
+        queue = asyncio.Queue()
+        for group in todo:
+            queue.put_nowait(group)
+        await asyncio.gather(*[
+            self._join_worker(queue)
+            for _ in range(min(self.concurrency, len(todo)))
+        ])
+
+        logger.info(f"Group joins finished: {self.progress}")
+        return self.progress
+
+    async def _join_worker(self, queue: asyncio.Queue) -> None:
+        while not queue.empty():
+            group = queue.get_nowait()
+            attempts = 0
+            while True:
+                attempts += 1
+                await self.bucket.acquire()
+                try:
+                    with metrics.timer("group_join"):
+                        await self.client(JoinChannelRequest(group))
+                except FloodWaitError as e:
+                    self.progress["flood_waits"] += 1
+                    logger.warning(f"FloodWait of {e.seconds}s while joining {group}")
+                    self.bucket.pause(e.seconds)
+                    if attempts < self.max_attempts:
+                        continue
+                    self._finish(group, "failed", str(e))
+                except Exception as e:
+                    logger.error(f"Failed to join {group}: {str(e)}")
+                    self._finish(group, "failed", str(e))
+                else:
+                    logger.info(f"Successfully joined {group}")
+                    self._finish(group, "joined")
+                break
+
+    def _finish(self, group: str, status: str, error: Optional[str] = None) -> None:
+        self._record(group, status, error)
+        self.progress[status] += 1
+        self.progress["pending"] -= 1
+        done = self.progress["total"] - self.progress["pending"]
+        logger.info(f"Join progress: {done}/{self.progress['total']}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Get join progress, including any active FloodWait"""
+        return {
+            **self.progress,
+            "paused_for_seconds": max(0, round(self.bucket.paused_until - time.monotonic()))
+        }
@@ -0,0 +1,332 @@
+# Multi-account supervisor
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from typing import Dict, Any, List, Optional
+
+from telegram_bot.config import Config
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for a worker to answer a command
+COMMAND_TIMEOUT = 30
+
+# Exit code of a worker whose Telegram session is not authorized; never restarted
+EXIT_UNAUTHORIZED = 3
+
+def assign_groups(bots: Dict[str, Dict[str, Any]], shared_groups: List[str]) -> Dict[str, List[str]]:
+    """Spread groups across accounts so each group is monitored exactly once
+
+    A bot keeps the groups from its own config unless an earlier bot already
+    claimed them. Groups from the top-level ``groups`` list go to whichever
+    bot currently has the fewest.
+    """
+    assigned = {name: [] for name in bots}
+    claimed = set()
+
+    for name, bot_config in bots.items():
+        for group in bot_config.get("groups", []):
+            key = group.replace('@', '').lower()
+            if key not in claimed:
+                claimed.add(key)
+                assigned[name].append(group)
+
+    for group in shared_groups:
+        key = group.replace('@', '').lower()
+        if key in claimed or not assigned:
+            continue
+        claimed.add(key)
+        least_loaded = min(assigned, key=lambda name: len(assigned[name]))
+        assigned[least_loaded].append(group)
+
+    return assigned
+
+def run_worker(name: str, bot_config: Dict[str, Any], storage_kwargs: Dict[str, Any], conn) -> None:
+    """Process entry point: run one TelegramMonitor with its own event loop"""
+    sys.exit(asyncio.run(_run_worker(name, bot_config, storage_kwargs, conn)))
+
+async def _run_worker(name: str, bot_config: Dict[str, Any], storage_kwargs: Dict[str, Any], conn) -> int:
+    # Imported here so the supervisor process does not need Telethon loaded
+    from database.storage import open_storage
+    from telegram_bot.bot import TelegramMonitor
+
+    storage = await open_storage(**storage_kwargs)
+    bot = TelegramMonitor(
+        name=name,
+        api_id=int(bot_config["api_id"]),
+        api_hash=bot_config["api_hash"],
+        phone=bot_config["phone"],
+        groups=bot_config["groups"],
+        storage=storage,
+        interactive_login=False,
+        outbox_dir=os.path.join(os.path.dirname(storage_kwargs["db_path"]), f"{name}.outbox")
+    )
+
+    webhook = bot_config.get("webhook")
+    if webhook and webhook.get("url"):
+        await bot.set_webhook(webhook["url"], webhook.get("interval_minutes", 60))
+
+    threading.Thread(
+        target=_serve_commands,
+        args=(conn, asyncio.get_running_loop(), bot),
+        daemon=True
+    ).start()
+
+    try:
+        await bot.start()
+    finally:
+        await storage.close()
+    return 0 if bot.authorized else EXIT_UNAUTHORIZED
+
+def _serve_commands(conn, loop: asyncio.AbstractEventLoop, bot) -> None:
+    """Answer supervisor commands sent over the pipe"""
+    while True:
+        try:
+            command = conn.recv()
+        except (EOFError, OSError):
+            break
+
+        if command == "metrics":
+            conn.send(("ok", metrics.render({"ingest_queue_depth": bot.ingest.stats()["depth"]})))
+            continue
+        elif command == "status":
+            coro = bot.get_status()
+        elif command == "stop":
+            coro = bot.stop()
+        else:
+            conn.send(("error", f"Unknown command: {command}"))
+            continue
+
+        try:
+            result = asyncio.run_coroutine_threadsafe(coro, loop).result(COMMAND_TIMEOUT)
+            conn.send(("ok", result))
+        except Exception as e:
+            conn.send(("error", str(e)))
+
+class BotWorker:
+    """Supervisor-side handle for one worker process"""
+
+    def __init__(self, name: str, bot_config: Dict[str, Any], storage_kwargs: Dict[str, Any]):
+        self.name = name
+        self.bot_config = bot_config
+        self.storage_kwargs = storage_kwargs
+        self.process = None
+        self.conn = None
+        self.wanted = False  # False once stopped on purpose; crashed workers are restarted
+        self.restarts = 0
+        self.failures = 0  # exits in a row without running stably in between
+        self.restart_at = None
+        self.failed = None  # why the worker is no longer restarted
+        self.started_at = None
+        self._lock = threading.Lock()
+
+    def start(self, context) -> None:
+        parent_conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=run_worker,
+            args=(self.name, self.bot_config, self.storage_kwargs, child_conn),
+            name=f"telegram-monitor-{self.name}",
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.wanted = True
+        self.restart_at = None
+        self.failed = None
+        self.started_at = time.time()
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def request(self, command: str) -> Any:
+        """Send a command to the worker and wait for its answer (blocking)"""
+        with self._lock:
+            if not self.is_alive():
+                raise RuntimeError(f"Bot {self.name} is not running")
+            self.conn.send(command)
+            if not self.conn.poll(COMMAND_TIMEOUT):
+                raise TimeoutError(f"Bot {self.name} did not answer {command}")
+            status, result = self.conn.recv()
+        if status != "ok":
+            raise RuntimeError(result)
+        return result
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "alive": self.is_alive(),
+            "pid": self.process.pid if self.process else None,
+            "groups": len(self.bot_config["groups"]),
+            "restarts": self.restarts,
+            "started_at": self.started_at,
+            "restart_at": self.restart_at,
+            "failed": self.failed
+        }
+
+class Supervisor:
+    """Runs every configured bot in its own process and restarts crashed ones
+
+    Each worker writes to its own database shard (``<db_dir>/<name>.db``) so
+    workers never contend for a SQLite writer lock. Telegram sessions must
+    already be authorized, since workers cannot prompt for a login code; a
+    worker without one exits with ``EXIT_UNAUTHORIZED`` and is marked failed.
+
+    Other exits are restarted after ``restart_delay`` seconds, doubling with
+    every exit in a row up to ``max_restart_delay``. A worker that ran for
+    ``stable_after`` seconds starts counting afresh, and one that exits more
+    than ``max_restarts`` times in a row is marked failed. ``launch`` starts
+    a failed worker again.
+    """
+
+    def __init__(
+        self,
+        config: Optional[Config] = None,
+        storage_type: str = "sqlite",
+        db_dir: str = ".",
+        restart_delay: float = 5,
+        max_restart_delay: float = 300,
+        max_restarts: int = 5,
+        stable_after: float = 600
+    ):
+        self.config = config or Config()
+        self.storage_type = storage_type
+        self.db_dir = db_dir
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.max_restarts = max_restarts
+        self.stable_after = stable_after
+        self.workers = {}
+        self._context = multiprocessing.get_context("spawn")
+        self._monitor_task = None
+
+    def _build_workers(self) -> None:
+        """Refresh worker definitions from the config, spreading groups across bots"""
+        bots = self.config.config.get("bots", {})
+        assigned = assign_groups(bots, self.config.config.get("groups", []))
+        for name, bot_config in bots.items():
+            bot_config = {**bot_config, "groups": assigned[name]}
+            storage_kwargs = {
+                "storage_type": self.storage_type,
+                "db_path": os.path.join(self.db_dir, f"{name}.db"),
+                "batch_writes": True
+            }
+            worker = self.workers.get(name)
+            if worker is None:
+                self.workers[name] = BotWorker(name, bot_config, storage_kwargs)
+            elif not worker.is_alive():
+                worker.bot_config = bot_config
+                worker.storage_kwargs = storage_kwargs
+
+    def launch(self, name: str) -> Dict[str, Any]:
+        """Start the worker for one configured bot"""
+        self._build_workers()
+        worker = self.workers.get(name)
+        if worker is None:
+            raise KeyError(name)
+        if worker.is_alive():
+            return {"status": "already_running", "name": name}
+
+        worker.failures = 0
+        worker.start(self._context)
+        logger.info(f"Started worker for {name} (pid {worker.process.pid})")
+        return {"status": "starting", "name": name, "groups": len(worker.bot_config["groups"])}
+
+    def launch_all(self) -> List[Dict[str, Any]]:
+        """Start a worker for every configured bot"""
+        self._build_workers()
+        return [self.launch(name) for name in self.workers]
+
+    async def stop(self, name: str, timeout: float = COMMAND_TIMEOUT) -> Dict[str, Any]:
+        """Ask a worker to stop cleanly, terminating it if it does not exit"""
+        worker = self.workers.get(name)
+        if worker is None:
+            raise KeyError(name)
+
+        worker.wanted = False
+        if worker.is_alive():
+            try:
+                await asyncio.to_thread(worker.request, "stop")
+            except Exception as e:
+                logger.error(f"Clean stop of {name} failed: {str(e)}")
+            await asyncio.to_thread(worker.process.join, timeout)
+            if worker.is_alive():
+                worker.process.terminate()
+        return {"status": "stopped", "name": name}
+
+    async def status(self, name: str) -> Dict[str, Any]:
+        """Get the status reported by a worker"""
+        worker = self.workers.get(name)
+        if worker is None:
+            raise KeyError(name)
+        return {**worker.info(), **await asyncio.to_thread(worker.request, "status")}
+
+    async def metrics(self, name: str) -> str:
+        """Get a worker's metrics in the Prometheus text format"""
+        worker = self.workers.get(name)
+        if worker is None:
+            raise KeyError(name)
+        return await asyncio.to_thread(worker.request, "metrics")
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Get process-level information for every worker"""
+        self._build_workers()
+        return [worker.info() for worker in self.workers.values()]
+
+    def start_monitor(self, interval: float = 5) -> None:
+        """Start watching workers for crashes"""
+        if self._monitor_task is None or self._monitor_task.done():
+            self._monitor_task = asyncio.create_task(self._monitor(interval))
+
+    async def _monitor(self, interval: float) -> None:
+        """Restart workers that exited without being asked to, once their delay is over"""
+        while True:
+            try:
+                await asyncio.sleep(interval)
+                for name, worker in self.workers.items():
+                    if not worker.wanted or worker.is_alive():
+                        continue
+                    if worker.restart_at is None:
+                        self._schedule_restart(name, worker)
+                    elif time.time() >= worker.restart_at:
+                        worker.restarts += 1
+                        worker.start(self._context)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error in supervisor monitor: {str(e)}")
+
+    def _schedule_restart(self, name: str, worker: BotWorker) -> None:
+        """Pick when to restart a worker that exited, or give up on it"""
+        code = worker.process.exitcode
+        if code == EXIT_UNAUTHORIZED:
+            worker.wanted = False
+            worker.failed = "Telegram session is not authorized"
+            logger.error(f"Worker {name} has no authorized Telegram session; log in once interactively and launch it again")
+            return
+
+        if time.time() - worker.started_at >= self.stable_after:
+            worker.failures = 0
+        worker.failures += 1
+        if worker.failures > self.max_restarts:
+            worker.wanted = False
+            worker.failed = f"exited {worker.failures} times in a row, last with code {code}"
+            logger.error(f"Worker {name} {worker.failed}; not restarting it")
+            return
+
+        delay = min(self.restart_delay * 2 ** (worker.failures - 1), self.max_restart_delay)
+        worker.restart_at = time.time() + delay
+        logger.error(f"Worker {name} exited with code {code}; restarting in {delay}s")
+
+    async def shutdown(self) -> None:
+        """Stop every worker"""
+        if self._monitor_task:
+            self._monitor_task.cancel()
+        await asyncio.gather(*[
+            self.stop(name) for name, worker in self.workers.items() if worker.is_alive()
+        ])
@@ -0,0 +1,181 @@
+# Incremental trending-term counts
+import math
+import re
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Any, Iterable, List, Optional
+
+# Words (letters, digits and underscores, any script) of at least 3 characters
+_WORD = re.compile(r"\w{3,}")
+
+# Words too common to be topics, plus URL fragments
+STOPWORDS = frozenset("""
+the and for are but not you all any can had her was one our out has him his how its may new now
+own see who did get let say she too use that with have this will your from they been were said
+each which their what there when would make like just than them then these some into more only
+other could also over such very about after where being those while here well even most both
+because should through before much many does doing http https www com org net html
+""".split())
+
+class _GroupTerms:
+    """Recent term buckets and the decayed baseline of one group"""
+
+    def __init__(self):
+        self.buckets = {}  # bucket_start -> [message count, Counter of terms]
+        self.baseline = Counter()
+        self.baseline_messages = 0.0
+        self.baseline_at = None  # bucket_start the baseline is decayed to
+
+class TrendingTerms:
+    """Per-group term counts for the last ``window`` seconds against a baseline
+
+    Every stored message adds its distinct terms to its group's
+    ``bucket_seconds`` bucket. Buckets that leave the window are folded into
+    an exponentially decayed baseline (time constant ``baseline_seconds``),
+    so memory depends on the window and the term caps, not on the volume of
+    text. A bucket holding more than ``bucket_terms`` terms and a baseline
+    holding more than ``baseline_terms`` are cut back to their most frequent
+    half; dropped terms are rare by definition and only lose their counts.
+    """
+
+    def __init__(
+        self,
+        window: int = 3600,
+        bucket_seconds: int = 300,
+        baseline_seconds: int = 24 * 60 * 60,
+        bucket_terms: int = 5000,
+        baseline_terms: int = 20000,
+        stopwords: Iterable[str] = STOPWORDS
+    ):
+        self.window = window
+        self.bucket_seconds = bucket_seconds
+        self.baseline_seconds = baseline_seconds
+        self.bucket_terms = bucket_terms
+        self.baseline_terms = baseline_terms
+        self.stopwords = frozenset(stopwords)
+        self.groups = {}  # group_id -> _GroupTerms
+
+    def terms(self, text: Optional[str]) -> set:
+        """Distinct terms of a message"""
+        if not text:
+            return set()
+        return {
+            word for word in _WORD.findall(text.casefold())
+            if not word.isdigit() and word not in self.stopwords
+        }
+
+    def add(self, group_id: int, text: Optional[str], sent_at: float) -> None:
+        """Count the terms of one message"""
+        group = self.groups.get(group_id)
+        if group is None:
+            group = self.groups[group_id] = _GroupTerms()
+
+        bucket_start = int(sent_at) - int(sent_at) % self.bucket_seconds
+        self._expire(group, bucket_start)
+        terms = self.terms(text)
+
+        if group.baseline_at is not None and bucket_start <= group.baseline_at:
+            # Late message (e.g. from a backfill): straight into the baseline, aged
+            weight = self._decay(group.baseline_at - bucket_start)
+            group.baseline_messages += weight
+            for term in terms:
+                group.baseline[term] += weight
+            return
+
+        bucket = group.buckets.get(bucket_start)
+        if bucket is None:
+            bucket = group.buckets[bucket_start] = [0, Counter()]
+        bucket[0] += 1
+        bucket[1].update(terms)
+        if len(bucket[1]) > self.bucket_terms:
+            bucket[1] = Counter(dict(bucket[1].most_common(self.bucket_terms // 2)))
+
+    async def rebuild(self, storage, now: Optional[float] = None) -> int:
+        """Recount the window and baseline from stored messages; returns the number counted"""
+        now = time.time() if now is None else now
+        since = datetime.fromtimestamp(now - self.window - self.baseline_seconds, timezone.utc)
+        self.groups = {}
+        count = 0
+        async for row in storage.iter_messages(since=since):
+            self.add(row["group_id"], row["content"], row["sent_at"])
+            count += 1
+        return count
+
+    def top(
+        self,
+        limit: int = 10,
+        group_id: Optional[int] = None,
+        min_count: int = 3,
+        now: Optional[float] = None
+    ) -> Dict[int, List[Dict[str, Any]]]:
+        """Terms of the last window that stand out most against their group's baseline
+
+        ``count`` is the number of messages in the window using the term and
+        ``expected`` the number its baseline frequency predicts for the
+        window's message count. Terms are ranked by (count + 1) / (expected + 1),
+        so with no baseline yet the most used terms come first.
+        """
+        now = time.time() if now is None else now
+        current = int(now) - int(now) % self.bucket_seconds
+        if group_id is None:
+            groups = self.groups.items()
+        else:
+            groups = [(group_id, self.groups[group_id])] if group_id in self.groups else []
+
+        result = {}
+        for gid, group in groups:
+            self._expire(group, current)
+            messages = sum(bucket[0] for bucket in group.buckets.values())
+            if not messages:
+                continue
+            recent = Counter()
+            for _, terms in group.buckets.values():
+                recent.update(terms)
+
+            # One pass over the window's terms; the baseline is only looked up
+            rate = messages / group.baseline_messages if group.baseline_messages else 0.0
+            baseline = group.baseline
+            scored = [
+                (term, count, baseline.get(term, 0.0) * rate)
+                for term, count in recent.items()
+                if count >= min_count
+            ]
+            scored.sort(key=lambda entry: ((entry[1] + 1) / (entry[2] + 1), entry[1]), reverse=True)
+            result[gid] = [
+                {
+                    "term": term,
+                    "count": count,
+                    "expected": round(expected, 2),
+                    "score": round((count + 1) / (expected + 1), 2)
+                }
+                for term, count, expected in scored[:limit]
+            ]
+        return result
+
+    def _expire(self, group: _GroupTerms, bucket_start: int) -> None:
+        """Fold the buckets that left the window ending with bucket_start into the baseline"""
+        oldest = bucket_start - self.window + self.bucket_seconds
+        expired = sorted(start for start in group.buckets if start < oldest)
+        for start in expired:
+            messages, terms = group.buckets.pop(start)
+            weight = 1.0
+            if group.baseline_at is None:
+                group.baseline_at = start
+            elif start > group.baseline_at:
+                factor = self._decay(start - group.baseline_at)
+                group.baseline_messages *= factor
+                for term in group.baseline:
+                    group.baseline[term] *= factor
+                group.baseline_at = start
+            else:
+                weight = self._decay(group.baseline_at - start)
+            group.baseline_messages += messages * weight
+            for term, count in terms.items():
+                group.baseline[term] += count * weight
+
+        if len(group.baseline) > self.baseline_terms:
+            group.baseline = Counter(dict(group.baseline.most_common(self.baseline_terms // 2)))
+
+    def _decay(self, seconds: float) -> float:
+        return math.exp(-seconds / self.baseline_seconds)
@@ -0,0 +1,196 @@
+# Webhook delivery with a persistent outbox
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Dict, Any, Optional
+
+import aiohttp
+
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class WebhookDelivery:
+    """Delivers JSON payloads over a long-lived pooled HTTP session
+
+    Every payload is written to ``outbox_dir`` before the first attempt and
+    removed only after a 2xx response, so nothing is lost across failures or
+    restarts. Failed deliveries are retried with exponential backoff (capped
+    at ``max_delay``) until ``max_attempts`` is reached, after which they are
+    moved to ``outbox_dir/dead``. Bodies of at least ``compress_threshold``
+    bytes are sent gzip-compressed (set it to None to disable). The
+    directories are created when the first payload is queued.
+    """
+
+    def __init__(
+        self,
+        outbox_dir: str,
+        compress_threshold: Optional[int] = 64 * 1024,
+        max_attempts: int = 10,
+        base_delay: float = 5,
+        max_delay: float = 3600,
+        timeout: float = 30,
+        pool_size: int = 4
+    ):
+        self.outbox_dir = outbox_dir
+        self.dead_dir = os.path.join(outbox_dir, "dead")
+        self.compress_threshold = compress_threshold
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.session = None
+        self._retry_task = None
+        self._inflight = set()
+
+        # Delivery metrics
+        self.delivered = 0
+        self.failed_attempts = 0
+        self.dead = 0
+        self.compressed = 0
+        self.last_status = None
+        self.last_error = None
+        self.last_latency_ms = None
+        self._latency_total = 0.0
+
+    async def start(self) -> None:
+        """Open the HTTP session and start retrying outbox entries"""
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        if self._retry_task is None or self._retry_task.done():
+            self._retry_task = asyncio.create_task(self._retry_loop())
+
+    async def stop(self) -> None:
+        """Stop retrying and close the HTTP session; pending entries stay on disk"""
+        if self._retry_task:
+            self._retry_task.cancel()
+            self._retry_task = None
+        if self.session and not self.session.closed:
+            await self.session.close()
+
+    async def send(self, url: str, payload: Dict[str, Any]) -> bool:
+        """Queue a payload in the outbox and try to deliver it right away"""
+        entry_id = f"{time.time():.6f}-{uuid.uuid4().hex}"
+        entry = {
+            "url": url,
+            "payload": payload,
+            "attempts": 0,
+            "next_attempt_at": time.time()
+        }
+        self._write_entry(entry_id, entry)
+        return await self._attempt(entry_id, entry)
+
+    def _entry_path(self, entry_id: str) -> str:
+        return os.path.join(self.outbox_dir, f"{entry_id}.json")
+
+    def _write_entry(self, entry_id: str, entry: Dict[str, Any]) -> None:
+        os.makedirs(self.dead_dir, exist_ok=True)
+        tmp_path = self._entry_path(entry_id) + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self._entry_path(entry_id))
+
+    def _pending_entries(self):
+        if not os.path.isdir(self.outbox_dir):
+            return []
+        return sorted(
+            name[:-len(".json")]
+            for name in os.listdir(self.outbox_dir)
+            if name.endswith(".json")
+        )
+
+    async def _attempt(self, entry_id: str, entry: Dict[str, Any]) -> bool:
+        """Make one delivery attempt and update the outbox accordingly"""
+        if entry_id in self._inflight:
+            return False
+        self._inflight.add(entry_id)
+        try:
+            body = json.dumps(entry["payload"]).encode("utf-8")
+            headers = {"Content-Type": "application/json"}
+            if self.compress_threshold is not None and len(body) >= self.compress_threshold:
+                body = gzip.compress(body)
+                headers["Content-Encoding"] = "gzip"
+                self.compressed += 1
+
+            started = time.monotonic()
+            error = None
+            try:
+                async with self.session.post(entry["url"], data=body, headers=headers) as response:
+                    self.last_status = response.status
+                    if not 200 <= response.status < 300:
+                        error = f"HTTP {response.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = str(e) or type(e).__name__
+
+            latency_ms = (time.monotonic() - started) * 1000
+            self.last_latency_ms = round(latency_ms, 1)
+            metrics.observe("webhook_post", latency_ms / 1000)
+
+            if error is None:
+                self.delivered += 1
+                self._latency_total += latency_ms
+                os.remove(self._entry_path(entry_id))
+                logger.info("Summary sent to webhook successfully")
+                return True
+
+            self.failed_attempts += 1
+            self.last_error = error
+            metrics.error("webhook_post")
+            entry["attempts"] += 1
+            if entry["attempts"] >= self.max_attempts:
+                self.dead += 1
+                os.replace(self._entry_path(entry_id), os.path.join(self.dead_dir, f"{entry_id}.json"))
+                logger.error(f"Webhook delivery abandoned after {entry['attempts']} attempts: {error}")
+                return False
+
+            delay = min(self.max_delay, self.base_delay * 2 ** (entry["attempts"] - 1))
+            entry["next_attempt_at"] = time.time() + delay
+            self._write_entry(entry_id, entry)
+            logger.error(f"Webhook error: {error}; retrying in {delay:.0f}s")
+            return False
+        finally:
+            self._inflight.discard(entry_id)
+
+    async def _retry_loop(self, poll_interval: float = 1) -> None:
+        """Retry outbox entries whose backoff has expired"""
+        while True:
+            try:
+                now = time.time()
+                for entry_id in self._pending_entries():
+                    if entry_id in self._inflight:
+                        continue
+                    try:
+                        with open(self._entry_path(entry_id), "r") as f:
+                            entry = json.load(f)
+                    except FileNotFoundError:
+                        continue
+                    if entry["next_attempt_at"] <= now:
+                        await self._attempt(entry_id, entry)
+                await asyncio.sleep(poll_interval)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error in webhook retry loop: {str(e)}")
+                await asyncio.sleep(poll_interval)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get delivery counters and latency"""
+        return {
+            "delivered": self.delivered,
+            "failed_attempts": self.failed_attempts,
+            "dead": self.dead,
+            "pending": len(self._pending_entries()),
+            "compressed": self.compressed,
+            "last_status": self.last_status,
+            "last_error": self.last_error,
+            "last_latency_ms": self.last_latency_ms,
+            "avg_latency_ms": round(self._latency_total / self.delivered, 1) if self.delivered else None
+        }
@@ -0,0 +1,29 @@
+# Tests for the entity name cache
+import time
+
+from telegram_bot.entity_cache import EntityCache
+
+def test_refreshed_names_survive_reload_after_ttl():
+    ttl = 3600
+    now = time.time()
+    cache = EntityCache(ttl=ttl)
+    cache.put(1, "alice", now - 1.5 * ttl)
+    persisted = {peer_id: (name, at) for peer_id, name, at in cache.pop_dirty()}
+
+    # Same name, refreshed well after it was written: the new time is written back
+    cache.put(1, "alice", now - 0.1 * ttl)
+    persisted.update({peer_id: (name, at) for peer_id, name, at in cache.pop_dirty()})
+
+    restarted = EntityCache(ttl=ttl)
+    restarted.load([(peer_id, name, at) for peer_id, (name, at) in persisted.items()])
+    assert restarted.get(1) == "alice"
+
+def test_frequent_refreshes_are_not_rewritten():
+    cache = EntityCache(ttl=3600)
+    now = time.time()
+    cache.put(1, "alice", now - 60)
+    assert len(cache.pop_dirty()) == 1
+    cache.put(1, "alice", now)
+    assert cache.pop_dirty() == []
+    cache.put(1, "bob", now)
+    assert cache.pop_dirty() == [(1, "bob", now)]
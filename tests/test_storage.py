@@ -0,0 +1,122 @@
+# Tests for the SQLite storage
+import asyncio
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from database.storage import SQLiteStorage, get_storage
+
+def message(message_id, content="hello", group_id=1, sent_at=None):
+    return {
+        "group_id": group_id,
+        "group_name": f"Group {group_id}",
+        "sender_id": 7,
+        "sender_name": "alice",
+        "message_id": message_id,
+        "content": content,
+        "timestamp": sent_at or datetime.now(timezone.utc),
+        "has_media": False
+    }
+
+def test_bad_row_only_loses_itself(tmp_path):
+    async def run():
+        storage = SQLiteStorage(str(tmp_path / "test.db"), batch_writes=True, flush_interval=1)
+        try:
+            # bytes content cannot be hashed, so the whole batch fails at first
+            await storage.store_messages([message(1), message(2, b"bad"), message(3)])
+            with pytest.raises(Exception):
+                await storage.flush()
+            assert (await storage.get_stats())["total_messages"] == 2
+            assert sorted(row["message_id"] for row in await storage.get_messages()) == [1, 3]
+        finally:
+            await storage.close()
+    asyncio.run(run())
+
+def test_flush_raises_error_of_earlier_batch(tmp_path):
+    async def run():
+        storage = SQLiteStorage(str(tmp_path / "test.db"), batch_writes=True, flush_interval=0)
+        try:
+            await storage.store_message(**message(1, b"bad"))
+            # The writer fails the row in a batch of its own, before the flush is queued
+            await asyncio.sleep(0.2)
+            with pytest.raises(Exception):
+                await storage.flush()
+            # Reported once; later flushes succeed
+            await storage.store_message(**message(2))
+            await storage.flush()
+            assert (await storage.get_stats())["total_messages"] == 1
+        finally:
+            await storage.close()
+    asyncio.run(run())
+
+def test_messages_sent_in_the_same_second_page_by_id(tmp_path):
+    async def run():
+        sent_at = datetime.now(timezone.utc).replace(microsecond=0)
+        storage = SQLiteStorage(str(tmp_path / "test.db"))
+        try:
+            await storage.store_messages([message(i, f"text {i}", sent_at=sent_at) for i in range(1, 6)])
+            newest = [row["message_id"] for row in await storage.get_messages(group_id=1, limit=3)]
+            assert newest == [5, 4, 3]
+            assert [row["message_id"] for row in await storage.get_messages(limit=3)] == newest
+        finally:
+            await storage.close()
+    asyncio.run(run())
+
+def test_last_message_ids_survive_archiving(tmp_path):
+    path = str(tmp_path / "test.db")
+
+    async def run():
+        old = datetime.now(timezone.utc) - timedelta(days=30)
+        storage = SQLiteStorage(path)
+        try:
+            await storage.store_messages([message(i, f"old {i}", sent_at=old) for i in range(1, 6)])
+            await storage.store_message(**message(3, "recent", group_id=2))
+            assert await storage.archive_expired(retention_days=7)
+            assert await storage.get_messages(group_id=1) == []
+            assert await storage.get_last_message_ids() == {1: 5, 2: 3}
+        finally:
+            await storage.close()
+    asyncio.run(run())
+
+    # A database archived before the totals were kept recounts its segments
+    conn = sqlite3.connect(path)
+    conn.execute("DROP TABLE archived_groups")
+    conn.execute("DROP TABLE archived_senders")
+    conn.execute("PRAGMA user_version = 5")
+    conn.commit()
+    conn.close()
+
+    async def reopen():
+        storage = SQLiteStorage(path)
+        try:
+            assert await storage.get_last_message_ids() == {1: 5, 2: 3}
+        finally:
+            await storage.close()
+    asyncio.run(reopen())
+
+def test_rebuilt_rollups_count_archived_messages(tmp_path):
+    async def run():
+        old = datetime.now(timezone.utc) - timedelta(days=30)
+        storage = SQLiteStorage(str(tmp_path / "test.db"))
+        try:
+            await storage.store_messages([message(i, f"old {i}", sent_at=old) for i in range(1, 6)])
+            await storage.store_messages([message(i, f"new {i}") for i in range(6, 9)])
+            before = await storage.get_stats()
+            assert await storage.archive_expired(retention_days=7)
+            await storage.rebuild_rollups()
+            after = await storage.get_stats()
+            assert after["total_messages"] == 8
+            assert after["groups"] == before["groups"]
+            assert after["top_users"] == before["top_users"]
+        finally:
+            await storage.close()
+    asyncio.run(run())
+
+def test_get_storage_passes_retention_settings(tmp_path):
+    storage = get_storage(db_path=str(tmp_path / "test.db"), retention_days=30, maintenance_interval=60)
+    try:
+        assert storage.retention_days == 30
+        assert storage.maintenance_interval == 60
+    finally:
+        asyncio.run(storage.close())
@@ -0,0 +1,50 @@
+# Tests for the worker supervisor's restart policy
+import multiprocessing
+import sys
+import time
+
+from telegram_bot.config import Config
+from telegram_bot.supervisor import EXIT_UNAUTHORIZED, BotWorker, Supervisor
+
+def exited_worker(code, ran_for=0):
+    """A worker whose process has exited with code"""
+    worker = BotWorker("bot", {"groups": []}, {})
+    worker.process = multiprocessing.get_context("spawn").Process(target=sys.exit, args=(code,))
+    worker.process.start()
+    worker.process.join()
+    worker.wanted = True
+    worker.started_at = time.time() - ran_for
+    return worker
+
+def supervisor(tmp_path):
+    return Supervisor(Config(str(tmp_path / "config.json")), restart_delay=5, max_restart_delay=30, max_restarts=4)
+
+def test_unauthorized_worker_is_not_restarted(tmp_path):
+    worker = exited_worker(EXIT_UNAUTHORIZED)
+    supervisor(tmp_path)._schedule_restart("bot", worker)
+    assert not worker.wanted
+    assert worker.restart_at is None
+    assert "not authorized" in worker.failed
+
+def test_crashing_worker_backs_off_then_fails(tmp_path):
+    sup = supervisor(tmp_path)
+    worker = exited_worker(1)
+    delays = []
+    for _ in range(4):
+        worker.restart_at = None
+        sup._schedule_restart("bot", worker)
+        delays.append(round(worker.restart_at - time.time()))
+    assert delays == [5, 10, 20, 30]
+
+    worker.restart_at = None
+    sup._schedule_restart("bot", worker)
+    assert not worker.wanted
+    assert worker.failed
+
+def test_stable_worker_starts_counting_afresh(tmp_path):
+    sup = supervisor(tmp_path)
+    worker = exited_worker(1, ran_for=3600)
+    worker.failures = 3
+    sup._schedule_restart("bot", worker)
+    assert worker.failures == 1
+    assert round(worker.restart_at - time.time()) == 5
@@ -0,0 +1,158 @@
+# Tests for the tiered storage against the SQLite storage it fronts
+import asyncio
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from database.storage import SQLiteStorage, get_storage
+from database.tiered import MemoryHotTier, RedisHotTier, TieredStorage
+
+def message(group_id, message_id, seconds_ago, sender_id=1, has_media=False):
+    return {
+        "group_id": group_id,
+        "group_name": f"Group {group_id}",
+        "sender_id": sender_id,
+        "sender_name": f"User {sender_id}",
+        "message_id": message_id,
+        "content": f"message {group_id}/{message_id}",
+        "timestamp": datetime.now(timezone.utc) - timedelta(seconds=seconds_ago),
+        "has_media": has_media
+    }
+
+def memory_tier():
+    return MemoryHotTier()
+
+def redis_tier():
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisHotTier(fakeredis.FakeAsyncRedis(decode_responses=True))
+
+def without_sketch_counts(stats):
+    # The hot tier counts last-hour senders exactly, SQLite from sketches
+    return {key: value for key, value in stats.items() if key != "top_users_last_hour"}
+
+@pytest.mark.parametrize("make_hot", [memory_tier, redis_tier])
+def test_hot_reads_match_sqlite(tmp_path, make_hot):
+    path = str(tmp_path / "test.db")
+
+    async def run():
+        # Rows stored before the tiered storage existed seed its counters
+        seed = SQLiteStorage(path)
+        await seed.store_messages([message(1, i, 30 * 3600 + i) for i in range(1, 40)])
+        await seed.store_messages([message(2, i, 60 + i, sender_id=i % 3, has_media=i % 2) for i in range(1, 30)])
+        await seed.close()
+
+        storage = TieredStorage(SQLiteStorage(path), make_hot(), hot_hours=6, drain_interval=0.05, drain_batch=7)
+        try:
+            await storage.store_messages([message(1, 100 + i, i, sender_id=5) for i in range(20)])
+            # Duplicates: in the hot tier, only in SQLite, and within one batch
+            await storage.store_messages([message(1, 100, 0, sender_id=5), message(1, 1, 30 * 3600 + 1)])
+            await storage.store_messages([message(3, 1, 40 * 3600)] * 2)
+            await asyncio.gather(*[storage.store_message(**message(4, 7, 5)) for _ in range(5)])
+
+            stats = await storage.get_stats()
+            recent = await storage.get_messages(limit=10)
+            last_hour = await storage.get_messages(since=datetime.now(timezone.utc) - timedelta(hours=1), limit=1000)
+            group = await storage.get_messages(group_id=1, limit=1000)
+
+            await storage.flush()
+            cold = storage.cold
+            assert stats["total_messages"] == 39 + 29 + 20 + 1 + 1
+            assert without_sketch_counts(stats) == without_sketch_counts(await cold.get_stats())
+            expected = await cold.get_messages(limit=10)
+            assert [(row["group_id"], row["message_id"]) for row in recent] == \
+                [(row["group_id"], row["message_id"]) for row in expected]
+            assert len(last_hour) == 20 + 29 + 1
+            # Reaches past the hot window, so answered by SQLite
+            assert len(group) == 39 + 20
+            assert (await storage.get_last_message_ids())[3] == 1
+        finally:
+            await storage.close()
+    asyncio.run(run())
+
+@pytest.mark.parametrize("make_hot", [memory_tier, redis_tier])
+def test_rejected_rows_are_dead_lettered(tmp_path, make_hot):
+    async def run():
+        storage = TieredStorage(SQLiteStorage(str(tmp_path / "test.db")), make_hot(), drain_interval=3600)
+        try:
+            bad = message(1, 2, 5)
+            bad["content"] = "bad \ud800"
+            await storage.store_messages([message(1, 1, 10), bad, message(1, 3, 1)])
+            await storage.flush()
+
+            assert storage.rejected == 1
+            assert [row["message_id"] for row in await storage.hot.dead_letters()] == [2]
+            assert await storage.hot.pending(10) == []
+            assert await storage.get_last_message_ids() == {1: 3}
+            assert (await storage.cold.get_stats())["total_messages"] == 2
+        finally:
+            await storage.close()
+    asyncio.run(run())
+
+def test_reads_survive_a_failed_drain(tmp_path):
+    path = str(tmp_path / "test.db")
+
+    async def run():
+        storage = TieredStorage(SQLiteStorage(path), MemoryHotTier(), drain_interval=3600)
+        try:
+            await storage.store_message(**message(1, 1, 10))
+            await storage.flush()
+            await storage.store_message(**message(1, 2, 5))
+
+            # Another writer holds the database, so the drain fails as locked
+            blocker = sqlite3.connect(path, timeout=0)
+            blocker.execute("BEGIN IMMEDIATE")
+            try:
+                assert await storage.get_last_message_ids() == {1: 1}
+                assert storage.last_drain_error is not None
+                assert len(await storage.hot.pending(10)) == 1
+            finally:
+                blocker.rollback()
+                blocker.close()
+
+            assert await storage.get_last_message_ids() == {1: 2}
+            assert storage.rejected == 0
+        finally:
+            await storage.close()
+    asyncio.run(run())
+
+def test_get_storage_builds_tiered_storage(tmp_path):
+    async def run():
+        storage = get_storage("tiered", db_path=str(tmp_path / "test.db"), hot_hours=2)
+        assert isinstance(storage.hot, MemoryHotTier)
+        try:
+            await storage.store_message(**message(1, 1, 10))
+            generation = storage.write_generation()
+            await storage.store_message(**message(1, 2, 5))
+            assert storage.write_generation() != generation
+            assert (await storage.get_stats())["total_messages"] == 2
+        finally:
+            await storage.close()
+    asyncio.run(run())
+
+def test_redis_queue_survives_restart(tmp_path):
+    fakeredis = pytest.importorskip("fakeredis")
+    path = str(tmp_path / "test.db")
+    server = fakeredis.FakeServer()
+
+    async def run():
+        storage = TieredStorage(
+            SQLiteStorage(path),
+            RedisHotTier(fakeredis.FakeAsyncRedis(server=server, decode_responses=True)),
+            drain_interval=3600
+        )
+        await storage.store_messages([message(1, i, i) for i in range(10)])
+        # Crash before anything was drained
+        storage._drain_task.cancel()
+        await storage.cold.close()
+
+        restarted = TieredStorage(
+            SQLiteStorage(path),
+            RedisHotTier(fakeredis.FakeAsyncRedis(server=server, decode_responses=True))
+        )
+        try:
+            assert (await restarted.get_stats())["total_messages"] == 10
+            assert (await restarted.cold.get_stats())["total_messages"] == 10
+        finally:
+            await restarted.close()
+    asyncio.run(run())
@@ -0,0 +1,89 @@
+# Tests for webhook delivery against a local HTTP server
+import asyncio
+import json
+import os
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from telegram_bot.webhook import WebhookDelivery
+
+async def serve(status):
+    """Start a server answering POST /hook with status; returns it and the requests seen"""
+    received = []
+
+    async def hook(request):
+        received.append((request.headers.get("Content-Encoding"), await request.read()))
+        return web.Response(status=status)
+
+    app = web.Application()
+    app.router.add_post("/hook", hook)
+    server = TestServer(app)
+    await server.start_server()
+    return server, received
+
+def test_delivers_and_clears_outbox(tmp_path):
+    async def run():
+        server, received = await serve(200)
+        delivery = WebhookDelivery(str(tmp_path / "outbox"))
+        await delivery.start()
+        try:
+            assert await delivery.send(str(server.make_url("/hook")), {"total": 3})
+        finally:
+            await delivery.stop()
+            await server.close()
+
+        assert [json.loads(body) for _, body in received] == [{"total": 3}]
+        assert received[0][0] is None
+        assert delivery.stats()["delivered"] == 1
+        assert delivery.stats()["pending"] == 0
+    asyncio.run(run())
+
+def test_server_errors_are_retried_then_dead_lettered(tmp_path):
+    async def run():
+        server, received = await serve(503)
+        delivery = WebhookDelivery(str(tmp_path / "outbox"), max_attempts=3, base_delay=0)
+        await delivery.start()
+        try:
+            assert not await delivery.send(str(server.make_url("/hook")), {"total": 3})
+            for _ in range(50):
+                if delivery.stats()["dead"]:
+                    break
+                await asyncio.sleep(0.1)
+        finally:
+            await delivery.stop()
+            await server.close()
+
+        assert len(received) == 3
+        stats = delivery.stats()
+        assert stats["dead"] == 1
+        assert stats["failed_attempts"] == 3
+        assert stats["pending"] == 0
+        assert stats["last_error"] == "HTTP 503"
+        assert len(os.listdir(tmp_path / "outbox" / "dead")) == 1
+    asyncio.run(run())
+
+def test_large_bodies_are_gzipped(tmp_path):
+    async def run():
+        server, received = await serve(200)
+        delivery = WebhookDelivery(str(tmp_path / "outbox"), compress_threshold=1024)
+        await delivery.start()
+        payload = {"messages": ["x" * 100] * 50}
+        try:
+            assert await delivery.send(str(server.make_url("/hook")), {"small": True})
+            assert await delivery.send(str(server.make_url("/hook")), payload)
+        finally:
+            await delivery.stop()
+            await server.close()
+
+        encodings = [encoding for encoding, _ in received]
+        assert encodings == [None, "gzip"]
+        # aiohttp decodes the body according to Content-Encoding
+        assert json.loads(received[1][1]) == payload
+        assert delivery.stats()["compressed"] == 1
+    asyncio.run(run())
+
+def test_outbox_is_created_on_first_send(tmp_path):
+    delivery = WebhookDelivery(str(tmp_path / "outbox"))
+    assert not os.path.exists(tmp_path / "outbox")
+    assert delivery.stats()["pending"] == 0
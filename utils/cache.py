@@ -0,0 +1,80 @@
+# Short-lived cache for computed responses
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+class TTLCache:
+    """Caches the results of async computations for a short time
+
+    With a ``generation`` source (typically the storage's write generation),
+    an entry is served for up to ``max_age`` seconds as long as
+    ``generation()`` still has the value it had when the computation started,
+    i.e. nothing was written since; any write makes it a miss. Without one,
+    an entry is served for ``ttl`` seconds. Concurrent requests for a key
+    that is being computed wait for that computation instead of starting
+    their own. Cached values are shared and must not be modified.
+    """
+
+    def __init__(self, ttl: float, generation: Optional[Callable[[], int]] = None, max_age: float = 60):
+        self.ttl = ttl
+        self.max_age = max(ttl, max_age)
+        self.generation = generation
+        self._entries = {}  # key -> (value, generation, computed_at)
+        self._inflight = {}  # key -> future of the running computation
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def get(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for key, computing it at most once at a time"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, generation, computed_at = entry
+            age = time.monotonic() - computed_at
+            if self.generation is None:
+                fresh = age < self.ttl
+            else:
+                fresh = generation == self.generation() and age < self.max_age
+            if fresh:
+                self.hits += 1
+                return value
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            # Shielded so one caller giving up does not cancel the others
+            return await asyncio.shield(future)
+
+        self.misses += 1
+        future = asyncio.ensure_future(self._compute(key, compute))
+        self._inflight[key] = future
+        return await asyncio.shield(future)
+
+    async def _compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        generation = None if self.generation is None else self.generation()
+        started = time.monotonic()
+        try:
+            value = await compute()
+            if self.max_age > 0:
+                self._entries[key] = (value, generation, started)
+            return value
+        finally:
+            del self._inflight[key]
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """Drop one entry, or every entry"""
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get hit, miss and coalesced request counts"""
+        return {
+            "ttl": self.ttl,
+            "max_age": self.max_age,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced
+        }
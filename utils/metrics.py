@@ -0,0 +1,225 @@
+# Stage latency metrics and a sampling profiler for slow handlers
+import contextlib
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import Dict, Any, Iterator, Optional, Tuple
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+class _Histogram:
+    """Cumulative latency histogram for one stage"""
+
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+
+class Metrics:
+    """Per-stage latency histograms and error counters, plus plain counters
+
+    Safe to update from any thread. ``render`` produces the Prometheus text
+    exposition format.
+    """
+
+    def __init__(self, prefix: str = "telegram_monitor"):
+        self.prefix = prefix
+        self.stages = {}
+        self.errors = Counter()
+        self.counters = Counter()
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """Record one timing for a stage"""
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = _Histogram()
+            histogram.observe(seconds)
+
+    def error(self, stage: str) -> None:
+        """Count a failure in a stage"""
+        with self._lock:
+            self.errors[stage] += 1
+
+    def inc(self, name: str, amount: int = 1) -> None:
+        """Increase a named counter"""
+        with self._lock:
+            self.counters[name] += amount
+
+    @contextlib.contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        """Time the enclosed block (which may await) and count it as an error if it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.error(stage)
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def snapshot(self) -> Dict[str, Tuple[int, float]]:
+        """(count, total seconds) of every stage recorded so far"""
+        with self._lock:
+            return {stage: (histogram.count, histogram.sum) for stage, histogram in self.stages.items()}
+
+    def render(self, gauges: Optional[Dict[str, float]] = None) -> str:
+        """Render every metric in the Prometheus text format"""
+        name = f"{self.prefix}_stage_duration_seconds"
+        lines = [
+            f"# HELP {name} Time spent in each processing stage.",
+            f"# TYPE {name} histogram"
+        ]
+        with self._lock:
+            for stage in sorted(self.stages):
+                histogram = self.stages[stage]
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+
+            name = f"{self.prefix}_stage_errors_total"
+            lines.append(f"# HELP {name} Failures in each processing stage.")
+            lines.append(f"# TYPE {name} counter")
+            for stage in sorted(self.errors):
+                lines.append(f'{name}{{stage="{stage}"}} {self.errors[stage]}')
+
+            for counter in sorted(self.counters):
+                name = f"{self.prefix}_{counter}_total"
+                lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name} {self.counters[counter]}")
+
+        for gauge, value in sorted((gauges or {}).items()):
+            name = f"{self.prefix}_{gauge}"
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+class SlowTraceProfiler:
+    """Samples the event loop thread and keeps stacks of the slowest handlers
+
+    While enabled, a background thread takes the loop thread's stack every
+    ``interval`` seconds and credits it to each tracked handler whose frame
+    is on it. When a handler finishes, it is kept if it is among the ``keep``
+    slowest seen, with its most frequent stacks. Samples only show time the
+    handler spent running; time spent awaiting I/O shows up in its duration
+    but not in its stacks.
+    """
+
+    def __init__(self, interval: float = 0.005, keep: int = 10):
+        self.interval = interval
+        self.keep = keep
+        self.enabled = False
+        self.slowest = []
+        self._active = {}  # id(frame) -> sampled stacks of a running handler
+        self._loop_thread = None
+        self._sampler = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self, interval: Optional[float] = None) -> None:
+        """Start sampling the calling thread, which must run the event loop"""
+        if interval is not None:
+            self.interval = interval
+        if self.enabled:
+            return
+        self._loop_thread = threading.get_ident()
+        self._stop.clear()
+        self.enabled = True
+        self._sampler = threading.Thread(target=self._sample_loop, name="slow-trace-sampler", daemon=True)
+        self._sampler.start()
+
+    def stop(self) -> None:
+        """Stop sampling; traces collected so far are kept"""
+        if not self.enabled:
+            return
+        self.enabled = False
+        self._stop.set()
+        self._sampler.join()
+        with self._lock:
+            self._active = {}
+
+    @contextlib.contextmanager
+    def track(self, name: str) -> Iterator[None]:
+        """Attribute samples taken inside the enclosed block to one handler invocation"""
+        if not self.enabled:
+            yield
+            return
+
+        frame = sys._getframe(2)  # the coroutine using this context manager
+        stacks = Counter()
+        with self._lock:
+            self._active[id(frame)] = stacks
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - started
+            with self._lock:
+                self._active.pop(id(frame), None)
+                self._record(name, duration, stacks)
+
+    def _record(self, name: str, duration: float, stacks: Counter) -> None:
+        if len(self.slowest) >= self.keep and duration <= self.slowest[-1]["duration_ms"] / 1000:
+            return
+        self.slowest.append({
+            "handler": name,
+            "duration_ms": round(duration * 1000, 3),
+            "samples": sum(stacks.values()),
+            "stacks": [{"count": count, "stack": stack} for stack, count in stacks.most_common(5)]
+        })
+        self.slowest.sort(key=lambda trace: trace["duration_ms"], reverse=True)
+        del self.slowest[self.keep:]
+
+    def _sample_loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            with self._lock:
+                if not self._active:
+                    continue
+                owners = []
+                current = frame
+                while current is not None:
+                    if id(current) in self._active:
+                        owners.append(self._active[id(current)])
+                    current = current.f_back
+                if not owners:
+                    continue
+            stack = ";".join(
+                f"{entry.name} ({entry.filename.rsplit('/', 1)[-1]}:{entry.lineno})"
+                for entry in traceback.extract_stack(frame)
+            )
+            with self._lock:
+                for stacks in owners:
+                    stacks[stack] += 1
+
+    def traces(self) -> Dict[str, Any]:
+        """Get the slowest handler invocations recorded so far"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "interval_ms": self.interval * 1000,
+                "slowest": list(self.slowest)
+            }
+
+# Process-wide instances
+metrics = Metrics()
+profiler = SlowTraceProfiler()
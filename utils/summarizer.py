@@ -1,63 +1,54 @@
 import asyncio
-from datetime import datetime, timedelta
-from typing import Dict, Any, List
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Dict, Any, List, Optional
 import logging
 
 from database.storage import Storage
 
+if TYPE_CHECKING:
+    from telegram_bot.trends import TrendingTerms
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def generate_summary(storage: Storage) -> Dict[str, Any]:
-    """Generate a summary of recent activity"""
+async def generate_summary(storage: Storage, trends: Optional["TrendingTerms"] = None) -> Dict[str, Any]:
+    """Generate a summary of recent activity
+    
+    With ``trends`` (the bot's in-memory term counts), each group also lists
+    its trending terms; no stored message text is read for them.
+    """
     # Get data from the last hour
-    since = datetime.now() - timedelta(hours=1)
+    until = datetime.now(timezone.utc)
+    since = until - timedelta(hours=1)
     
     # Get overall stats
     stats = await storage.get_stats()
     
-    # Get recent messages
-    recent_messages = await storage.get_messages(since=since, limit=1000)
+    # Per-group counts are computed by the storage backend, sorted by message count
+    groups_summary = await storage.aggregate_window(since, until, group_by="group")
     
-    # Group messages by group
-    groups_data = {}
-    for message in recent_messages:
-        group_id = message["group_id"]
-        if group_id not in groups_data:
-            groups_data[group_id] = {
-                "group_name": message["group_name"],
-                "message_count": 0,
-                "users": set(),
-                "has_media_count": 0
-            }
-        
-        groups_data[group_id]["message_count"] += 1
-        if message["sender_id"]:
-            groups_data[group_id]["users"].add(message["sender_id"])
-        if message["has_media"]:
-            groups_data[group_id]["has_media_count"] += 1
+    # Approximate top senders per group, from the storage's streaming sketches
+    top_senders = await storage.top_senders(since, until, limit=5)
+    for group in groups_summary:
+        group["top_senders"] = top_senders.get(group["group_id"], [])
     
-    # Convert to list and format
-    groups_summary = []
-    for group_id, data in groups_data.items():
-        groups_summary.append({
-            "group_id": group_id,
-            "group_name": data["group_name"],
-            "message_count": data["message_count"],
-            "unique_users": len(data["users"]),
-            "media_count": data["has_media_count"]
-        })
+    # Terms used unusually often in the last hour, per group
+    if trends is not None:
+        trending = trends.top(limit=10, now=until.timestamp())
+        for group in groups_summary:
+            group["trending_terms"] = trending.get(group["group_id"], [])
     
-    # Sort by message count
-    groups_summary.sort(key=lambda x: x["message_count"], reverse=True)
+    # Texts reposted across groups
+    cross_posts = await storage.cross_posts(since, until)
     
     # Create summary
     summary = {
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": until.isoformat(),
         "period_hours": 1,
-        "total_messages": len(recent_messages),
+        "total_messages": sum(group["message_count"] for group in groups_summary),
         "groups": groups_summary,
+        "cross_posts": cross_posts,
         "overall_stats": {
             "total_messages_all_time": stats["total_messages"],
             "recent_activity_24h": stats["recent_activity"],